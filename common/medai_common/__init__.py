@@ -0,0 +1,7 @@
+# medai_common/__init__.py
+"""
+Code shared by the intake server (server/) and the review viewer (viewer/).
+
+Install it into either environment with `pip install -e ../common` (already
+listed in both requirements.txt files).
+"""
@@ -0,0 +1,272 @@
+# medai_common/orthanc_client.py
+"""
+Pooled client for the Orthanc REST API, shared by the viewer and the intake server.
+
+One requests.Session per client keeps a bounded pool of keep-alive connections,
+every request gets a timeout, and connection failures and busy answers (429/5xx)
+are retried with exponential backoff by the transport adapter. Idempotent methods
+are retried everywhere, POST only on the read-only tool paths. JSON responses
+can be kept in a bounded LRU cache: resources that never change once stored
+(instance tags, stable series) indefinitely, mutable ones such as labels and
+attachments for a short TTL, and writes invalidate the entries under the
+resource they touch. Only requests and the standard library are used so the
+server can install it without the viewer's dependencies.
+"""
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Orthanc answers with these while it is busy or restarting
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Idempotent methods: label and attachment writes are single PUTs or DELETEs, so a retry repeats them harmlessly
+RETRY_METHODS = frozenset({'GET', 'HEAD', 'PUT', 'DELETE'})
+
+# POSTs that only read (lookups and archive downloads); POST is retried on these paths alone
+READ_ONLY_POSTS = ('/tools/find', '/tools/create-archive', '/tools/create-media')
+
+_MISSING = object()
+
+MAP_THREAD_PREFIX = 'orthanc-map'
+
+
+class OrthancClient:
+    """Orthanc REST client with a tuned connection pool, timeouts, retries and an immutable-resource cache"""
+
+    def __init__(self, base_url, auth=None, timeout=60, retries=3, backoff=0.5, pool_size=16, cache_size=4096):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        adapter = self._adapter(RETRY_METHODS, retries, backoff)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # requests picks the adapter with the longest matching prefix, so only these POSTs are retried
+        read_adapter = self._adapter(RETRY_METHODS | {'POST'}, retries, backoff)
+        for path in READ_ONLY_POSTS:
+            self.session.mount(self.url(path), read_adapter)
+
+        # path -> (data, expiry on the monotonic clock or None for immutable resources)
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_expired = 0
+        self.cache_invalidated = 0
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._generation = 0  # Bumped by invalidate() so in-flight reads cannot re-cache stale data
+
+        # Worker threads for map(), started on first use and kept for the client's lifetime
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _adapter(self, methods, retries, backoff):
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=methods,
+            raise_on_status=False  # The last answer is returned and raise_for_status reports it
+        )
+        return HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, self.url(path), **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def get_json(self, path, params=None, immutable=False, ttl=None, default=_MISSING):
+        """
+        GET a JSON resource. immutable=True caches it until evicted, ttl caches
+        it for that many seconds. With default, a 404 returns (and caches) the
+        default instead of raising.
+        """
+        cached = immutable or bool(ttl)
+        key = (path, tuple(sorted(params.items())) if params else ())
+        if cached:
+            data = self._cache_get(key)
+            if data is not _MISSING:
+                return data
+            generation = self._generation
+
+        response = self.get(path, params=params)
+        if response.status_code == 404 and default is not _MISSING:
+            data = default
+        else:
+            response.raise_for_status()
+            data = response.json()
+
+        if cached:
+            self._cache_put(key, data, None if immutable else time.monotonic() + ttl, generation)
+        return data
+
+    def post_json(self, path, body):
+        response = self.post(path, json=body)
+        response.raise_for_status()
+        return response.json()
+
+    def get_series(self, series_id):
+        """Series resource, cached once Orthanc reports the series stable"""
+        key = (f"/series/{series_id}", ())
+        series = self._cache_get(key)
+        if series is not _MISSING:
+            return series
+        generation = self._generation
+        series = self.get_json(f"/series/{series_id}")
+        if series.get('IsStable'):
+            self._cache_put(key, series, None, generation)
+        return series
+
+    def find(self, level='Study', query=None, labels=(), labels_constraint='All', expand=True, page_size=1000):
+        """
+        Bulk lookup through /tools/find, paged with Since/Limit so a large
+        result never arrives as one huge response
+        """
+        results = []
+        since = 0
+        while True:
+            page = self.post_json('/tools/find', {
+                'Level': level,
+                'Query': query or {},
+                'Labels': list(labels),
+                'LabelsConstraint': labels_constraint,
+                'Expand': expand,
+                'Since': since,
+                'Limit': page_size
+            })
+            results.extend(page)
+            if len(page) < page_size:
+                return results
+            since += page_size
+
+    def map(self, fn, items):
+        """
+        Run fn over items concurrently on the client's worker threads, at most
+        pool_size at a time; results keep input order
+        """
+        items = list(items)
+        # A call made from a worker runs inline so nested maps cannot starve the pool
+        if len(items) <= 1 or threading.current_thread().name.startswith(MAP_THREAD_PREFIX):
+            return [fn(item) for item in items]
+        return list(self._get_executor().map(fn, items))
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix=MAP_THREAD_PREFIX)
+            return self._executor
+
+    def close(self):
+        """Stop the map() workers and close pooled connections"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        self.session.close()
+
+    def get_many(self, paths, immutable=False):
+        """GET several JSON resources concurrently; failed lookups come back as None"""
+        def fetch(path):
+            try:
+                return self.get_json(path, immutable=immutable)
+            except requests.RequestException as e:
+                print(f"Error fetching {path} from Orthanc: {str(e)}")
+                return None
+        return self.map(fetch, paths)
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                data, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+                    return data
+                del self._cache[key]
+                self.cache_expired += 1
+            self.cache_misses += 1
+            return _MISSING
+
+    def _cache_put(self, key, data, expires, generation):
+        with self._cache_lock:
+            if generation != self._generation:
+                return  # Invalidated while the request was in flight
+            self._cache[key] = (data, expires)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, prefix):
+        """Drop cached responses whose path starts with prefix, e.g. after a label write"""
+        with self._cache_lock:
+            self._generation += 1
+            for key in [key for key in self._cache if key[0].startswith(prefix)]:
+                del self._cache[key]
+                self.cache_invalidated += 1
+
+    def cache_stats(self):
+        with self._cache_lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                'entries': len(self._cache),
+                'size_limit': self.cache_size,
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'expired': self.cache_expired,
+                'invalidated': self.cache_invalidated,
+                'hit_rate': round(self.cache_hits / lookups, 3) if lookups else None
+            }
+
+
+class AsyncOrthancClient:
+    """
+    asyncio front end for callers that already run an event loop.
+
+    Calls run on a dedicated thread pool sized to the concurrency limit, so
+    they share the client's connection pool, retries and cache; a semaphore
+    keeps at most `concurrency` requests in flight.
+    """
+
+    def __init__(self, client, concurrency=8):
+        self.client = client
+        self.concurrency = min(concurrency, client.pool_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='orthanc-async')
+        self._semaphore = None
+
+    async def call(self, fn, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def get_json(self, path, params=None, immutable=False, ttl=None):
+        return await self.call(lambda: self.client.get_json(path, params=params, immutable=immutable, ttl=ttl))
+
+    async def map(self, fn, items):
+        return await asyncio.gather(*(self.call(fn, item) for item in items))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
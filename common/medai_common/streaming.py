@@ -0,0 +1,88 @@
+# medai_common/streaming.py
+"""
+Streaming download helpers shared by the viewer and the intake server.
+
+Objects are copied to disk in bounded chunks so peak memory stays flat however
+large the DICOM instance, RTDOSE grid or PDF is. Only the standard library is
+used here so the server can install it without the viewer's dependencies.
+"""
+import os
+import uuid
+import hashlib
+import tempfile
+from pathlib import Path
+
+# Size of the buffer held in memory while copying a response to disk
+CHUNK_SIZE = 64 * 1024
+
+
+class IncompleteDownloadError(IOError):
+    """Raised when fewer (or more) bytes arrive than the server announced"""
+
+
+def _copy_chunks(chunks, f, expected_length=None, checksum=None):
+    """Copy byte chunks into an open file, returning (size, hex digest or None)"""
+    digest = hashlib.new(checksum) if checksum else None
+    size = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        f.write(chunk)
+        size += len(chunk)
+        if digest:
+            digest.update(chunk)
+
+    if expected_length is not None and size != int(expected_length):
+        raise IncompleteDownloadError(f"Expected {expected_length} bytes, received {size}")
+    return size, (digest.hexdigest() if digest else None)
+
+
+def stream_to_file(chunks, file_path, expected_length=None, checksum=None):
+    """
+    Write an iterable of byte chunks to file_path atomically.
+
+    Data goes to a temporary sibling that is fsynced and renamed into place only
+    after the length check passes, so file_path is either absent or complete.
+    Returns (size, hex digest) where the digest uses the hashlib algorithm named
+    by checksum, or None when no checksum is requested.
+    """
+    file_path = Path(file_path)
+    temp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            result = _copy_chunks(chunks, f, expected_length, checksum)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+        return result
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def stream_to_tempfile(chunks, expected_length=None):
+    """Spool byte chunks into an anonymous temporary file, returned rewound for reading"""
+    f = tempfile.TemporaryFile()
+    try:
+        _copy_chunks(chunks, f, expected_length)
+        f.seek(0)
+        return f
+    except Exception:
+        f.close()
+        raise
+
+
+def download_to_file(session, url, file_path, checksum=None, chunk_size=CHUNK_SIZE, method='GET', **kwargs):
+    """
+    Request url with a requests session and stream the body to file_path.
+
+    The announced Content-Length is verified unless the body was transfer-encoded
+    (e.g. gzip), where the header no longer matches the decoded size.
+    """
+    with session.request(method, url, stream=True, **kwargs) as response:
+        response.raise_for_status()
+        expected_length = None
+        if 'Content-Length' in response.headers and not response.headers.get('Content-Encoding'):
+            expected_length = int(response.headers['Content-Length'])
+        return stream_to_file(response.iter_content(chunk_size=chunk_size), file_path,
+                              expected_length=expected_length, checksum=checksum)
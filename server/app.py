@@ -22,6 +22,9 @@ from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from flask import jsonify, send_file
 import io
+import hashlib
+from medai_common.streaming import stream_to_tempfile, CHUNK_SIZE
+from db_pool import ConnectionPool, DatabaseUnavailable
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -43,6 +46,18 @@ DB_HOST = "database-2.crs0e08mqp78.us-east-1.rds.amazonaws.com"
 DB_USER = "admin"
 DB_PASSWORD = "password"
 DB_NAME = "meddb"
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 10))
+
+# Connection pool: at most DB_POOL_SIZE open connections, closed after
+# DB_POOL_MAX_IDLE seconds unused and pinged before reuse after DB_POOL_PING_AFTER
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_POOL_MAX_IDLE = int(os.environ.get("DB_POOL_MAX_IDLE", 300))
+DB_POOL_PING_AFTER = int(os.environ.get("DB_POOL_PING_AFTER", 30))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+# Page size of the batch /patient-progress endpoint
+PROGRESS_PAGE_SIZE = int(os.environ.get("PROGRESS_PAGE_SIZE", 500))
+PROGRESS_PAGE_MAX = int(os.environ.get("PROGRESS_PAGE_MAX", 2000))
 
 # S3 Configuration
 S3_BUCKET = os.environ.get("S3_BUCKET", "medaibucket")
@@ -101,13 +116,16 @@ def list_s3_files(prefix="PathologyReports/"):
         return []
 
 
-# Function to get a file from S3
+# Function to get a file from S3, spooled to disk rather than held in memory
 def get_s3_file(file_key):
     try:
         s3_client = get_s3_client()
         response = s3_client.get_object(Bucket=S3_BUCKET, Key=file_key)
-        return response["Body"].read()
-    except ClientError as e:
+        return stream_to_tempfile(
+            response["Body"].iter_chunks(chunk_size=CHUNK_SIZE),
+            expected_length=response.get("ContentLength"),
+        )
+    except (ClientError, IOError) as e:
         print(f"Error getting S3 file: {e}")
         return None
 
@@ -129,12 +147,9 @@ def get_pathology_report(file_path):
     if not file_path.startswith("PathologyReports/"):
         file_path = f"PathologyReports/{file_path}"
 
-    file_content = get_s3_file(file_path)
-
-    if file_content:
-        # Create an in-memory file-like object
-        file_obj = io.BytesIO(file_content)
+    file_obj = get_s3_file(file_path)
 
+    if file_obj:
         # Get the filename from the path
         filename = file_path.split("/")[-1]
 
@@ -161,17 +176,14 @@ def view_pdf(file_path):
 
     try:
         print(f"Attempting to retrieve file: {file_path}")
-        file_content = get_s3_file(file_path)
-
-        if file_content:
-            # Create an in-memory file-like object
-            file_obj = io.BytesIO(file_content)
+        file_obj = get_s3_file(file_path)
 
+        if file_obj:
             # Get the filename from the path
             filename = file_path.split("/")[-1]
 
             print(
-                f"Successfully retrieved file: {filename}, size: {len(file_content)} bytes"
+                f"Successfully retrieved file: {filename}, size: {os.fstat(file_obj.fileno()).st_size} bytes"
             )
 
             # Create a response with the PDF file
@@ -227,45 +239,42 @@ def upload_pathology_report():
 
     try:
         # Verify patient exists in database
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        with connection.cursor() as cursor:
-            # Check if patient exists
-            cursor.execute(
-                "SELECT patient_id, first_name, last_name FROM patient WHERE patient_id = %s",
-                (patient_id,),
-            )
-            patient_data = cursor.fetchone()
-
-            if not patient_data:
-                # Patient doesn't exist, create one if we have first and last name
-                if first_name and last_name:
-                    # This is a simplified version - in production, you'd want more validation
-                    try:
-                        cursor.execute(
-                            "INSERT INTO patient (patient_id, first_name, last_name, birth_date, sex) VALUES (%s, %s, %s, %s, %s)",
-                            (
-                                patient_id,
-                                first_name,
-                                last_name,
-                                "2000-01-01",
-                                "Other",
-                            ),  # Default values
-                        )
-                        connection.commit()
-                    except Exception as e:
-                        return (
-                            jsonify(
-                                {"error": f"Failed to create patient record: {str(e)}"}
-                            ),
-                            500,
-                        )
-                else:
-                    return jsonify({"error": "Patient not found in database"}), 404
-
-        # Upload file to S3
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                # Check if patient exists
+                cursor.execute(
+                    "SELECT patient_id, first_name, last_name FROM patient WHERE patient_id = %s",
+                    (patient_id,),
+                )
+                patient_data = cursor.fetchone()
+
+                if not patient_data:
+                    # Patient doesn't exist, create one if we have first and last name
+                    if first_name and last_name:
+                        # This is a simplified version - in production, you'd want more validation
+                        try:
+                            cursor.execute(
+                                "INSERT INTO patient (patient_id, first_name, last_name, birth_date, sex) VALUES (%s, %s, %s, %s, %s)",
+                                (
+                                    patient_id,
+                                    first_name,
+                                    last_name,
+                                    "2000-01-01",
+                                    "Other",
+                                ),  # Default values
+                            )
+                            connection.commit()
+                        except Exception as e:
+                            return (
+                                jsonify(
+                                    {"error": f"Failed to create patient record: {str(e)}"}
+                                ),
+                                500,
+                            )
+                    else:
+                        return jsonify({"error": "Patient not found in database"}), 404
+
+        # Upload file to S3 (no database connection is held meanwhile)
         s3_client = get_s3_client()
         file_name = f"PathologyReports/{patient_id}_{int(datetime.now().timestamp())}_{file.filename}"
 
@@ -278,19 +287,20 @@ def upload_pathology_report():
 
         # Insert record into pathology_reports table with an empty string for cleaned_report_text
         # (since it cannot be NULL in the schema)
-        with connection.cursor() as cursor:
-            cursor.execute(
-                """
-                INSERT INTO pathology_reports 
-                (patient_id, cleaned_report_text, pdf_s3_url) 
-                VALUES (%s, %s, %s)
-                """,
-                (patient_id, "", s3_url),  # Using empty string instead of NULL
-            )
-            connection.commit()
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO pathology_reports
+                    (patient_id, cleaned_report_text, pdf_s3_url)
+                    VALUES (%s, %s, %s)
+                    """,
+                    (patient_id, "", s3_url),  # Using empty string instead of NULL
+                )
+                connection.commit()
 
-            # Get the inserted report ID
-            report_id = cursor.lastrowid
+                # Get the inserted report ID
+                report_id = cursor.lastrowid
 
         return (
             jsonify(
@@ -303,58 +313,72 @@ def upload_pathology_report():
             201,
         )
 
+    except DatabaseUnavailable:
+        raise  # Answered by the database_unavailable handler
     except Exception as e:
         print(f"Error uploading report: {str(e)}")
         return jsonify({"error": f"Failed to process report: {str(e)}"}), 500
-    finally:
-        if connection:
-            connection.close()
 
 
 def get_db_connection():
-    try:
-        return pymysql.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-            cursorclass=pymysql.cursors.DictCursor,
-        )
-    except pymysql.MySQLError as e:
-        print(f"Database connection error: {e}")
-        return None  # Handle this properly when calling the function
+    """Open a new RDS connection; routes check one out of db_pool instead"""
+    return pymysql.connect(
+        host=DB_HOST,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        cursorclass=pymysql.cursors.DictCursor,
+        connect_timeout=DB_CONNECT_TIMEOUT,
+    )
+
+
+# Bounded pool of RDS connections shared by every route (see db_pool.py)
+db_pool = ConnectionPool(
+    get_db_connection,
+    max_size=DB_POOL_SIZE,
+    max_idle=DB_POOL_MAX_IDLE,
+    ping_after=DB_POOL_PING_AFTER,
+    timeout=DB_POOL_TIMEOUT,
+)
+
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    print(f"Database connection error: {e}")
+    return jsonify({"error": "Database connection failed"}), 500
 
 
 def create_tables():
-    connection = get_db_connection()
-    if connection:
-        with connection.cursor() as cursor:
-            cursor.execute(
+    try:
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        username VARCHAR(50) UNIQUE NOT NULL,
+                        password VARCHAR(255) NOT NULL,
+                        email VARCHAR(255) UNIQUE NOT NULL
+                    );
                 """
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    password VARCHAR(255) NOT NULL,
-                    email VARCHAR(255) UNIQUE NOT NULL
-                );
-            """
-            )
-            cursor.execute(
+                )
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS patient (
+                        patient_id INT AUTO_INCREMENT PRIMARY KEY,
+                        first_name VARCHAR(255) NOT NULL,
+                        last_name VARCHAR(255) NOT NULL,
+                        birth_date DATE NOT NULL,
+                        sex ENUM('Male', 'Female', 'Other') NOT NULL,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        last_updated DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    );
                 """
-                CREATE TABLE IF NOT EXISTS patient (
-                    patient_id INT AUTO_INCREMENT PRIMARY KEY,
-                    first_name VARCHAR(255) NOT NULL,
-                    last_name VARCHAR(255) NOT NULL,
-                    birth_date DATE NOT NULL,
-                    sex ENUM('Male', 'Female', 'Other') NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                );
-            """
-            )
-        connection.commit()
-        connection.close()
+                )
+            connection.commit()
+    except DatabaseUnavailable as e:
+        print(f"Database connection error: {e}")
 
 
 create_tables()
@@ -363,7 +387,6 @@ create_tables()
 @app.route("/signup", methods=["POST"])
 def signup():
     data = request.json
-    connection = None
     print("Received data:", data)
 
     data["first_name"] = data.get("firstName", data.get("first_name"))
@@ -376,32 +399,29 @@ def signup():
             return jsonify({"error": f"Missing field: {field}"}), 400
 
     try:
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT * FROM users WHERE username = %s", (data["username"],)
-            )
-            existing_user = cursor.fetchone()
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT * FROM users WHERE username = %s", (data["username"],)
+                )
+                existing_user = cursor.fetchone()
 
-            if existing_user:
-                return jsonify({"error": "Username already exists"}), 400
+                if existing_user:
+                    return jsonify({"error": "Username already exists"}), 400
 
-            hashed_password = generate_password_hash(data["password"])
+                hashed_password = generate_password_hash(data["password"])
 
-            cursor.execute(
-                "INSERT INTO users (first_name, last_name, username, password, organization) VALUES (%s, %s, %s, %s, %s)",
-                (
-                    data["first_name"],
-                    data["last_name"],
-                    data["username"],
-                    hashed_password,
-                    data.get("organization"),
-                ),
-            )
-            connection.commit()
+                cursor.execute(
+                    "INSERT INTO users (first_name, last_name, username, password, organization) VALUES (%s, %s, %s, %s, %s)",
+                    (
+                        data["first_name"],
+                        data["last_name"],
+                        data["username"],
+                        hashed_password,
+                        data.get("organization"),
+                    ),
+                )
+                connection.commit()
 
         return jsonify({"message": "User registered successfully"}), 201
 
@@ -409,57 +429,45 @@ def signup():
         print(f"Database error: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
-    finally:
-        if connection:
-            connection.close()
-
 
 @app.route("/login", methods=["POST"])
 def login():
     data = request.json
-    connection = None
 
     try:
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
+        with db_pool.connection() as connection:
+            with connection.cursor(cursor=pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(
+                    "SELECT username, first_name, last_name, organization, password FROM users WHERE username = %s",
+                    (data["username"],),
+                )
+                user = cursor.fetchone()
 
-        with connection.cursor(cursor=pymysql.cursors.DictCursor) as cursor:
-            cursor.execute(
-                "SELECT username, first_name, last_name, organization, password FROM users WHERE username = %s",
-                (data["username"],),
+        if user and check_password_hash(user["password"], data["password"]):
+            access_token = create_access_token(identity=user["username"])
+
+            return (
+                jsonify(
+                    {
+                        "message": "Login successful",
+                        "token": access_token,
+                        "user": {
+                            "username": user["username"],
+                            "firstName": user["first_name"],
+                            "lastName": user["last_name"],
+                            "organization": user["organization"],
+                        },
+                    }
+                ),
+                200,
             )
-            user = cursor.fetchone()
-
-            if user and check_password_hash(user["password"], data["password"]):
-                access_token = create_access_token(identity=user["username"])
-
-                return (
-                    jsonify(
-                        {
-                            "message": "Login successful",
-                            "token": access_token,
-                            "user": {
-                                "username": user["username"],
-                                "firstName": user["first_name"],
-                                "lastName": user["last_name"],
-                                "organization": user["organization"],
-                            },
-                        }
-                    ),
-                    200,
-                )
 
-            return jsonify({"error": "Invalid username or password"}), 400
+        return jsonify({"error": "Invalid username or password"}), 400
 
     except pymysql.MySQLError as e:
         print(f"Database error: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
-    finally:
-        if connection:
-            connection.close()
-
 
 @app.route("/")
 def home():
@@ -474,58 +482,45 @@ def get_dashboard():
 
 @app.route("/patients", methods=["GET"])
 def get_patients():
-    connection = get_db_connection()
-
-    if connection:
+    with db_pool.connection() as connection:
         with connection.cursor() as cursor:
             cursor.execute(
                 "SELECT patient_id, first_name, last_name, birth_date, sex, orthanic_id FROM patient"
             )
             patients = cursor.fetchall()
 
-        connection.close()
-
-        return jsonify(patients), 200
-
-    return jsonify({"error": "Database connection failed"}), 500
+    return jsonify(patients), 200
 
 
 @app.route("/patientss/<int:patient_id>", methods=["GET"])
 def get_patient(patient_id):
-    connection = get_db_connection()
-    if connection:
+    with db_pool.connection() as connection:
         with connection.cursor() as cursor:
             cursor.execute("SELECT * FROM patient WHERE patient_id = %s", (patient_id))
             patient = cursor.fetchone()
             print(patient)
-        connection.close()
-        if patient:
-            return jsonify(patient), 200
-        return jsonify({"msg": "Patient not found"}), 404
-    return jsonify({"error": "Database connection failed"}), 500
+    if patient:
+        return jsonify(patient), 200
+    return jsonify({"msg": "Patient not found"}), 404
 
 
 @app.route("/get-oneliner/<int:patient_id>", methods=["GET"])
 def get_oneliner(patient_id):
-    connection = get_db_connection()
-    if connection:
+    with db_pool.connection() as connection:
         with connection.cursor() as cursor:
             cursor.execute("SELECT * FROM one_liners WHERE patient_id = %s", (patient_id))
             patient = cursor.fetchone()
             print(patient)
-        connection.close()
-        if patient:
-            return jsonify(patient), 200
-        return jsonify({"msg": "Patient not found"}), 404
-    return jsonify({"error": "Database connection failed"}), 500
+    if patient:
+        return jsonify(patient), 200
+    return jsonify({"msg": "Patient not found"}), 404
 
 
 @app.route("/patients", methods=["POST"])
 def add_patient():
     data = request.json
-    connection = get_db_connection()
 
-    if connection:
+    with db_pool.connection() as connection:
         try:
             # Start a transaction
             connection.begin()
@@ -553,7 +548,6 @@ def add_patient():
 
             # Commit the transaction
             connection.commit()
-            connection.close()
 
             return (
                 jsonify(
@@ -565,31 +559,26 @@ def add_patient():
         except Exception as e:
             # Rollback in case of error
             connection.rollback()
-            connection.close()
             return jsonify({"error": f"Failed to add patient: {str(e)}"}), 500
 
-    return jsonify({"error": "Database connection failed"}), 500
-
 
 @app.route("/patients/<int:patient_id>", methods=["PUT"])
 def update_patient(patient_id):
     data = request.json
-    connection = get_db_connection()
 
-    if connection:
+    with db_pool.connection() as connection:
         with connection.cursor() as cursor:
             # Check if patient exists
             cursor.execute("SELECT * FROM patient WHERE id = %s", (patient_id,))
             patient = cursor.fetchone()
             if not patient:
-                connection.close()
                 return jsonify({"msg": "Patient not found"}), 404
 
             # Update fields only if provided
             cursor.execute(
                 """
-                UPDATE patient 
-                SET name = %s, age = %s, sex = %s, lastVisit = %s 
+                UPDATE patient
+                SET name = %s, age = %s, sex = %s, lastVisit = %s
                 WHERE id = %s
             """,
                 (
@@ -602,33 +591,24 @@ def update_patient(patient_id):
             )
 
             connection.commit()
-        connection.close()
-        return jsonify({"msg": "Patient updated successfully"}), 200
-
-    return jsonify({"error": "Database connection failed"}), 500
+    return jsonify({"msg": "Patient updated successfully"}), 200
 
 
 @app.route("/patients/<int:patient_id>", methods=["DELETE"])
 def delete_patient(patient_id):
-    connection = get_db_connection()
-
-    if connection:
+    with db_pool.connection() as connection:
         with connection.cursor() as cursor:
             # Check if patient exists
             cursor.execute("SELECT * FROM patient WHERE id = %s", (patient_id,))
             patient = cursor.fetchone()
             if not patient:
-                connection.close()
                 return jsonify({"msg": "Patient not found"}), 404
 
             # Delete the patient
             cursor.execute("DELETE FROM patient WHERE id = %s", (patient_id,))
             connection.commit()
 
-        connection.close()
-        return jsonify({"msg": "Patient deleted successfully"}), 200
-
-    return jsonify({"error": "Database connection failed"}), 500
+    return jsonify({"msg": "Patient deleted successfully"}), 200
 
 
 @app.route("/agents", methods=["GET"])
@@ -654,68 +634,158 @@ def delete_agent(agent_id):
     return jsonify({"msg": "Agent deleted"}), 200
 
 
+def workflow_status(progress):
+    """Document, contour and planning status from a patient_progress row (None if it has none)"""
+    if not progress or progress["stage"] is None:
+        # Default progress (all tasks not started)
+        progress = {"stage": 0, "status": 0}
+
+    # Determine the status for each workflow based on stage and status
+    document_status = (
+        2 if progress["stage"] > 0 else progress["status"]
+    )  # Completed if stage > 0
+    contour_status = 0  # Default to not started
+    planning_status = 0  # Default to not started
+
+    if progress["stage"] == 1:
+        contour_status = progress["status"]  # In progress or awaiting review
+    elif progress["stage"] > 1:
+        contour_status = 2  # Completed
+
+    if progress["stage"] == 2:
+        planning_status = progress["status"]  # In progress or awaiting review
+    elif progress["stage"] > 2:
+        planning_status = 2  # Completed
+
+    return {
+        "document": document_status,
+        "contour": contour_status,
+        "planning": planning_status,
+        "stage": progress["stage"],
+        "status": progress["status"],
+    }
+
+
 @app.route("/patient-progress/<int:patient_id>", methods=["GET"])
 def get_patient_progress(patient_id):
-    connection = get_db_connection()
-
-    if connection:
+    with db_pool.connection() as connection:
         with connection.cursor() as cursor:
-            # Check if patient exists
-            cursor.execute(
-                "SELECT patient_id FROM patient WHERE patient_id = %s", (patient_id,)
-            )
-            patient = cursor.fetchone()
-
-            if not patient:
-                connection.close()
-                return jsonify({"error": "Patient not found"}), 404
-
-            # Get progress data
+            # Patient and progress in one query; stage is NULL if there is no progress row
             cursor.execute(
-                "SELECT stage, status FROM patient_progress WHERE patient_id = %s",
+                """
+                SELECT p.patient_id, pp.stage, pp.status
+                FROM patient p
+                LEFT JOIN patient_progress pp ON pp.patient_id = p.patient_id
+                WHERE p.patient_id = %s
+                """,
                 (patient_id,),
             )
             progress = cursor.fetchone()
 
-            if not progress:
-                # Create default progress entry (all tasks not started)
-                progress = {"stage": 0, "status": 0}
-
-            # Determine the status for each workflow based on stage and status
-            document_status = (
-                2 if progress["stage"] > 0 else progress["status"]
-            )  # Completed if stage > 0
-            contour_status = 0  # Default to not started
-            planning_status = 0  # Default to not started
-
-            if progress["stage"] == 1:
-                contour_status = progress["status"]  # In progress or awaiting review
-            elif progress["stage"] > 1:
-                contour_status = 2  # Completed
-
-            if progress["stage"] == 2:
-                planning_status = progress["status"]  # In progress or awaiting review
-            elif progress["stage"] > 2:
-                planning_status = 2  # Completed
-
-            result = {
-                "document": document_status,
-                "contour": contour_status,
-                "planning": planning_status,
-                "stage": progress["stage"],
-                "status": progress["status"],
-            }
+    if not progress:
+        return jsonify({"error": "Patient not found"}), 404
 
-        connection.close()
-        return jsonify(result), 200
+    return jsonify(workflow_status(progress)), 200
 
-    return jsonify({"error": "Database connection failed"}), 500
+
+def progress_etag(cursor):
+    """
+    ETag for the batch /patient-progress response, or None if it cannot be computed.
+
+    patient rows carry last_updated; patient_progress has no timestamp, so its
+    rows are summarised by a count and a checksum of (patient_id, stage, status).
+    """
+    try:
+        cursor.execute(
+            """
+            SELECT (SELECT COUNT(*) FROM patient) AS patients,
+                   (SELECT MAX(last_updated) FROM patient) AS patient_updated,
+                   (SELECT COUNT(*) FROM patient_progress) AS progress_rows,
+                   (SELECT COALESCE(SUM(CRC32(CONCAT_WS(':', patient_id, stage, status))), 0)
+                    FROM patient_progress) AS progress_checksum
+            """
+        )
+        version = cursor.fetchone()
+    except pymysql.MySQLError as e:
+        print(f"Could not compute the patient-progress ETag: {e}")
+        return None
+    return hashlib.sha1(
+        f"{sorted(version.items())}|{request.query_string.decode()}".encode()
+    ).hexdigest()
+
+
+@app.route("/patient-progress", methods=["GET"])
+def get_patients_progress():
+    """
+    Workflow status for many patients from one JOIN, ordered by patient_id
+
+    Query parameters:
+    - ids: comma-separated patient IDs (default: every patient)
+    - after: only patients with a greater patient_id (the previous page's next_after)
+    - limit: page size, at most PROGRESS_PAGE_MAX (default PROGRESS_PAGE_SIZE)
+
+    Responds {"progress": [...], "next_after": <patient_id or null>}. The ETag
+    changes whenever a patient or progress row is added, removed or updated, so
+    a repeat request with If-None-Match gets a 304 without running the JOIN.
+    If the ETag cannot be computed the response is sent without one.
+    """
+    try:
+        ids = [int(i) for i in request.args.get("ids", "").split(",") if i.strip()]
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of patient IDs"}), 400
+    after = request.args.get("after", type=int)
+    limit = min(request.args.get("limit", PROGRESS_PAGE_SIZE, type=int), PROGRESS_PAGE_MAX)
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    with db_pool.connection() as connection:
+        with connection.cursor() as cursor:
+            etag = progress_etag(cursor)
+            if etag and request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
+            conditions, params = [], []
+            if after is not None:
+                conditions.append("p.patient_id > %s")
+                params.append(after)
+            if ids:
+                conditions.append(f"p.patient_id IN ({', '.join(['%s'] * len(ids))})")
+                params.extend(ids)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+            # One row past the page tells us whether there is a next page
+            cursor.execute(
+                f"""
+                SELECT p.patient_id, pp.stage, pp.status
+                FROM patient p
+                LEFT JOIN patient_progress pp ON pp.patient_id = p.patient_id
+                {where}
+                ORDER BY p.patient_id
+                LIMIT %s
+                """,
+                params + [limit + 1],
+            )
+            rows = cursor.fetchall()
+
+    page = rows[:limit]
+    response = jsonify(
+        {
+            "progress": [
+                dict(workflow_status(row), patient_id=row["patient_id"]) for row in page
+            ],
+            "next_after": page[-1]["patient_id"] if len(rows) > limit else None,
+        }
+    )
+    if etag:
+        response.set_etag(etag)
+    return response
 
 
 @app.route("/update-patient-progress", methods=["POST"])
 def update_patient_progress():
     data = request.json
-    connection = get_db_connection()
 
     if (
         not data
@@ -725,7 +795,7 @@ def update_patient_progress():
     ):
         return jsonify({"error": "Missing required data"}), 400
 
-    if connection:
+    with db_pool.connection() as connection:
         with connection.cursor() as cursor:
             # Check if patient exists
             cursor.execute(
@@ -735,7 +805,6 @@ def update_patient_progress():
             patient = cursor.fetchone()
 
             if not patient:
-                connection.close()
                 return jsonify({"error": "Patient not found"}), 404
 
             # Check if progress entry exists
@@ -760,10 +829,7 @@ def update_patient_progress():
 
             connection.commit()
 
-        connection.close()
-        return jsonify({"message": "Patient progress updated successfully"}), 200
-
-    return jsonify({"error": "Database connection failed"}), 500
+    return jsonify({"message": "Patient progress updated successfully"}), 200
 
 
 @app.route("/save-oneliner", methods=["POST"])
@@ -788,46 +854,42 @@ def save_oneliner():
         ):
             return jsonify({"error": "Missing required fields"}), 400
 
-        # Connect to database
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        with connection.cursor() as cursor:
-            # Check if an entry already exists for this report
-            cursor.execute(
-                "SELECT one_liner_id FROM one_liners WHERE report_id = %s",
-                (data["report_id"],),
-            )
-            existing = cursor.fetchone()
-
-            if existing:
-                # Update existing record
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                # Check if an entry already exists for this report
                 cursor.execute(
-                    """
-                    UPDATE one_liners 
-                    SET one_liner_text = %s, model = %s, created_at = CURRENT_TIMESTAMP
-                    WHERE report_id = %s
-                    """,
-                    (data["one_liner_text"], data["model"], data["report_id"]),
+                    "SELECT one_liner_id FROM one_liners WHERE report_id = %s",
+                    (data["report_id"],),
                 )
-            else:
-                # Insert new record
-                cursor.execute(
-                    """
-                    INSERT INTO one_liners 
-                    (patient_id, report_id, one_liner_text, model) 
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (
-                        data["patient_id"],
-                        data["report_id"],
-                        data["one_liner_text"],
-                        data["model"],
-                    ),
-                )
-
-            connection.commit()
+                existing = cursor.fetchone()
+
+                if existing:
+                    # Update existing record
+                    cursor.execute(
+                        """
+                        UPDATE one_liners
+                        SET one_liner_text = %s, model = %s, created_at = CURRENT_TIMESTAMP
+                        WHERE report_id = %s
+                        """,
+                        (data["one_liner_text"], data["model"], data["report_id"]),
+                    )
+                else:
+                    # Insert new record
+                    cursor.execute(
+                        """
+                        INSERT INTO one_liners
+                        (patient_id, report_id, one_liner_text, model)
+                        VALUES (%s, %s, %s, %s)
+                        """,
+                        (
+                            data["patient_id"],
+                            data["report_id"],
+                            data["one_liner_text"],
+                            data["model"],
+                        ),
+                    )
+
+                connection.commit()
 
         return (
             jsonify(
@@ -841,12 +903,11 @@ def save_oneliner():
             200,
         )
 
+    except DatabaseUnavailable:
+        raise  # Answered by the database_unavailable handler
     except Exception as e:
         print(f"Error saving one-liner: {str(e)}")
         return jsonify({"error": f"Failed to save one-liner: {str(e)}"}), 500
-    finally:
-        if connection:
-            connection.close()
 
 @app.route("/patient-reports/<int:patient_id>", methods=["GET"])
 def get_patient_reports(patient_id):
@@ -854,30 +915,27 @@ def get_patient_reports(patient_id):
     Get all pathology reports for a specific patient
     """
     try:
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        with connection.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT report_id, patient_id, pdf_s3_url, creation_time
-                FROM pathology_reports
-                WHERE patient_id = %s
-                ORDER BY creation_time DESC
-                """,
-                (patient_id,),
-            )
-
-            reports = cursor.fetchall()
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT report_id, patient_id, pdf_s3_url, creation_time
+                    FROM pathology_reports
+                    WHERE patient_id = %s
+                    ORDER BY creation_time DESC
+                    """,
+                    (patient_id,),
+                )
 
-        connection.close()
+                reports = cursor.fetchall()
 
         if not reports:
             return jsonify([]), 200  # Return empty array if no reports found
 
         return jsonify(reports), 200
 
+    except DatabaseUnavailable:
+        raise  # Answered by the database_unavailable handler
     except Exception as e:
         print(f"Error fetching patient reports: {str(e)}")
         return jsonify({"error": f"Failed to fetch patient reports: {str(e)}"}), 500
@@ -895,38 +953,36 @@ def add_oneliner():
         return jsonify({"error": "Missing required fields"}), 400
 
     try:
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        with connection.cursor() as cursor:
-            # Insert into one_liners table
-            insert_query = """
-                INSERT INTO one_liners (patient_id, report_id, one_liner_text, model)
-                VALUES (%s, %s, %s, %s)
-            """
-            cursor.execute(
-                insert_query, (patient_id, report_id, oneliner_text, model_name)
-            )
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                # Insert into one_liners table
+                insert_query = """
+                    INSERT INTO one_liners (patient_id, report_id, one_liner_text, model)
+                    VALUES (%s, %s, %s, %s)
+                """
+                cursor.execute(
+                    insert_query, (patient_id, report_id, oneliner_text, model_name)
+                )
 
-            # Check if patient already exists in patient_progress
-            check_query = "SELECT 1 FROM patient_progress WHERE patient_id = %s LIMIT 1"
-            cursor.execute(check_query, (patient_id,))
-            exists = cursor.fetchone()
+                # Check if patient already exists in patient_progress
+                check_query = "SELECT 1 FROM patient_progress WHERE patient_id = %s LIMIT 1"
+                cursor.execute(check_query, (patient_id,))
+                exists = cursor.fetchone()
 
-            # If patient doesn't exist, insert new entry into patient_progress
-            if not exists:
-                progress_insert_query = """
-                    INSERT INTO patient_progress (patient_id, stage, status)
-                    VALUES (%s, %s, %s)
-                """
-                cursor.execute(progress_insert_query, (patient_id, 0, 2))
+                # If patient doesn't exist, insert new entry into patient_progress
+                if not exists:
+                    progress_insert_query = """
+                        INSERT INTO patient_progress (patient_id, stage, status)
+                        VALUES (%s, %s, %s)
+                    """
+                    cursor.execute(progress_insert_query, (patient_id, 0, 2))
 
-        connection.commit()
-        connection.close()
+            connection.commit()
 
         return jsonify({"message": "One-liner added successfully"}), 200
 
+    except DatabaseUnavailable:
+        raise  # Answered by the database_unavailable handler
     except Exception as e:
         print(f"Error inserting into database: {e}")
         return jsonify({"error": str(e)}), 500
@@ -941,33 +997,30 @@ def patients_without_oneliner():
         LEFT JOIN one_liners o ON p.patient_id = o.patient_id
         WHERE o.patient_id IS NULL;
         """
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        with connection.cursor() as cursor:
-            cursor.execute(query)
-            patients = cursor.fetchall()
-
-            patient_list = [
-                {
-                    "patient_id": patient["patient_id"],
-                    "first_name": patient["first_name"],
-                    "last_name": patient["last_name"],
-                    "birth_date": (
-                        patient["birth_date"].isoformat()
-                        if isinstance(patient["birth_date"], (datetime, date))
-                        else patient["birth_date"]
-                    ),
-                    "sex": patient["sex"],
-                }
-                for patient in patients
-            ]
-
-        connection.close()
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query)
+                patients = cursor.fetchall()
+
+        patient_list = [
+            {
+                "patient_id": patient["patient_id"],
+                "first_name": patient["first_name"],
+                "last_name": patient["last_name"],
+                "birth_date": (
+                    patient["birth_date"].isoformat()
+                    if isinstance(patient["birth_date"], (datetime, date))
+                    else patient["birth_date"]
+                ),
+                "sex": patient["sex"],
+            }
+            for patient in patients
+        ]
 
         return jsonify(patient_list), 200
 
+    except DatabaseUnavailable:
+        raise  # Answered by the database_unavailable handler
     except Exception as e:
         print(f"Error fetching patients: {e}")
         return jsonify({"error": str(e)}), 500
@@ -982,15 +1035,10 @@ def get_latest_report(patient_id):
         ORDER BY creation_time DESC
         LIMIT 1;
         """
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        with connection.cursor() as cursor:
-            cursor.execute(query, (patient_id,))
-            result = cursor.fetchone()
-
-        connection.close()
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query, (patient_id,))
+                result = cursor.fetchone()
 
         print(f"Query result for patient_id {patient_id}: {result}")
 
@@ -999,6 +1047,8 @@ def get_latest_report(patient_id):
         else:
             return jsonify({"error": "No report found for this patient"}), 404
 
+    except DatabaseUnavailable:
+        raise  # Answered by the database_unavailable handler
     except Exception as e:
         print(f"Error fetching latest report_id: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -1007,62 +1057,57 @@ def get_latest_report(patient_id):
 def get_structured_data(patient_id):
     """Get structured data for a specific patient"""
     try:
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                # First check if the patient exists
+                cursor.execute(
+                    "SELECT patient_id FROM patient WHERE patient_id = %s",
+                    (patient_id,)
+                )
+
+                if not cursor.fetchone():
+                    return jsonify({"error": "Patient not found"}), 404
+
+                # Get the latest report_id for this patient
+                cursor.execute(
+                    """
+                    SELECT report_id FROM pathology_reports
+                    WHERE patient_id = %s
+                    ORDER BY creation_time DESC
+                    LIMIT 1
+                    """,
+                    (patient_id,)
+                )
+
+                report_result = cursor.fetchone()
+                if not report_result:
+                    return jsonify({"error": "No reports found for this patient"}), 404
+
+                report_id = report_result["report_id"]
+
+                # Get structured data for this patient's latest report
+                cursor.execute(
+                    """
+                    SELECT structured_data_id, patient_id, report_id, disease_site,
+                           tumor_stage, laterality, age, sex, ebrt_relevance, model,
+                           creation_time
+                    FROM structured_data
+                    WHERE patient_id = %s AND report_id = %s
+                    ORDER BY creation_time DESC
+                    LIMIT 1
+                    """,
+                    (patient_id, report_id)
+                )
+
+                structured_data = cursor.fetchone()
 
-        with connection.cursor() as cursor:
-            # First check if the patient exists
-            cursor.execute(
-                "SELECT patient_id FROM patient WHERE patient_id = %s",
-                (patient_id,)
-            )
-            
-            if not cursor.fetchone():
-                connection.close()
-                return jsonify({"error": "Patient not found"}), 404
-            
-            # Get the latest report_id for this patient
-            cursor.execute(
-                """
-                SELECT report_id FROM pathology_reports
-                WHERE patient_id = %s
-                ORDER BY creation_time DESC
-                LIMIT 1
-                """,
-                (patient_id,)
-            )
-            
-            report_result = cursor.fetchone()
-            if not report_result:
-                connection.close()
-                return jsonify({"error": "No reports found for this patient"}), 404
-            
-            report_id = report_result["report_id"]
-            
-            # Get structured data for this patient's latest report
-            cursor.execute(
-                """
-                SELECT structured_data_id, patient_id, report_id, disease_site, 
-                       tumor_stage, laterality, age, sex, ebrt_relevance, model,
-                       creation_time
-                FROM structured_data
-                WHERE patient_id = %s AND report_id = %s
-                ORDER BY creation_time DESC
-                LIMIT 1
-                """,
-                (patient_id, report_id)
-            )
-            
-            structured_data = cursor.fetchone()
-            
-        connection.close()
-        
         if not structured_data:
             return jsonify({"error": "No structured data found for this patient"}), 404
-            
+
         return jsonify(structured_data), 200
 
+    except DatabaseUnavailable:
+        raise  # Answered by the database_unavailable handler
     except Exception as e:
         print(f"Error fetching structured data: {str(e)}")
         return jsonify({"error": f"Failed to fetch structured data: {str(e)}"}), 500
@@ -1098,94 +1143,90 @@ def save_structured_data():
                 400,
             )
 
-        # Connect to database
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        with connection.cursor() as cursor:
-            # Check if an entry already exists for this report
-            cursor.execute(
-                "SELECT structured_data_id FROM structured_data WHERE report_id = %s",
-                (data["report_id"],),
-            )
-            existing = cursor.fetchone()
-
-            if existing:
-                # Update existing record
-                cursor.execute(
-                    """
-                    UPDATE structured_data 
-                    SET disease_site = %s, 
-                        tumor_stage = %s, 
-                        laterality = %s, 
-                        age = %s, 
-                        sex = %s, 
-                        ebrt_relevance = %s, 
-                        model = %s, 
-                        creation_time = CURRENT_TIMESTAMP
-                    WHERE report_id = %s
-                    """,
-                    (
-                        data.get("disease_site", ""),
-                        data.get("tumor_stage", ""),
-                        data.get("laterality", ""),
-                        data.get("age", ""),
-                        data.get("sex", ""),
-                        data.get("ebrt_relevance", ""),
-                        data["model"],
-                        data["report_id"],
-                    ),
-                )
-                record_id = existing["structured_data_id"]
-            else:
-                # Insert new record
-                cursor.execute(
-                    """
-                    INSERT INTO structured_data 
-                    (patient_id, report_id, disease_site, tumor_stage, laterality, age, sex, ebrt_relevance, model) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (
-                        data["patient_id"],
-                        data["report_id"],
-                        data.get("disease_site", ""),
-                        data.get("tumor_stage", ""),
-                        data.get("laterality", ""),
-                        data.get("age", ""),
-                        data.get("sex", ""),
-                        data.get("ebrt_relevance", ""),
-                        data["model"],
-                    ),
-                )
-                record_id = cursor.lastrowid
-
-            # Also update patient progress
-            # Check if patient already exists in patient_progress
-            cursor.execute("SELECT 1 FROM patient_progress WHERE patient_id = %s LIMIT 1", 
-                         (data["patient_id"],))
-            exists = cursor.fetchone()
-
-            # Update or insert into patient_progress
-            if exists:
-                cursor.execute(
-                    """
-                    UPDATE patient_progress 
-                    SET stage = GREATEST(stage, 0), status = 2
-                    WHERE patient_id = %s
-                    """, 
-                    (data["patient_id"],)
-                )
-            else:
+        with db_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                # Check if an entry already exists for this report
                 cursor.execute(
-                    """
-                    INSERT INTO patient_progress 
-                    (patient_id, stage, status) VALUES (%s, 0, 2)
-                    """, 
-                    (data["patient_id"],)
+                    "SELECT structured_data_id FROM structured_data WHERE report_id = %s",
+                    (data["report_id"],),
                 )
+                existing = cursor.fetchone()
+
+                if existing:
+                    # Update existing record
+                    cursor.execute(
+                        """
+                        UPDATE structured_data
+                        SET disease_site = %s,
+                            tumor_stage = %s,
+                            laterality = %s,
+                            age = %s,
+                            sex = %s,
+                            ebrt_relevance = %s,
+                            model = %s,
+                            creation_time = CURRENT_TIMESTAMP
+                        WHERE report_id = %s
+                        """,
+                        (
+                            data.get("disease_site", ""),
+                            data.get("tumor_stage", ""),
+                            data.get("laterality", ""),
+                            data.get("age", ""),
+                            data.get("sex", ""),
+                            data.get("ebrt_relevance", ""),
+                            data["model"],
+                            data["report_id"],
+                        ),
+                    )
+                    record_id = existing["structured_data_id"]
+                else:
+                    # Insert new record
+                    cursor.execute(
+                        """
+                        INSERT INTO structured_data
+                        (patient_id, report_id, disease_site, tumor_stage, laterality, age, sex, ebrt_relevance, model)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        """,
+                        (
+                            data["patient_id"],
+                            data["report_id"],
+                            data.get("disease_site", ""),
+                            data.get("tumor_stage", ""),
+                            data.get("laterality", ""),
+                            data.get("age", ""),
+                            data.get("sex", ""),
+                            data.get("ebrt_relevance", ""),
+                            data["model"],
+                        ),
+                    )
+                    record_id = cursor.lastrowid
+
+                # Also update patient progress
+                # Check if patient already exists in patient_progress
+                cursor.execute("SELECT 1 FROM patient_progress WHERE patient_id = %s LIMIT 1",
+                             (data["patient_id"],))
+                exists = cursor.fetchone()
+
+                # Update or insert into patient_progress
+                if exists:
+                    cursor.execute(
+                        """
+                        UPDATE patient_progress
+                        SET stage = GREATEST(stage, 0), status = 2
+                        WHERE patient_id = %s
+                        """,
+                        (data["patient_id"],)
+                    )
+                else:
+                    cursor.execute(
+                        """
+                        INSERT INTO patient_progress
+                        (patient_id, stage, status) VALUES (%s, 0, 2)
+                        """,
+                        (data["patient_id"],)
+                    )
 
-            connection.commit()
+                connection.commit()
 
         return (
             jsonify(
@@ -1197,13 +1238,11 @@ def save_structured_data():
             200,
         )
 
+    except DatabaseUnavailable:
+        raise  # Answered by the database_unavailable handler
     except Exception as e:
         print(f"Error saving structured data: {str(e)}")
         return jsonify({"error": f"Failed to save structured data: {str(e)}"}), 500
-    finally:
-        if connection:
-            connection.close()
-
 
 
 if __name__ == "__main__":
@@ -0,0 +1,133 @@
+# server/bench_db_pool.py
+"""
+Requests per second of a database-backed route with and without the
+connection pool.
+
+Serves GET /patient-progress/<id> (same query shape as app.py) from a small
+Flask app in two variants:
+
+    per-request  open a new connection, query, close (the old get_db_connection)
+    pooled       check a connection out of db_pool.ConnectionPool
+
+--concurrency client threads issue --requests requests through Flask's test
+client. Without MYSQL_TEST_HOST the database is test_db_pool.StandinConnection
+with --connect-latency seconds added to every connect, standing in for the
+TCP, TLS and authentication round trips to RDS. With MYSQL_TEST_HOST (see
+test_db_pool.py) it runs against that MySQL instead.
+
+Usage (from server):
+    python bench_db_pool.py --requests 2000 --concurrency 8 --connect-latency 0.02
+"""
+import time
+import sqlite3
+import argparse
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, jsonify
+
+from db_pool import ConnectionPool
+from test_db_pool import StandinConnection, mysql_factory
+
+PATIENTS = 1000
+
+
+def standin_connect(path, latency):
+    def connect():
+        time.sleep(latency)
+        return StandinConnection(path)
+    return connect
+
+
+def create_standin(path):
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE patient_progress (patient_id INTEGER PRIMARY KEY, stage INTEGER, status INTEGER)')
+        conn.executemany('INSERT INTO patient_progress VALUES (?, ?, ?)',
+                         [(i, i % 3, i % 2) for i in range(PATIENTS)])
+
+
+def create_mysql(connect):
+    connection = connect()
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE IF NOT EXISTS bench_patient_progress '
+                       '(patient_id INT PRIMARY KEY, stage INT, status INT)')
+        cursor.executemany('REPLACE INTO bench_patient_progress VALUES (%s, %s, %s)',
+                           [(i, i % 3, i % 2) for i in range(PATIENTS)])
+    connection.commit()
+    connection.close()
+
+
+def create_app(checkout, query):
+    app = Flask(__name__)
+
+    @app.route("/patient-progress/<int:patient_id>", methods=["GET"])
+    def get_patient_progress(patient_id):
+        with checkout() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, (patient_id,))
+            progress = cursor.fetchone()
+            cursor.close()
+        return jsonify({"stage": progress[0], "status": progress[1]}), 200
+
+    return app
+
+
+def per_request(connect):
+    """Context manager matching ConnectionPool.connection(), without the pool"""
+    class Checkout:
+        def __enter__(self):
+            self.connection = connect()
+            return self.connection
+
+        def __exit__(self, *exc):
+            self.connection.close()
+    return Checkout
+
+
+def run(app, requests, concurrency):
+    client = app.test_client()
+
+    def get(i):
+        response = client.get(f"/patient-progress/{i % PATIENTS}")
+        assert response.status_code == 200, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(get, range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--connect-latency', type=float, default=0.02, help='seconds added to each stand-in connect')
+    parser.add_argument('--pool-size', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_db_pool_') as work_dir:
+        connect = mysql_factory()
+        if connect:
+            create_mysql(connect)
+            query = 'SELECT stage, status FROM bench_patient_progress WHERE patient_id = %s'
+            print(f"database: MySQL, {args.concurrency} client threads")
+        else:
+            path = str(Path(work_dir) / 'standin.db')
+            create_standin(path)
+            connect = standin_connect(path, args.connect_latency)
+            query = 'SELECT stage, status FROM patient_progress WHERE patient_id = ?'
+            print(f"database: stand-in, {args.connect_latency * 1000:.0f}ms per connect, "
+                  f"{args.concurrency} client threads")
+
+        rate = run(create_app(per_request(connect), query), args.requests, args.concurrency)
+        print(f"{'per-request':12} {rate:9.0f} requests/s")
+
+        pool = ConnectionPool(connect, max_size=args.pool_size)
+        rate = run(create_app(pool.connection, query), args.requests, args.concurrency)
+        print(f"{'pooled':12} {rate:9.0f} requests/s  {pool.get_stats()}")
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Bounded pool of DB-API connections for the intake server.
+
+Opening a pymysql connection to RDS costs a TCP and TLS handshake plus
+authentication, so routes check a connection out of the pool instead:
+
+    with db_pool.connection() as connection:
+        with connection.cursor() as cursor:
+            ...
+        connection.commit()
+
+A connection that has been idle longer than `ping_after` seconds is pinged
+before it is handed out, and replaced if the server dropped it. Connections
+idle longer than `max_idle` are closed rather than reused. Whatever the route
+left uncommitted is rolled back on return, so the next request never inherits
+an open transaction. At most `max_size` connections exist at once; a checkout
+waits up to `timeout` seconds for one to be returned.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+
+class DatabaseUnavailable(Exception):
+    """No connection could be opened, or none was returned to the pool in time"""
+
+
+def ping(connection):
+    """Health check: pymysql's ping, or SELECT 1 for other DB-API connections"""
+    if hasattr(connection, "ping"):
+        connection.ping(reconnect=False)
+    else:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size=10, max_idle=300, ping_after=30, timeout=10, check=ping):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self._check = check
+        self._idle = []  # (connection, returned_at), most recently returned last
+        self._size = 0  # idle plus checked out
+        self._closed = False
+        self._lock = threading.Condition()
+        self._stats = {"opened": 0, "reused": 0, "pinged": 0, "replaced": 0, "expired": 0, "waits": 0}
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the with block"""
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            self._release(connection, self._reset(connection))
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.timeout
+        expired = []
+        try:
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise DatabaseUnavailable("Connection pool is closed")
+                    expired += self._expire_idle()
+                    if self._idle:
+                        connection, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        connection, returned_at = None, None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DatabaseUnavailable(f"No database connection free after {self.timeout}s "
+                                                  f"({self.max_size} in use)")
+                    self._stats["waits"] += 1
+                    self._lock.wait(remaining)
+        finally:
+            for stale in expired:
+                self._close(stale)
+
+        if connection is not None:
+            if time.monotonic() - returned_at < self.ping_after:
+                self._count("reused")
+                return connection
+            try:
+                self._count("pinged")
+                self._check(connection)
+                self._count("reused")
+                return connection
+            except Exception as e:
+                print(f"Pooled database connection failed its health check, reconnecting: {e}")
+                self._count("replaced")
+                self._close(connection)
+        return self._open()
+
+    def _open(self):
+        """New connection for a slot already counted in _size"""
+        try:
+            connection = self._connect()
+        except Exception as e:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise DatabaseUnavailable(f"Database connection failed: {e}") from e
+        self._count("opened")
+        return connection
+
+    def _count(self, stat):
+        """Bump a counter from outside the lock; checkouts on other threads update the same dict"""
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _reset(self, connection):
+        """Roll back anything left uncommitted; False if the connection is unusable"""
+        try:
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _release(self, connection, healthy):
+        with self._lock:
+            healthy = healthy and not self._closed
+            if healthy:
+                self._idle.append((connection, time.monotonic()))
+            else:
+                self._size -= 1
+            self._lock.notify()
+        if not healthy:
+            self._close(connection)
+
+    def _expire_idle(self):
+        """Take connections idle longer than max_idle out of the pool (called with the lock held)"""
+        now = time.monotonic()
+        expired = [connection for connection, returned_at in self._idle if now - returned_at > self.max_idle]
+        if expired:
+            self._idle = [(c, t) for c, t in self._idle if now - t <= self.max_idle]
+            self._size -= len(expired)
+            self._stats["expired"] += len(expired)
+        return expired
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close every idle connection; checked-out ones are closed when returned"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._closed = True
+            self._lock.notify_all()
+        for connection, _ in idle:
+            self._close(connection)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, size=self._size, idle=len(self._idle), in_use=self._size - len(self._idle))
@@ -1,38 +1,60 @@
 from flask import Blueprint, jsonify
 import requests
-from requests.auth import HTTPBasicAuth
 import logging
+import os
+import threading
+from dotenv import load_dotenv
+from medai_common.orthanc_client import OrthancClient
+
+load_dotenv()
 
 orthanc_bp = Blueprint('orthanc', __name__)
 
-# Orthanc server configuration
-ORTHANC_URL = "http://localhost:8042"
-ORTHANC_USERNAME = "medai"
-ORTHANC_PASSWORD = "medai"
 
-def get_orthanc_auth():
-    return HTTPBasicAuth(ORTHANC_USERNAME, ORTHANC_PASSWORD)
+class OrthancNotConfigured(Exception):
+    """ORTHANC_USERNAME or ORTHANC_PASSWORD is missing from the environment"""
+
+
+# Orthanc server configuration; the credentials have no defaults
+ORTHANC_URL = os.environ.get("ORTHANC_URL", "http://localhost:8042")
+ORTHANC_USERNAME = os.environ.get("ORTHANC_USERNAME")
+ORTHANC_PASSWORD = os.environ.get("ORTHANC_PASSWORD")
+ORTHANC_TIMEOUT = float(os.environ.get("ORTHANC_TIMEOUT", 30))
+
+if not (ORTHANC_USERNAME and ORTHANC_PASSWORD):
+    print("ORTHANC_USERNAME and ORTHANC_PASSWORD are not set: /orthanc routes will answer 503")
+
+# One keep-alive pool for every request this blueprint makes, built on first use
+_orthanc = None
+_orthanc_lock = threading.Lock()
+
+
+def get_orthanc():
+    """The shared OrthancClient; raises OrthancNotConfigured without credentials"""
+    global _orthanc
+    if not (ORTHANC_USERNAME and ORTHANC_PASSWORD):
+        raise OrthancNotConfigured("ORTHANC_USERNAME and ORTHANC_PASSWORD must be set in the environment or .env")
+    with _orthanc_lock:
+        if _orthanc is None:
+            _orthanc = OrthancClient(
+                ORTHANC_URL,
+                auth=(ORTHANC_USERNAME, ORTHANC_PASSWORD),
+                timeout=ORTHANC_TIMEOUT
+            )
+        return _orthanc
+
+
+@orthanc_bp.errorhandler(OrthancNotConfigured)
+def orthanc_not_configured(e):
+    return jsonify({"error": f"Orthanc is not configured: {e}"}), 503
 
 @orthanc_bp.route("/orthanc/patients", methods=["GET"])
 def get_orthanc_patients():
     try:
-        # First, get all patient IDs
-        response = requests.get(
-            f"{ORTHANC_URL}/patients",
-            auth=get_orthanc_auth()
-        )
-        response.raise_for_status()
-        patient_ids = response.json()
-
-        # Get detailed information for each patient
+        # All patients with their details in a single expanded request
         patients = []
-        for patient_id in patient_ids:
-            patient_response = requests.get(
-                f"{ORTHANC_URL}/patients/{patient_id}",
-                auth=get_orthanc_auth()
-            )
-            patient_response.raise_for_status()
-            patient_data = patient_response.json()
+        for patient_data in get_orthanc().get_json("/patients", params={"expand": ""}):
+            patient_id = patient_data["ID"]
             
             # Extract relevant patient information
             patient = {
@@ -109,12 +131,7 @@ def get_orthanc_patients():
 @orthanc_bp.route("/orthanc/patients/<patient_id>", methods=["GET"])
 def get_orthanc_patient(patient_id):
     try:
-        response = requests.get(
-            f"{ORTHANC_URL}/patients/{patient_id}",
-            auth=get_orthanc_auth()
-        )
-        response.raise_for_status()
-        patient_data = response.json()
+        patient_data = get_orthanc().get_json(f"/patients/{patient_id}")
         
         # Format patient data
         patient = {
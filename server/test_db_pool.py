@@ -0,0 +1,254 @@
+# server/test_db_pool.py
+"""
+Checks db_pool.ConnectionPool: reuse, the size bound, health checks, idle
+expiry and rollback on return.
+
+By default the pool runs against StandinConnection, a sqlite3-backed DB-API
+connection that answers ping() the way pymysql does and can be "dropped" to
+simulate RDS closing an idle connection. Set MYSQL_TEST_HOST (and optionally
+MYSQL_TEST_PORT, MYSQL_TEST_USER, MYSQL_TEST_PASSWORD, MYSQL_TEST_DATABASE)
+to also run the checks against a local MySQL or MariaDB, e.g.
+
+    docker run --rm -d -p 3306:3306 -e MARIADB_ROOT_PASSWORD=test -e MARIADB_DATABASE=meddb mariadb:11
+    MYSQL_TEST_HOST=127.0.0.1 MYSQL_TEST_PASSWORD=test python -m pytest test_db_pool.py
+
+Usage (from server):
+    python -m pytest test_db_pool.py
+    python test_db_pool.py
+"""
+import os
+import time
+import sqlite3
+import threading
+
+from db_pool import ConnectionPool, DatabaseUnavailable
+
+
+class StandinConnection:
+    """sqlite3 connection with pymysql's ping(); close()d or dropped connections fail"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level='DEFERRED')
+        self.dropped = False
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        if self.dropped or self.closed:
+            raise sqlite3.OperationalError('Lost connection to server')
+        self._conn.execute('SELECT 1')
+
+    def cursor(self):
+        if self.dropped or self.closed:
+            raise sqlite3.OperationalError('Lost connection to server')
+        return self._conn.cursor()
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        if self.dropped or self.closed:
+            raise sqlite3.OperationalError('Lost connection to server')
+        self._conn.rollback()
+
+    def close(self):
+        self.closed = True
+        self._conn.close()
+
+
+def standin_factory(path):
+    opened = []
+
+    def connect():
+        connection = StandinConnection(path)
+        opened.append(connection)
+        return connection
+    return connect, opened
+
+
+def mysql_factory():
+    """pymysql connect() for the database in MYSQL_TEST_*, or None when unset"""
+    if not os.environ.get('MYSQL_TEST_HOST'):
+        return None
+    import pymysql
+
+    def connect():
+        return pymysql.connect(host=os.environ['MYSQL_TEST_HOST'], port=int(os.environ.get('MYSQL_TEST_PORT', 3306)),
+                               user=os.environ.get('MYSQL_TEST_USER', 'root'),
+                               password=os.environ.get('MYSQL_TEST_PASSWORD', ''),
+                               database=os.environ.get('MYSQL_TEST_DATABASE', 'meddb'))
+    return connect
+
+
+def new_pool(tmp_path, **kwargs):
+    connect, opened = standin_factory(str(tmp_path / 'standin.db'))
+    with sqlite3.connect(str(tmp_path / 'standin.db')) as conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS patient_progress (patient_id INTEGER PRIMARY KEY, stage INTEGER)')
+    return ConnectionPool(connect, **kwargs), opened
+
+
+def test_reuses_connections(tmp_path):
+    pool, opened = new_pool(tmp_path)
+    for _ in range(20):
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute('SELECT COUNT(*) FROM patient_progress')
+            cursor.fetchone()
+    assert len(opened) == 1
+    assert pool.get_stats()['reused'] == 19
+
+
+def test_bounded_and_times_out(tmp_path):
+    pool, opened = new_pool(tmp_path, max_size=2, timeout=0.2)
+    with pool.connection(), pool.connection():
+        start = time.monotonic()
+        try:
+            with pool.connection():
+                pass
+            assert False, 'a third checkout should not succeed'
+        except DatabaseUnavailable:
+            pass
+        assert time.monotonic() - start >= 0.2
+    assert len(opened) == 2
+    assert pool.get_stats()['in_use'] == 0
+
+
+def test_waiter_gets_returned_connection(tmp_path):
+    pool, opened = new_pool(tmp_path, max_size=1, timeout=5)
+    got = []
+
+    def worker():
+        with pool.connection() as connection:
+            got.append(connection)
+
+    with pool.connection() as first:
+        thread = threading.Thread(target=worker)
+        thread.start()
+        time.sleep(0.1)
+    thread.join()
+    assert got == [first]
+    assert len(opened) == 1
+
+
+def test_replaces_dropped_connection(tmp_path):
+    pool, opened = new_pool(tmp_path, ping_after=0)
+    with pool.connection() as connection:
+        pass
+    connection.dropped = True
+    with pool.connection() as replacement:
+        cursor = replacement.cursor()
+        cursor.execute('SELECT 1')
+    assert replacement is not connection and connection.closed
+    assert pool.get_stats()['replaced'] == 1
+    assert pool.get_stats()['size'] == 1
+
+
+def test_skips_ping_for_recent_connection(tmp_path):
+    pool, opened = new_pool(tmp_path, ping_after=60)
+    with pool.connection():
+        pass
+    with pool.connection():
+        pass
+    assert pool.get_stats()['pinged'] == 0
+
+
+def test_expires_idle_connections(tmp_path):
+    pool, opened = new_pool(tmp_path, max_idle=0.05)
+    with pool.connection() as connection:
+        pass
+    time.sleep(0.1)
+    with pool.connection() as fresh:
+        pass
+    assert fresh is not connection and connection.closed
+    assert pool.get_stats()['expired'] == 1
+
+
+def test_rolls_back_uncommitted_work(tmp_path):
+    pool, opened = new_pool(tmp_path)
+    try:
+        with pool.connection() as connection:
+            connection.cursor().execute('INSERT INTO patient_progress (patient_id, stage) VALUES (1, 0)')
+            raise RuntimeError('route failed before commit')
+    except RuntimeError:
+        pass
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute('SELECT COUNT(*) FROM patient_progress')
+        assert cursor.fetchone()[0] == 0
+    assert len(opened) == 1
+
+
+def test_unhealthy_connection_is_not_returned(tmp_path):
+    pool, opened = new_pool(tmp_path)
+    with pool.connection() as connection:
+        connection.dropped = True
+    assert connection.closed
+    assert pool.get_stats()['size'] == 0
+
+
+def test_connect_failure_frees_slot(tmp_path):
+    def connect():
+        raise sqlite3.OperationalError("Can't connect to MySQL server")
+
+    pool = ConnectionPool(connect, max_size=1, timeout=0.1)
+    for _ in range(3):
+        try:
+            with pool.connection():
+                pass
+            assert False, 'checkout should fail'
+        except DatabaseUnavailable:
+            pass
+    assert pool.get_stats()['size'] == 0
+
+
+def test_close(tmp_path):
+    pool, opened = new_pool(tmp_path)
+    with pool.connection():
+        pass
+    pool.close()
+    assert opened[0].closed
+    try:
+        with pool.connection():
+            pass
+        assert False, 'closed pool should refuse checkouts'
+    except DatabaseUnavailable:
+        pass
+
+
+def test_mysql():
+    connect = mysql_factory()
+    if connect is None:
+        print('MYSQL_TEST_HOST not set; skipping the MySQL checks')
+        return
+    pool = ConnectionPool(connect, max_size=2, ping_after=0)
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pool_check (id INT)')
+            cursor.execute('INSERT INTO pool_check VALUES (1)')
+        first_id = connection.thread_id()
+    with pool.connection() as connection:
+        assert connection.thread_id() == first_id
+        # The uncommitted insert was rolled back when the connection was returned
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM pool_check')
+            assert cursor.fetchone()[0] == 0
+    # Kill the pooled session server-side: the next checkout must reconnect
+    with connect() as admin, admin.cursor() as cursor:
+        cursor.execute(f"KILL {first_id}")
+    with pool.connection() as connection:
+        assert connection.thread_id() != first_id
+    assert pool.get_stats()['replaced'] == 1
+    pool.close()
+
+
+if __name__ == '__main__':
+    import tempfile
+    from pathlib import Path
+
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            with tempfile.TemporaryDirectory() as work_dir:
+                if test.__code__.co_argcount:
+                    test(Path(work_dir))
+                else:
+                    test()
+            print(f"{name} ok")
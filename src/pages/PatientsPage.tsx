@@ -63,34 +63,38 @@ const PatientsPage: React.FC = () => {
         try {
             setLoading(true);
             const fetchedPatients = await api.getPatients();
-            
-            const patientsWithProgress = await Promise.all(
-                fetchedPatients.map(async (patient) => {
-                    try {
-                        const progressData = await api.getPatientProgress(patient.patient_id);
-                        return {
-                            ...patient,
-                            document: progressData.document,
-                            contour: progressData.contour,
-                            planning: progressData.planning,
-                            stage: progressData.stage,
-                            status: progressData.status,
-                            orthanic_id: progressData.orthanic_id || patient.orthanic_id 
-                        };
-                    } catch (error) {
-                        console.error(`Failed to fetch progress for patient ${patient.patient_id}`, error);
-                        return {
-                            ...patient,
-                            document: 0,
-                            contour: 0,
-                            planning: 0,
-                            stage: 0,
-                            status: 0,
-                            orthanic_id: patient.orthanic_id 
-                        }; 
-                    }
-                })
-            );
+
+            // Progress for every patient in one batch request instead of one per patient
+            let progressById: Record<string, any> = {};
+            try {
+                progressById = await api.getPatientsProgress();
+            } catch (error) {
+                console.error('Failed to fetch patient progress', error);
+            }
+
+            const patientsWithProgress = fetchedPatients.map((patient) => {
+                const progressData = progressById[patient.patient_id.toString()];
+                if (!progressData) {
+                    return {
+                        ...patient,
+                        document: 0,
+                        contour: 0,
+                        planning: 0,
+                        stage: 0,
+                        status: 0,
+                        orthanic_id: patient.orthanic_id 
+                    }; 
+                }
+                return {
+                    ...patient,
+                    document: progressData.document,
+                    contour: progressData.contour,
+                    planning: progressData.planning,
+                    stage: progressData.stage,
+                    status: progressData.status,
+                    orthanic_id: progressData.orthanic_id || patient.orthanic_id 
+                };
+            });
             
             setPatients(patientsWithProgress);
             calculateStats(patientsWithProgress);
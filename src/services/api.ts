@@ -190,6 +190,49 @@ export const api = {
     }
   },
 
+  // Get progress for many patients (all of them if no IDs are given), keyed by patient_id
+  async getPatientsProgress(patientIds?: (number | string)[]): Promise<Record<string, any>> {
+    if (IS_DEMO_MODE) {
+      console.log('[DEMO MODE] Using static patient progress for all patients');
+      const wanted = patientIds?.map(id => id.toString());
+      const progressById: Record<string, any> = {};
+      (staticPatientsData as any[])
+        .filter(p => !wanted || wanted.includes(p.patient_id.toString()))
+        .forEach(p => {
+          progressById[p.patient_id.toString()] = {
+            document: p.document ?? 0,
+            contour: p.contour ?? 0,
+            planning: p.planning ?? 0,
+            stage: p.stage ?? 0,
+            status: p.status ?? 0,
+            orthanic_id: p.orthanic_id,
+          };
+        });
+      return Promise.resolve(progressById);
+    }
+    try {
+      // One JOIN per page on the server; follow next_after until the last page
+      const progressById: Record<string, any> = {};
+      let after: number | null = null;
+      do {
+        const page: any = await axiosInstance.get('/patient-progress', {
+          params: {
+            ids: patientIds?.join(','),
+            after: after ?? undefined,
+          },
+        });
+        page.progress.forEach((p: any) => {
+          progressById[p.patient_id.toString()] = p;
+        });
+        after = page.next_after;
+      } while (after !== null);
+      return progressById;
+    } catch (error) {
+      handleApiError(error as Error);
+      throw error;
+    }
+  },
+
   // Update patient progress
   async updatePatientProgress(patientId: number | string, stage: number, status: number): Promise<any> {
     try {
@@ -0,0 +1,184 @@
+# benchmarks/bench_database.py
+"""
+Dashboard and review-submit latency with concurrent simulated reviewers, comparing a
+new default-journal connection per call with the pooled WAL-mode Database.
+
+Each reviewer thread loops: load the project dashboard (three study lists and the
+stats, as project_dashboard does), then submit a review of its next study (the
+submit_review transaction, including the queued Orthanc writes when
+ORTHANC_REVIEW_LABELS is set). With
+--thread-per-request each dashboard load and submit runs on its own short-lived
+thread, as Werkzeug's threaded server does, and the pooled run reports how many
+connections it opened for all those checkouts.
+
+Usage:
+    ENVIRONMENT=local python benchmarks/bench_database.py --studies 2000 --reviewers 8 --rounds 25
+    ENVIRONMENT=local python benchmarks/bench_database.py --thread-per-request
+"""
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'webapp'))
+
+from config import ORTHANC_REVIEW_LABELS
+from database import Database
+from data_manager import OrthancDataManager
+from orthanc_writer import OrthancWriteQueue
+
+PROJECT_ID = 'bench'
+
+
+class PerCallDatabase:
+    """The previous access pattern: sqlite3.connect(DATABASE_PATH) for every call"""
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.path)
+        with conn:
+            yield conn
+
+
+def build_database(path, studies, reviewers):
+    """Schema from OrthancDataManager plus one project of synthetic studies"""
+    manager = OrthancDataManager.__new__(OrthancDataManager)
+    manager.db = Database(path)
+    manager._create_schema()
+    with manager.db.connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO projects (project_id, name, status) VALUES (?, 'Benchmark', 'active')",
+                     (PROJECT_ID,))
+        conn.executemany('INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)',
+                         [(f"bench{i}", 'x') for i in range(reviewers)])
+        conn.executemany('''
+            INSERT INTO studies (study_id, project_id, patient_id, patient_name, study_date, orthanc_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(f"study-{i:06d}", PROJECT_ID, f"P{i}", f"Patient^{i}", f"2024{i % 12 + 1:02d}01", f"study-{i:06d}")
+              for i in range(studies)])
+        user_ids = [row[0] for row in conn.execute("SELECT user_id FROM users WHERE username LIKE 'bench%'")]
+    manager.db.close()
+    return user_ids
+
+
+def dashboard(manager, user_id):
+    manager.get_project_studies(PROJECT_ID, status='unreviewed', user_id=user_id)
+    manager.get_project_studies(PROJECT_ID, status='in_progress', user_id=user_id)
+    manager.get_project_studies(PROJECT_ID, status='reviewed', user_id=user_id)
+    manager.get_project_stats(PROJECT_ID, user_id)
+
+
+def submit(manager, queue, user_id, study_id):
+    with manager.db.connection() as conn:
+        conn.execute('BEGIN TRANSACTION')
+        conn.execute('''
+            INSERT INTO user_study_status (user_id, study_id, project_id, status)
+            VALUES (?, ?, ?, 'reviewed')
+            ON CONFLICT (user_id, study_id, project_id)
+            DO UPDATE SET status = 'reviewed', last_modified = (datetime('now', 'localtime'))
+        ''', (user_id, study_id, PROJECT_ID))
+        rating = random.randint(1, 5)
+        conn.execute('''
+            INSERT INTO reviews (study_id, project_id, user_id, review_date, quality_rating, issues, comments)
+            VALUES (?, ?, ?, date('now'), ?, '', 'benchmark')
+        ''', (study_id, PROJECT_ID, user_id, rating))
+        if ORTHANC_REVIEW_LABELS:
+            queue.set_quality_label(conn, study_id, rating, review={'quality_rating': rating})
+        conn.commit()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000 if values else 0.0
+
+
+def on_new_thread(fn, *args):
+    """Call fn on a thread of its own and wait for it, like one request on the dev server"""
+    errors = []
+
+    def target():
+        try:
+            fn(*args)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def run(label, db, user_ids, rounds, thread_per_request=False):
+    manager = OrthancDataManager.__new__(OrthancDataManager)
+    manager.db = db
+    queue = OrthancWriteQueue(None, db)
+    timings = {'dashboard': [], 'submit': []}
+    errors = []
+    lock = threading.Lock()
+    call = on_new_thread if thread_per_request else (lambda fn, *args: fn(*args))
+
+    def reviewer(index, user_id):
+        local = {'dashboard': [], 'submit': []}
+        try:
+            for i in range(rounds):
+                start = time.perf_counter()
+                call(dashboard, manager, user_id)
+                local['dashboard'].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                call(submit, manager, queue, user_id, f"study-{index * rounds + i:06d}")
+                local['submit'].append(time.perf_counter() - start)
+        except sqlite3.Error as e:
+            errors.append(str(e))
+        with lock:
+            for name, values in local.items():
+                timings[name].extend(values)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=reviewer, args=(i, user_id)) for i, user_id in enumerate(user_ids)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    for name, values in timings.items():
+        print(f"{label:10} {name:10} p50 {percentile(values, 50):7.1f} ms  p95 {percentile(values, 95):7.1f} ms  "
+              f"max {percentile(values, 100):7.1f} ms  ({len(values)} calls)")
+    print(f"{label:10} {'total':10} {elapsed:6.2f}s, {len(errors)} errors{': ' + errors[0] if errors else ''}")
+    if hasattr(db, 'get_stats'):
+        stats = db.get_stats()
+        print(f"{label:10} {'pool':10} {stats['opened']} connections opened for {stats['checkouts']} checkouts")
+        db.close()
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--studies', type=int, default=2000, help='studies in the benchmark project')
+    parser.add_argument('--reviewers', type=int, default=8, help='concurrent reviewer threads')
+    parser.add_argument('--rounds', type=int, default=25, help='dashboard loads and submits per reviewer')
+    parser.add_argument('--thread-per-request', action='store_true',
+                        help='run every dashboard load and submit on a new thread')
+    args = parser.parse_args()
+
+    for label, make_db, journal in [('per-call', PerCallDatabase, 'DELETE'), ('pooled', Database, 'WAL')]:
+        with tempfile.TemporaryDirectory(prefix='bench_database_') as work_dir:
+            path = str(Path(work_dir) / 'reviews.db')
+            user_ids = build_database(path, args.studies, args.reviewers)
+            with sqlite3.connect(path) as conn:
+                conn.execute(f'PRAGMA journal_mode = {journal}')
+            run(label, make_db(path), user_ids, args.rounds, args.thread_per_request)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/bench_downloads.py
+"""
+Compare per-instance and whole-study archive downloads against a local Orthanc stand-in.
+
+Usage:
+    python benchmarks/bench_downloads.py --slices 300 --latency 0.005 --workers 8
+"""
+import sys
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'webapp'))
+
+from orthanc_standin import OrthancStandIn
+from study_downloader import StudyDownloader
+
+
+def run(label, standin, download, prime=None):
+    """Download the stand-in study into a fresh directory (optionally primed first) and print the stats"""
+    work_dir = Path(tempfile.mkdtemp(prefix='bench_downloads_'))
+    try:
+        if prime:
+            prime(work_dir / standin.study_id)
+        requests_before = standin.requests
+        stats = download(work_dir / standin.study_id)
+        print(f"{label:28} {stats.elapsed:7.2f}s {stats.mb_per_second:8.1f} MB/s "
+              f"{stats.files_per_second:8.1f} files/s {standin.requests - requests_before:6d} requests")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def drop_half(stats, study_dir):
+    """Delete every other cached CT slice to mimic an interrupted download"""
+    for path in sorted((study_dir / 'CT').glob('*.dcm'))[::2]:
+        path.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--slices', type=int, default=300, help='CT slices in the synthetic study')
+    parser.add_argument('--latency', type=float, default=0.005, help='simulated seconds of latency per request')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent downloads')
+    args = parser.parse_args()
+
+    standin = OrthancStandIn(slices=args.slices, latency=args.latency).start()
+    print(f"Stand-in study: {len(standin.instances)} instances, "
+          f"{standin.total_bytes / (1024 * 1024):.1f} MB, {args.latency * 1000:.1f} ms per request\n")
+    try:
+        sequential = StudyDownloader(standin.url, max_workers=1)
+        parallel = StudyDownloader(standin.url, max_workers=args.workers)
+
+        run('instances (1 worker)', standin, lambda d: sequential.download_study(standin.study_id, d))
+        run(f'instances ({args.workers} workers)', standin, lambda d: parallel.download_study(standin.study_id, d))
+        run('archive', standin, lambda d: parallel.download_study_archive(standin.study_id, d))
+        run('media', standin, lambda d: parallel.download_study_archive(standin.study_id, d, media=True))
+        run('resync (unchanged)', standin, lambda d: parallel.download_study_archive(standin.study_id, d),
+            prime=lambda d: parallel.download_study_archive(standin.study_id, d))
+        run('resume (half cached)', standin, lambda d: parallel.download_study(standin.study_id, d),
+            prime=lambda d: drop_half(parallel.download_study_archive(standin.study_id, d), d))
+    finally:
+        standin.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# benchmarks/bench_queries.py
+"""
+Time the review database's hot queries on a synthetic project set, with and without
+the migration indexes.
+
+Builds the schema through OrthancDataManager (so every migration is applied), fills
+it with --studies studies spread over --projects projects, marks a third of them
+reviewed by --reviewers reviewers, then runs each query in migrations.HOT_QUERIES
+--repeat times before and after dropping the migration's indexes.
+
+Usage:
+    ENVIRONMENT=local python benchmarks/bench_queries.py --studies 100000 --projects 10
+"""
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'webapp'))
+
+from database import Database
+from data_manager import OrthancDataManager
+from migrations import HOT_QUERIES, full_scans
+
+
+def build_database(path, studies, projects, reviewers):
+    manager = OrthancDataManager.__new__(OrthancDataManager)
+    manager.db = Database(path)
+    manager._create_schema()
+    start = time.perf_counter()
+    with manager.db.connection() as conn:
+        conn.executemany('INSERT OR IGNORE INTO projects (project_id, name) VALUES (?, ?)',
+                         [(f"p{p}", f"Project {p}") for p in range(projects)])
+        conn.executemany('INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)',
+                         [(f"bench{u}", 'x') for u in range(reviewers)])
+        user_ids = [row[0] for row in conn.execute("SELECT user_id FROM users WHERE username LIKE 'bench%'")]
+        conn.executemany('''
+            INSERT INTO studies (study_id, project_id, patient_id, patient_name, study_date, orthanc_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', ((f"s{i:08d}", f"p{i % projects}", f"P{i}", f"Patient^{i}", f"20{i % 7 + 20}{i % 12 + 1:02d}01", f"s{i:08d}")
+              for i in range(studies)))
+        reviewed = [(user_ids[i % reviewers], f"s{i:08d}", f"p{i % projects}") for i in range(0, studies, 3)]
+        conn.executemany("INSERT INTO user_study_status (user_id, study_id, project_id, status) VALUES (?, ?, ?, 'reviewed')",
+                         reviewed)
+        conn.executemany('''
+            INSERT INTO reviews (study_id, project_id, user_id, review_date, quality_rating, issues)
+            VALUES (?, ?, ?, date('now'), ?, '')
+        ''', [(study_id, project_id, user_id, int(study_id[1:]) % 5 + 1) for user_id, study_id, project_id in reviewed])
+        conn.executemany('INSERT OR IGNORE INTO user_projects (user_id, project_id) VALUES (?, ?)',
+                         [(user_id, f"p{p}") for user_id in user_ids for p in range(projects)])
+        conn.execute('ANALYZE')
+    print(f"Built {studies} studies, {len(reviewed)} reviews in {time.perf_counter() - start:.1f}s\n")
+    return manager.db, user_ids[0]
+
+
+def parameters(params, user_id):
+    """Point the sample parameters at a real reviewer and project"""
+    return tuple(user_id if value == 1 else 'p0' if value == 'p' else value for value in params)
+
+
+def time_queries(conn, user_id, repeat):
+    timings = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        params = parameters(params, user_id)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        timings[name] = (time.perf_counter() - start) / repeat * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--studies', type=int, default=100000, help='synthetic studies')
+    parser.add_argument('--projects', type=int, default=10, help='projects the studies are spread over')
+    parser.add_argument('--reviewers', type=int, default=8, help='reviewers assigned to every project')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_queries_') as work_dir:
+        db, user_id = build_database(str(Path(work_dir) / 'reviews.db'), args.studies, args.projects, args.reviewers)
+        with db.connection() as conn:
+            indexed = time_queries(conn, user_id, args.repeat)
+            print(f"Indexed plans: {len(full_scans(conn))} hot queries scan a table")
+
+            for (index,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%' "
+                    "AND tbl_name IN ('studies', 'user_study_status', 'reviews', 'user_projects')").fetchall():
+                conn.execute(f'DROP INDEX {index}')
+            conn.execute('ANALYZE')
+            unindexed = time_queries(conn, user_id, args.repeat)
+            print(f"Without migration indexes: {len(full_scans(conn))} hot queries scan a table\n")
+
+    print(f"{'query':30} {'no index':>10} {'indexed':>10} {'speedup':>8}")
+    for name in HOT_QUERIES:
+        print(f"{name:30} {unindexed[name]:8.2f}ms {indexed[name]:8.2f}ms {unindexed[name] / max(indexed[name], 1e-6):7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/bench_startup.py
+"""
+Time from starting the viewer process to its first served request, in each
+STARTUP_MODE, on a new database (cold) and on an existing one (warm, i.e. a
+container restart).
+
+Each run starts webapp/app.py in a fresh process against a temporary
+DATABASE_PATH and a stand-in Orthanc that answers GET /system after
+--orthanc-latency seconds, then polls GET / until it answers 200. The
+background sync worker is disabled (PREFETCH_INTERVAL=0).
+
+Usage:
+    python benchmarks/bench_startup.py --runs 3 --orthanc-latency 0.5
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WEBAPP_DIR = Path(__file__).resolve().parent.parent / 'webapp'
+
+LAUNCHER = '''
+import sys
+import app
+app.app.run(host='127.0.0.1', port=int(sys.argv[1]), use_reloader=False, threaded=True)
+'''
+
+
+def start_orthanc(latency):
+    """Answer GET /system (after `latency` seconds) and 404 everything else"""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith('/system'):
+                time.sleep(latency)
+                body, status = json.dumps({'Name': 'standin', 'Version': '1.12.0'}).encode(), 200
+            else:
+                body, status = b'Unknown resource', 404
+            try:
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The viewer process was stopped while its background check waited
+                pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(mode, database_path, orthanc_url, timeout=120):
+    """Seconds from process start to the first 200 from GET /, or None if it never answered"""
+    port = free_port()
+    env = dict(os.environ, ENVIRONMENT='local', STARTUP_MODE=mode, DATABASE_PATH=database_path,
+               ORTHANC_URL=orthanc_url, PREFETCH_INTERVAL='0')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', LAUNCHER, str(port)], cwd=WEBAPP_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                return None
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        return None
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='warm restarts timed per mode')
+    parser.add_argument('--orthanc-latency', type=float, default=0.5, help='seconds Orthanc takes to answer /system')
+    args = parser.parse_args()
+
+    orthanc = start_orthanc(args.orthanc_latency)
+    # ORTHANC_NAME comes from the URL host, and config.PROJECTS is keyed by 'localhost'
+    orthanc_url = f"http://localhost:{orthanc.server_port}"
+
+    print(f"{'mode':6} {'cold':>8} {'warm p50':>9} {'warm max':>9}")
+    for mode in ('full', 'fast'):
+        with tempfile.TemporaryDirectory(prefix='bench_startup_') as work_dir:
+            database_path = str(Path(work_dir) / 'reviews.db')
+            cold = time_to_first_request(mode, database_path, orthanc_url)
+            warm = sorted(filter(None, (time_to_first_request(mode, database_path, orthanc_url)
+                                        for _ in range(args.runs))))
+        if cold is None or not warm:
+            print(f"{mode:6} the viewer did not answer; run webapp/app.py with STARTUP_MODE={mode} to see why")
+            continue
+        print(f"{mode:6} {cold:7.2f}s {warm[len(warm) // 2]:8.2f}s {warm[-1]:8.2f}s")
+    orthanc.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/bench_sync.py
+"""
+Studies-table write throughput of the Orthanc sync, in rows per second.
+
+A stand-in client answers /tools/find with --studies synthetic studies for one
+project label, so only the database side is measured. Compares:
+
+    per-row    SELECT then INSERT or UPDATE for each study, committing per study
+               (the old sync loop)
+    bulk       OrthancSync.full_scan into an empty studies table
+    upsert     OrthancSync.full_scan over unchanged rows, at each --batch-sizes value
+    changed    OrthancSync.full_scan after every study description changed
+
+Usage:
+    ENVIRONMENT=local python benchmarks/bench_sync.py --studies 50000 --batch-sizes 100,500,5000
+"""
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'webapp'))
+
+from database import Database
+from data_manager import OrthancDataManager
+from orthanc_sync import OrthancSync, study_row
+
+PROJECTS = {'bench': {'label': 'bench'}}
+
+
+class StandinClient:
+    """The two calls a full scan makes, answered from memory"""
+
+    def __init__(self, studies):
+        self.studies = [{
+            'ID': f"study-{i:08d}",
+            'MainDicomTags': {'StudyDate': f"20{i % 7 + 18}{i % 12 + 1:02d}01", 'StudyDescription': 'CT CHEST',
+                              'PatientID': f"P{i}", 'PatientName': f"Patient^{i}"},
+            'Labels': ['bench'],
+        } for i in range(studies)]
+
+    def find(self, labels=None, expand=True):
+        return self.studies if expand else [study['ID'] for study in self.studies]
+
+    def get_json(self, path, params=None):
+        return {'Last': 0, 'Done': True, 'Changes': []}
+
+
+def create_database(work_dir, name):
+    manager = OrthancDataManager.__new__(OrthancDataManager)
+    manager.db = Database(str(Path(work_dir) / name))
+    manager._create_schema()
+    with manager.db.connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO projects (project_id, name) VALUES ('bench', 'Benchmark')")
+    return manager.db
+
+
+def per_row(conn, client):
+    for study in client.find(labels=['bench']):
+        row = study_row(study, 'bench')
+        if conn.execute('SELECT 1 FROM studies WHERE study_id = ? AND project_id = ?', row[:2]).fetchone():
+            conn.execute('''
+                UPDATE studies SET patient_id = ?, patient_name = ?, study_date = ?, study_description = ?,
+                orthanc_id = ? WHERE study_id = ? AND project_id = ?
+            ''', row[2:] + row[:2])
+        else:
+            conn.execute('''
+                INSERT INTO studies (study_id, project_id, patient_id, patient_name, study_date,
+                                     study_description, orthanc_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', row)
+        conn.commit()
+
+
+def report(label, rows, seconds):
+    print(f"{label:18} {rows:8d} rows  {seconds:7.2f}s  {rows / max(seconds, 1e-9):10.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--studies', type=int, default=50000, help='synthetic studies returned by the stand-in')
+    parser.add_argument('--batch-sizes', default='100,500,5000', help='comma-separated rows per transaction')
+    args = parser.parse_args()
+
+    client = StandinClient(args.studies)
+    with tempfile.TemporaryDirectory(prefix='bench_sync_') as work_dir:
+        db = create_database(work_dir, 'per_row.db')
+        with db.connection() as conn:
+            start = time.perf_counter()
+            per_row(conn, client)
+            report('per-row', args.studies, time.perf_counter() - start)
+
+        db = create_database(work_dir, 'sync.db')
+        with db.connection() as conn:
+            stats = OrthancSync(client, PROJECTS).full_scan(conn)
+            report('bulk' if stats['bulk'] else 'upsert (not empty)', stats['rows'], stats['seconds'])
+
+            for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+                stats = OrthancSync(client, PROJECTS, batch_size=batch_size).full_scan(conn)
+                report(f"upsert batch {batch_size}", stats['rows'], stats['seconds'])
+
+            for study in client.studies:
+                study['MainDicomTags']['StudyDescription'] = 'CT CHEST W CONTRAST'
+            stats = OrthancSync(client, PROJECTS).full_scan(conn)
+            report('changed', stats['rows'], stats['seconds'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_transfer_syntax.py
+"""
+Compare network bytes against decode CPU for the transfer syntaxes CT can be downloaded in.
+
+Each syntax downloads the stand-in study once, then reads every CT slice back
+the way DicomHandler does: sequentially (CPU cost) and on DECODE_WORKERS threads
+(wall time during load). Transfer time is estimated for a link of --bandwidth MB/s.
+Compressed syntaxes need their pydicom encoder/decoder plugins installed
+(pylibjpeg-openjpeg or Pillow for JPEG 2000, pyjpegls or pylibjpeg-libjpeg for JPEG-LS).
+
+Usage:
+    python benchmarks/bench_transfer_syntax.py --slices 200 --bandwidth 12.5
+"""
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'webapp'))
+
+from orthanc_standin import OrthancStandIn
+from study_downloader import StudyDownloader, resolve_transfer_syntax
+from dicom_handler import read_ct_slice, DECODE_WORKERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--slices', type=int, default=200, help='CT slices in the synthetic study')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent downloads')
+    parser.add_argument('--bandwidth', type=float, default=12.5, help='link speed in MB/s for the transfer estimate')
+    parser.add_argument('--syntaxes', default='none,rle,jpegls,jpeg2000', help='comma-separated syntaxes to compare')
+    args = parser.parse_args()
+
+    standin = OrthancStandIn(slices=args.slices).start()
+    downloader = StudyDownloader(standin.url, max_workers=args.workers)
+    print(f"Stand-in study: {args.slices} CT slices, link {args.bandwidth:.1f} MB/s, "
+          f"{DECODE_WORKERS} decode threads\n")
+    print(f"{'syntax':10} {'MB':>8} {'ratio':>6} {'transfer':>9} {'decode cpu':>11} {'decode wall':>12} {'total':>8}")
+
+    baseline = None
+    try:
+        for name in args.syntaxes.split(','):
+            uid = resolve_transfer_syntax(name)
+            if name != 'none' and not uid:
+                continue
+            # Transcode ahead of time so only the download itself is measured
+            for instance_id in standin.instances:
+                standin.instance_bytes(instance_id, uid or None)
+
+            work_dir = Path(tempfile.mkdtemp(prefix='bench_syntax_'))
+            try:
+                downloader.sync_study(standin.study_id, work_dir, mode='instances', transfer_syntax=name)
+                ct_files = sorted((work_dir / 'CT').glob('*.dcm'))
+                mb = sum(f.stat().st_size for f in ct_files) / (1024 * 1024)
+                baseline = baseline or mb
+
+                cpu_start = time.process_time()
+                for ct_file in ct_files:
+                    read_ct_slice(ct_file)
+                decode_cpu = time.process_time() - cpu_start
+
+                wall_start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=DECODE_WORKERS) as executor:
+                    list(executor.map(read_ct_slice, ct_files))
+                decode_wall = time.perf_counter() - wall_start
+
+                transfer = mb / args.bandwidth
+                print(f"{name:10} {mb:8.1f} {baseline / mb:6.2f} {transfer:8.2f}s {decode_cpu:10.2f}s "
+                      f"{decode_wall:11.2f}s {transfer + decode_wall:7.2f}s")
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        standin.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+# benchmarks/orthanc_standin.py
+"""
+Minimal in-process stand-in for the parts of the Orthanc REST API the viewer
+downloads from. It serves a synthetic study (CT slices plus an RTSTRUCT) with an
+optional per-request delay to mimic the round trip to the lab server.
+"""
+import io
+import re
+import sys
+import json
+import time
+import zipfile
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'webapp'))
+from study_downloader import orthanc_instance_id
+
+CT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.2'
+RT_STRUCTURE_SET_STORAGE = '1.2.840.10008.5.1.4.1.1.481.3'
+
+
+def _phantom_slice(index, rows, columns):
+    """Stored values for a body-like slice: air, soft tissue with noise and a bone ring"""
+    rng = np.random.default_rng(index)
+    yy, xx = np.mgrid[:rows, :columns]
+    r = ((xx - columns / 2) / (columns * 0.42)) ** 2 + ((yy - rows / 2) / (rows * 0.32)) ** 2
+    pixels = np.zeros((rows, columns), dtype=np.int16)
+    pixels[r <= 1] = 1064 + rng.normal(0, 12, size=int((r <= 1).sum())).astype(np.int16)
+    pixels[(r > 0.55) & (r <= 0.62)] = 1900
+    return pixels
+
+
+def _make_instance(modality, sop_class, patient_id, study_uid, series_uid, index, rows=512, columns=512):
+    """Build one synthetic Part-10 instance and return (orthanc_id, bytes)"""
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = sop_class
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds.SOPClassUID = sop_class
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+    ds.PatientID = patient_id
+    ds.PatientName = 'Standin^Patient'
+    ds.StudyInstanceUID = study_uid
+    ds.SeriesInstanceUID = series_uid
+    ds.Modality = modality
+    ds.InstanceNumber = index + 1
+
+    if modality == 'CT':
+        z = float(index) * 2.5
+        ds.SliceLocation = z
+        ds.ImagePositionPatient = [-250.0, -250.0, z]
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.PixelSpacing = [0.98, 0.98]
+        ds.Rows = rows
+        ds.Columns = columns
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = 'MONOCHROME2'
+        ds.BitsAllocated = 16
+        ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 1
+        ds.RescaleSlope = 1
+        ds.RescaleIntercept = -1024
+        ds.PixelData = _phantom_slice(index, rows, columns).tobytes()
+
+    buffer = io.BytesIO()
+    pydicom.dcmwrite(buffer, ds, enforce_file_format=True)
+    return orthanc_instance_id(ds), buffer.getvalue()
+
+
+class OrthancStandIn:
+    """Serve a synthetic study over HTTP with Orthanc-shaped URLs"""
+
+    def __init__(self, slices=300, latency=0.0, study_id='standin-study'):
+        self.study_id = study_id
+        self.latency = latency
+        self.requests = 0
+        self.instances = {}
+        self.series = {}
+        self.positions = {}
+        self.transcoded = {}
+        self._transcode_lock = threading.Lock()
+
+        patient_id = 'STANDIN001'
+        study_uid = generate_uid()
+        for modality, sop_class, count in (('CT', CT_IMAGE_STORAGE, slices),
+                                           ('RTSTRUCT', RT_STRUCTURE_SET_STORAGE, 1)):
+            series_uid = generate_uid()
+            series_id = f"{modality.lower()}-series"
+            instance_ids = []
+            for index in range(count):
+                instance_id, data = _make_instance(modality, sop_class, patient_id, study_uid, series_uid, index)
+                self.instances[instance_id] = (series_id, data)
+                instance_ids.append(instance_id)
+                if modality == 'CT':
+                    self.positions[instance_id] = f"-250\\-250\\{index * 2.5}"
+            self.series[series_id] = {'MainDicomTags': {'Modality': modality}, 'Instances': instance_ids, 'IsStable': True}
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def total_bytes(self):
+        return sum(len(data) for _, data in self.instances.values())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def build_archive(self, series_ids=None, transfer_syntax=None):
+        """Build an Orthanc-style hierarchical ZIP of the study or selected series"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+            for instance_id, (series_id, data) in self.instances.items():
+                if series_ids and series_id not in series_ids:
+                    continue
+                zf.writestr(f"STANDIN001/{self.study_id}/{series_id}/{instance_id}.dcm",
+                            self.instance_bytes(instance_id, transfer_syntax))
+        return buffer.getvalue()
+
+    def instance_bytes(self, instance_id, transfer_syntax=None):
+        """Instance bytes, transcoded (and cached) when a compressed syntax is requested"""
+        data = self.instances[instance_id][1]
+        if not transfer_syntax:
+            return data
+        key = (instance_id, transfer_syntax)
+        with self._transcode_lock:
+            if key not in self.transcoded:
+                ds = pydicom.dcmread(io.BytesIO(data))
+                if 'PixelData' in ds:
+                    ds.compress(transfer_syntax)
+                buffer = io.BytesIO()
+                pydicom.dcmwrite(buffer, ds, enforce_file_format=True)
+                self.transcoded[key] = buffer.getvalue()
+            return self.transcoded[key]
+
+    def series_metadata(self, series_uid):
+        """DICOM JSON for every instance of a series, with pixel data left as a bulk data URI"""
+        metadata = []
+        for instance_id, (_, data) in self.instances.items():
+            ds = pydicom.dcmread(io.BytesIO(data))
+            if ds.SeriesInstanceUID != series_uid:
+                continue
+            item = ds.to_json_dict(bulk_data_element_handler=lambda elem: f"{self.url}/bulk/{instance_id}",
+                                   bulk_data_threshold=1024)
+            metadata.append(item)
+        return metadata
+
+    def frame(self, sop_uid):
+        """Raw pixel bytes of a single-frame instance"""
+        for _, data in self.instances.values():
+            ds = pydicom.dcmread(io.BytesIO(data))
+            if ds.SOPInstanceUID == sop_uid:
+                return ds.PixelData
+        return None
+
+    def _make_handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, content_type='application/json', status=200):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _begin(self):
+                standin.requests += 1
+                if standin.latency:
+                    time.sleep(standin.latency)
+                return [p for p in urlparse(self.path).path.split('/') if p]
+
+            def do_GET(self):
+                parts = self._begin()
+                if parts == ['studies', standin.study_id]:
+                    return self._send(json.dumps({'ID': standin.study_id, 'Series': list(standin.series)}).encode())
+                if parts[:1] == ['studies'] and parts[2:] in (['archive'], ['media']):
+                    transcode = parse_qs(urlparse(self.path).query).get('transcode', [None])[0]
+                    return self._send(standin.build_archive(transfer_syntax=transcode), 'application/zip')
+                if parts[:1] == ['series'] and len(parts) == 2 and parts[1] in standin.series:
+                    return self._send(json.dumps(standin.series[parts[1]]).encode())
+                if parts[:1] == ['series'] and parts[2:] == ['instances'] and parts[1] in standin.series:
+                    instances = [{'ID': instance_id,
+                                  'MainDicomTags': {'ImagePositionPatient': standin.positions.get(instance_id, '')}}
+                                 for instance_id in standin.series[parts[1]]['Instances']]
+                    return self._send(json.dumps(instances).encode())
+                if parts[:1] == ['dicom-web'] and parts[-1] == 'metadata' and len(parts) == 6:
+                    return self._send(json.dumps(standin.series_metadata(parts[4])).encode(), 'application/dicom+json')
+                if parts[:1] == ['dicom-web'] and len(parts) == 9 and parts[7] == 'frames':
+                    frame = standin.frame(parts[6])
+                    if frame is not None:
+                        boundary = 'standin-boundary'
+                        body = (f"--{boundary}\r\nContent-Type: application/octet-stream\r\n\r\n".encode()
+                                + frame + f"\r\n--{boundary}--\r\n".encode())
+                        return self._send(body, f'multipart/related; type="application/octet-stream"; boundary={boundary}')
+                if parts[:1] == ['instances'] and parts[2:] == ['file'] and parts[1] in standin.instances:
+                    match = re.search(r'transfer-syntax=([0-9.]+)', self.headers.get('Accept', ''))
+                    return self._send(standin.instance_bytes(parts[1], match.group(1) if match else None),
+                                      'application/dicom')
+                self._send(b'Unknown resource', 'text/plain', 404)
+
+            def do_POST(self):
+                parts = self._begin()
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if parts in (['tools', 'create-archive'], ['tools', 'create-media']):
+                    request = json.loads(body or b'{}')
+                    archive = standin.build_archive(set(request.get('Resources', [])), request.get('Transcode'))
+                    return self._send(archive, 'application/zip')
+                self._send(b'Unknown resource', 'text/plain', 404)
+
+        return Handler
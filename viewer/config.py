@@ -32,6 +32,47 @@ ORTHANC_PASSWORD = os.getenv("ORTHANC_PASSWORD")
 # Temporary file storage configuration
 TEMP_ROOT = current_env['temp_root']
 
+# Study download configuration
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 8))  # Concurrent instance downloads per study
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", 3))  # Retries per instance on transient errors
+DOWNLOAD_BACKOFF = float(os.getenv("DOWNLOAD_BACKOFF", 0.5))  # Base backoff in seconds, doubled per retry
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 60))  # Per-request timeout in seconds
+DOWNLOAD_MODE = os.getenv("DOWNLOAD_MODE", "archive")  # 'archive', 'media' or 'instances'
+ORTHANC_POOL_SIZE = int(os.getenv("ORTHANC_POOL_SIZE", 32))  # Keep-alive connections shared by all Orthanc calls
+ORTHANC_CACHE_SIZE = int(os.getenv("ORTHANC_CACHE_SIZE", 4096))  # Orthanc JSON responses kept in memory
+ORTHANC_CACHE_TTL = float(os.getenv("ORTHANC_CACHE_TTL", 30))  # Seconds study JSON, labels and attachments stay cached
+# Mirror each submitted review to Orthanc as a quality_N label and a review attachment (off: reviews stay in SQLite)
+ORTHANC_REVIEW_LABELS = os.getenv("ORTHANC_REVIEW_LABELS", "0").lower() in ("1", "true", "yes")
+# Transfer syntax requested for CT downloads: '' keeps what Orthanc stores, or a lossless
+# compressed syntax ('jpeg2000', 'jpegls', 'rle' or a UID) to cut transfer volume
+DOWNLOAD_TRANSFER_SYNTAX = os.getenv("DOWNLOAD_TRANSFER_SYNTAX", "")
+# Series fetched before a study opens; everything else downloads in the background
+FOREGROUND_MODALITIES = tuple(os.getenv("FOREGROUND_MODALITIES", "CT,RTSTRUCT").split(","))
+CACHE_VERIFY = os.getenv("CACHE_VERIFY", "size")  # How cached instances are checked: 'size' or 'checksum'
+CACHE_QUOTA_GB = float(os.getenv("CACHE_QUOTA_GB", 50))  # Disk budget for downloaded studies
+# Background worker: Orthanc sync period in seconds (0 disables the worker), how many of each
+# reviewer's next unreviewed studies to keep downloaded, and how many of those to keep loaded
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", 300))
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", 3))
+PREFETCH_HANDLERS = int(os.getenv("PREFETCH_HANDLERS", 1))
+# Review database (SQLite, WAL mode): lock wait, page cache, memory map and prepared statements per connection,
+# and how many connections the process-wide pool keeps
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+DB_CACHE_MB = float(os.getenv("DB_CACHE_MB", 16))
+DB_MMAP_MB = float(os.getenv("DB_MMAP_MB", 256))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", 256))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 16))  # Idle connections kept for reuse by later requests
+# Studies rows written per transaction by the Orthanc sync
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", 500))
+# Seconds between label reconciles, which scan every labelled study (Orthanc does not log label edits)
+SYNC_RECONCILE_INTERVAL = float(os.getenv("SYNC_RECONCILE_INTERVAL", 3600))
+# 'fast': skip schema and seed work when the database is current, and check Orthanc in the
+# background; 'full': redo both on every start and refuse to start without Orthanc
+STARTUP_MODE = os.getenv("STARTUP_MODE", "fast")
+# Read landing-page progress from the trigger-maintained project_user_progress counters
+# instead of counting studies per request (worth it for very large projects)
+PROGRESS_COUNTERS = os.getenv("PROGRESS_COUNTERS", "0").lower() in ("1", "true", "yes")
+
 # roi labels from dashboard
 lymphNodesGroup = [
     'LN_Ax_L1_L', 'LN_Ax_L1_R', 'LN_Ax_L2_L', 'LN_Ax_L2_R', 'LN_Ax_L3_L',
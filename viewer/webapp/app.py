@@ -17,9 +17,14 @@ from flask import session
 sys.path.append(str(Path(__file__).parent.parent))
 
 # Now we can import from the parent directory
-from config import ORTHANC_URL, ORTHANC_NAME, DATABASE_NAME, ORTHANC_USERNAME, ORTHANC_PASSWORD, PROJECTS
+from config import ORTHANC_URL, ORTHANC_NAME, DATABASE_NAME, ORTHANC_USERNAME, ORTHANC_PASSWORD, PROJECTS, CACHE_QUOTA_GB, DOWNLOAD_TIMEOUT
+from config import PREFETCH_INTERVAL, PREFETCH_DEPTH, PREFETCH_HANDLERS, ORTHANC_REVIEW_LABELS
 from data_manager import OrthancDataManager
 from dicom_handler import DicomHandler
+from medai_common.streaming import CHUNK_SIZE
+from study_manifest import StudyManifest
+from cache_manager import StudyCacheManager
+from review_prefetcher import ReviewPrefetcher
 from flask import Flask, render_template, jsonify, request, flash, redirect, url_for
 
 app = Flask(__name__)
@@ -30,18 +35,24 @@ app.secret_key = 'dev'  # For flash messages
 BASE_DIR = Path(__file__).parent.parent
 CACHE_DIR = BASE_DIR / 'cache' / ORTHANC_NAME
 TEMP_DIR = BASE_DIR / 'temp' / ORTHANC_NAME
-DATABASE_PATH = os.path.join(BASE_DIR, 'dbs', 'user-tests.db')
+DATABASE_PATH = os.getenv('DATABASE_PATH', os.path.join(BASE_DIR, 'dbs', 'user-tests.db'))
 
 # Create directories if they don't exist
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
 TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
+# Disk quota for CACHE_DIR; studies with a live handler, or leased by a download or handler load, are never evicted
+cache_manager = StudyCacheManager(CACHE_DIR, int(CACHE_QUOTA_GB * 1024 ** 3),
+                                  is_pinned=lambda study_id: study_id in handler_cache)
+
 # Initialize data manager with config
 data_manager = OrthancDataManager(
     orthanc_url=ORTHANC_URL,
     orthanc_username=ORTHANC_USERNAME,
-    orthanc_password=ORTHANC_PASSWORD
+    orthanc_password=ORTHANC_PASSWORD,
+    study_leases=cache_manager
 )
+db = data_manager.db
 
 def create_app():
     print("\nLoading environment:", os.getenv('ENVIRONMENT', 'local'))
@@ -76,28 +87,183 @@ app = create_app()
 # Global cache for DicomHandlers
 dicom_handlers = {}
 handler_cache = {}
+handler_revisions = {}  # Manifest revision each cached handler was loaded from
+streaming_studies = set()  # Studies whose handler is still receiving CT slices
+prebuilt_handlers = set()  # Handlers loaded ahead of time that no reviewer has opened yet
 handler_lock = threading.Lock()
 
+@app.before_request
+def start_background_worker():
+    """Start the sync/prefetch worker and the Orthanc writer in the process that serves requests"""
+    prefetcher.start()
+    data_manager.write_queue.start()
+
 @app.route('/api/sync-data')
 def sync_development_data():
     """Sync development data with Orthanc, storing in database."""
     try:
-        data_manager.sync_development_data()
-        return jsonify({'status': 'success'})   
+        stats = data_manager.sync_development_data(full=request.args.get('full') == '1',
+                                                   labels=True if request.args.get('labels') == '1' else None)
+        return jsonify({'status': 'success', 'sync': stats})
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
     
-def get_or_create_handler(study_id, study_cache, roi_labels=None):
-    """Thread-safe handler creation and caching"""
+def get_or_create_handler(study_id, study_cache, roi_labels=None, revision=None):
+    """Thread-safe handler creation and caching, reloading when the cached study has changed"""
     with handler_lock:
-        if study_id not in handler_cache:
+        stale = revision is not None and handler_revisions.get(study_id) != revision
+        if study_id not in handler_cache or stale:
             handler = DicomHandler(study_id, study_cache, roi_labels, debug=False)
             handler.load_study_data()
             handler_cache[study_id] = handler
+            handler_revisions[study_id] = revision
         return handler_cache[study_id]
+
+
+def open_study(study_id, study_cache, roi_labels=None, lazy=False):
+    """
+    Return a handler for a study, downloading only what the first image needs.
+
+    When CT slices are missing, the handler is built progressively: the RTSTRUCT
+    is fetched first, CT slices stream in nearest the project contours first and
+    each can be rendered as soon as it lands. A study whose manifest is complete
+    opens from disk without asking Orthanc anything; otherwise the study is
+    planned once and that plan drives every download below.
+    With lazy=True nothing but the RTSTRUCT is downloaded and slices are fetched
+    frame by frame over DICOMweb as they are viewed.
+    """
+    with cache_manager.lease(study_id):
+        with handler_lock:
+            # A reviewer has it now, so the prefetcher must not release it
+            prebuilt_handlers.discard(study_id)
+            if (study_id in streaming_studies or lazy) and study_id in handler_cache:
+                return handler_cache[study_id]
+
+        if lazy:
+            handler = open_study_lazy(study_id, study_cache, roi_labels)
+            if handler is not None:
+                return handler
+
+        cache_manager.touch(study_id)
+        if StudyManifest.is_complete(study_cache):
+            revision = StudyManifest.load(study_cache).revision
+            return get_or_create_handler(study_id, study_cache, roi_labels, revision)
+
+        plan = data_manager.plan_study(study_id)
+        progressive = data_manager.plan_progressive_download(study_id, study_cache, roi_labels, plan=plan)
+        if progressive is None:
+            revision = sync_study_cache(study_id, study_cache, plan=plan)
+            return get_or_create_handler(study_id, study_cache, roi_labels, revision)
+
+        ct_slices, priority = progressive
+        handler = DicomHandler(study_id, study_cache, roi_labels, debug=False)
+        handler.load_progressive([(instance_id, z) for instance_id, _, z in ct_slices])
+        with handler_lock:
+            handler_cache[study_id] = handler
+            handler_revisions[study_id] = None
+            streaming_studies.add(study_id)
+
+        data_manager.prefetch_study_files(
+            study_id, study_cache,
+            on_complete=lambda stats: on_study_download_complete(study_id, study_cache, stats),
+            ct_priority=priority,
+            on_instance=lambda instance_id, modality, path: on_instance_downloaded(study_id, instance_id, modality, path),
+            plan=plan
+        )
+        return handler
+
+
+def open_study_lazy(study_id, study_cache, roi_labels=None):
+    """Build a network-backed handler over DICOMweb, or None if the study cannot be opened that way"""
+    data_manager.get_study_files(study_id, study_cache, modalities=('RTSTRUCT',))
+    uids = data_manager.get_dicomweb_ct_series(study_id)
+    if uids is None:
+        return None
+    handler = DicomHandler(study_id, study_cache, roi_labels, debug=False)
+    handler.load_dicomweb(data_manager.dicomweb, *uids)
+    with handler_lock:
+        handler_cache[study_id] = handler
+        # No revision: a later full open replaces the lazy handler
+        handler_revisions[study_id] = None
+    return handler
+
+
+def on_instance_downloaded(study_id, instance_id, modality, path):
+    """Make a CT slice renderable as soon as it has downloaded"""
+    handler = handler_cache.get(study_id)
+    if handler is not None and modality == 'CT':
+        handler.add_ct_slice(instance_id, path)
+
+
+def sync_study_cache(study_id, study_cache, plan=None):
+    """
+    Fetch what the first image needs (CT and RTSTRUCT) and return the manifest
+    revision; dose and other series keep downloading in the background
+    """
+    # Mark the study as opened first so a concurrent eviction does not pick it mid-sync
+    cache_manager.touch(study_id)
+    data_manager.get_study_files_staged(
+        study_id, study_cache,
+        on_complete=lambda stats: on_study_download_complete(study_id, study_cache, stats),
+        plan=plan
+    )
+    manifest = StudyManifest.load(study_cache)
+    cache_manager.record(study_id, manifest.total_bytes)
+    return manifest.revision
+
+
+def on_study_download_complete(study_id, study_cache, stats):
+    """Hand series that arrived in the background (e.g. RTDOSE) to the live handler"""
+    manifest = StudyManifest.load(study_cache)
+    cache_manager.record(study_id, manifest.total_bytes)
+    with handler_lock:
+        streaming_studies.discard(study_id)
+    handler = handler_cache.get(study_id)
+    if handler is None:
+        return
+    # Resampling the dose can take a while, so it runs outside handler_lock
+    if handler.dose is None and (study_cache / 'RTDOSE').exists():
+        handler.refresh_dose()
+        print(f"Loaded background RTDOSE for study {study_id}")
+    with handler_lock:
+        # The handler now reflects the complete study, so the next open need not rebuild it
+        if handler_cache.get(study_id) is handler:
+            handler_revisions[study_id] = manifest.revision
+    
+def warm_study(study_id, project_id, build):
+    """Prefetcher hook: download a study in full and optionally load its handler"""
+    with cache_manager.lease(study_id):
+        study_cache = CACHE_DIR / study_id
+        if not StudyManifest.is_complete(study_cache):
+            if data_manager.get_study_files(study_id, study_cache) is None:
+                return False
+            cache_manager.record(study_id, StudyManifest.load(study_cache).total_bytes)
+        if build:
+            with handler_lock:
+                if study_id in handler_cache:
+                    return True
+            revision = StudyManifest.load(study_cache).revision
+            get_or_create_handler(study_id, study_cache, get_cached_roi_labels(project_id), revision)
+            with handler_lock:
+                prebuilt_handlers.add(study_id)
+        return True
+
+
+def release_study(study_id):
+    """Prefetcher hook: drop a prebuilt handler nobody opened"""
+    with handler_lock:
+        if study_id in prebuilt_handlers:
+            prebuilt_handlers.discard(study_id)
+            handler_cache.pop(study_id, None)
+            handler_revisions.pop(study_id, None)
+
+
+# Periodic Orthanc sync and warm-up of each reviewer's next studies
+prefetcher = ReviewPrefetcher(data_manager, db, warm_study, release_study,
+                              interval=PREFETCH_INTERVAL, depth=PREFETCH_DEPTH, build=PREFETCH_HANDLERS)
     
 # Add cleanup route for handler cache
 @app.route('/api/cleanup-cache', methods=['POST'])
@@ -106,7 +272,12 @@ def cleanup_handler_cache():
     try:
         with handler_lock:
             handler_cache.clear()
-        return jsonify({'status': 'success'})
+            handler_revisions.clear()
+            streaming_studies.clear()
+            prebuilt_handlers.clear()
+        # Studies unpinned by clearing the handlers can now be evicted
+        evicted = cache_manager.enforce_quota()
+        return jsonify({'status': 'success', 'evicted': len(evicted)})
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -120,6 +291,12 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'cache_size': len(handler_cache),
+        'disk_cache': cache_manager.get_stats(),
+        'prefetch': prefetcher.get_stats(),
+        'orthanc_cache': data_manager.client.cache_stats(),
+        'orthanc_writes': data_manager.write_queue.get_stats(),
+        'database': db.get_stats(),
+        'orthanc': data_manager.orthanc_status(),
         'memory_usage': get_memory_usage()
     })
 
@@ -145,7 +322,7 @@ def get_slice_image(study_id, slice_index):
             print(f"Loading from cache: {study_cache}")
             
             # Get project ROI labels for this study
-            with sqlite3.connect(DATABASE_PATH) as conn:
+            with db.connection() as conn:
                 cursor = conn.cursor()
                 study = cursor.execute("""
                     SELECT project_id FROM studies WHERE study_id = ?
@@ -193,7 +370,7 @@ def index():
         data_manager.init_projects()
         
         # Get all users for the dropdown
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             conn.row_factory = sqlite3.Row
             users = conn.execute('SELECT * FROM users').fetchall()
         
@@ -222,7 +399,7 @@ def set_user():
     user_id = request.form.get('user_id')
     if user_id:
         user_id = int(user_id)
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             conn.row_factory = sqlite3.Row
             user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
             if user:
@@ -279,7 +456,7 @@ def review_project_study(project_id, study_id):
     """Review a specific study within a project"""
     try:
         # Get study from database with project validation
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             conn.row_factory = sqlite3.Row
             study = conn.execute('''
                 SELECT * FROM studies 
@@ -295,13 +472,12 @@ def review_project_study(project_id, study_id):
         # Get ROI labels - use caching
         roi_labels = get_cached_roi_labels(project_id)
         
-        # Get study files if needed
+        # Fetch whatever the cached copy is missing (nothing, once it is complete and current)
         study_cache = CACHE_DIR / study_id
-        if not study_cache.exists():
-            data_manager.get_study_files(study_id, study_cache)
         
-        # Initialize handler to get total slices
-        handler = get_or_create_handler(study_id, study_cache, roi_labels)
+        # Initialize handler to get total slices; missing CT slices keep streaming in.
+        # ?lazy=1 fetches only the slices that are viewed, over DICOMweb
+        handler = open_study(study_id, study_cache, roi_labels, lazy=request.args.get('lazy') == '1')
         total_slices = len(handler.series_data) if handler.series_data else 0
         first_slice = handler.find_first_contour_slice()
         
@@ -328,7 +504,7 @@ def prepare_study(project_id, study_id):
     """Prepare study files for viewing"""
     try:
         # Verify study belongs to project
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             cursor = conn.cursor()
             study = cursor.execute("""
                 SELECT study_id 
@@ -345,12 +521,9 @@ def prepare_study(project_id, study_id):
         # Get study cache path
         study_cache = CACHE_DIR / study_id
         
-        # Only proceed if files aren't already cached
-        if not study_cache.exists():
-            data_manager.get_study_files(study_id, study_cache)
-
+        # Resumes an interrupted download and picks up series added since the last visit
         roi_labels = get_cached_roi_labels(project_id)
-        handler = get_or_create_handler(study_id, study_cache, roi_labels)
+        handler = open_study(study_id, study_cache, roi_labels)
 
         return jsonify({
             'status': 'success',
@@ -368,7 +541,7 @@ def prepare_study(project_id, study_id):
 def get_cached_roi_labels(project_id):
     """Get cached ROI labels for a project"""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             cursor = conn.cursor()
             result = cursor.execute("""
                 SELECT roi_labels 
@@ -385,27 +558,24 @@ def get_raw_dicom_slice(study_id, slice_index):
     """Get a specific slice from the study as raw DICOM data"""
     try:
         # Get series list
-        response = data_manager.session.get(f"{data_manager.orthanc_url}/studies/{study_id}/series")
-        series_list = response.json()
+        series_list = data_manager.client.get_json(f"/studies/{study_id}/series")
         
         # Get first series instances
-        response = data_manager.session.get(f"{data_manager.orthanc_url}/series/{series_list[0]}/instances")
-        instances = response.json()
+        instances = data_manager.client.get_json(f"/series/{series_list[0]['ID']}/instances")
         
         if slice_index >= len(instances):
             return "Slice index out of range", 404
             
         # Get specific instance
-        instance_id = instances[slice_index]
+        instance_id = instances[slice_index]['ID']
         
         # Get DICOM data
-        response = data_manager.session.get(
-            f"{data_manager.orthanc_url}/instances/{instance_id}/file", 
-            stream=True
-        )
+        response = data_manager.client.get(f"/instances/{instance_id}/file", stream=True)
+        response.raise_for_status()
         
+        # Relay the instance in chunks instead of buffering it in memory
         return Response(
-            response.raw.read(),
+            response.iter_content(chunk_size=CHUNK_SIZE),
             content_type='application/dicom',
             headers={'X-Content-Type-Options': 'nosniff'}
         )
@@ -419,12 +589,10 @@ def get_slice_count(study_id):
     """Get the total number of slices in a study"""
     try:
         # Get series list
-        response = data_manager.session.get(f"{data_manager.orthanc_url}/studies/{study_id}/series")
-        series_list = response.json()
+        series_list = data_manager.client.get_json(f"/studies/{study_id}/series")
         
         # Get first series instances
-        response = data_manager.session.get(f"{data_manager.orthanc_url}/series/{series_list[0]}/instances")
-        instances = response.json()
+        instances = data_manager.client.get_json(f"/series/{series_list[0]['ID']}/instances")
         
         return jsonify({'count': len(instances)})
         
@@ -491,14 +659,17 @@ def get_slice(study_id, slice_index):
         # Get study cache path
         study_cache = CACHE_DIR / study_id
         
-        # Ensure cache directory exists
-        if not study_cache.exists():
-            with handler_lock:  # Thread-safe file operations
-                if not study_cache.exists():
-                    data_manager.get_study_files(study_id, study_cache)
+        # Get handler from cache, opening the study if this is the first request for it
+        handler = handler_cache.get(study_id)
+        if handler is None:
+            handler = open_study(study_id, study_cache)
         
-        # Get handler from cache
-        handler = get_or_create_handler(study_id, study_cache)
+        # While a study streams in, wait for this slice rather than failing
+        if not handler.wait_for_slice(slice_index, timeout=DOWNLOAD_TIMEOUT):
+            return jsonify({
+                'status': 'pending',
+                'message': 'Slice is still downloading'
+            }), 503
         
         # Get the slice image
         result = handler.get_slice_image(
@@ -534,7 +705,7 @@ def get_study_info(study_id):
         dicom_handler = DicomHandler(study_id, study_cache)
         
         if not dicom_handler.is_loaded():
-            data_manager.get_study_files(study_id, study_cache)
+            sync_study_cache(study_id, study_cache)
             dicom_handler.load_study_data()
             
         return jsonify(dicom_handler.get_series_info())
@@ -586,7 +757,7 @@ def submit_review():
 
         current_date = date.today()
         review_data['review_date'] = current_date
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             conn.execute('BEGIN TRANSACTION')
             
             # Update user-specific study status
@@ -618,8 +789,22 @@ def submit_review():
                 review_data.get('comments', '')
             ))
             
+            if ORTHANC_REVIEW_LABELS:
+                # Orthanc labels and the review attachment are written behind, committed with the review
+                data_manager.write_queue.set_quality_label(conn, review_data['study_id'], review_data['quality'], review={
+                    'quality_rating': review_data['quality'],
+                    'issues': review_data.get('issues', ''),
+                    'comments': review_data.get('comments', ''),
+                    'reviewer': session.get('username', 'Unknown'),
+                    'review_date': current_date.isoformat()
+                })
+            
             conn.commit()
             
+        if ORTHANC_REVIEW_LABELS:
+            data_manager.write_queue.wake()
+        # The reviewer's queue moved on; warm their next study now
+        prefetcher.wake()
         return jsonify({
             'status': 'success',
             'message': 'Review submitted successfully'
@@ -655,7 +840,7 @@ def check_database():
             
         print("Database file found: reviews.db")
         
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             cursor = conn.cursor()
             
             # Get all tables
@@ -731,7 +916,7 @@ def get_review(study_id):
                 'message': 'No user selected'
             }), 401
 
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             cursor = conn.cursor()
             
             # Get review with user information
@@ -792,44 +977,15 @@ def get_next_study(project_id, current_study_id):
                 'message': 'No user selected'
             }), 401
 
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            cursor = conn.cursor()
-            
-            # Get next unreviewed study using user_study_status table
-            next_study = cursor.execute("""
-                SELECT s.study_id
-                FROM studies s
-                LEFT JOIN user_study_status uss ON 
-                    s.study_id = uss.study_id 
-                    AND s.project_id = uss.project_id
-                    AND uss.user_id = ?
-                WHERE s.project_id = ?
-                AND (uss.status IS NULL OR uss.status != 'reviewed')
-                AND s.study_id > ?
-                ORDER BY s.study_id
-                LIMIT 1
-            """, (user_id, project_id, current_study_id)).fetchone()
-            
-            if not next_study:
-                # If no studies after current one, try from beginning
-                next_study = cursor.execute("""
-                    SELECT s.study_id
-                    FROM studies s
-                    LEFT JOIN user_study_status uss ON 
-                        s.study_id = uss.study_id 
-                        AND s.project_id = uss.project_id
-                        AND uss.user_id = ?
-                    WHERE s.project_id = ?
-                    AND (uss.status IS NULL OR uss.status != 'reviewed')
-                    AND s.study_id < ?
-                    ORDER BY s.study_id
-                    LIMIT 1
-                """, (user_id, project_id, current_study_id)).fetchone()
-            
-            return jsonify({
-                'status': 'success',
-                'next_study_id': next_study[0] if next_study else None
-            })
+        # Seek in the reviewer's queue; ?count=K also returns the studies after it for warming
+        count = max(1, min(request.args.get('count', 1, type=int), 50))
+        next_study_ids = data_manager.get_next_studies(user_id, project_id, current_study_id, count)
+        
+        return jsonify({
+            'status': 'success',
+            'next_study_id': next_study_ids[0] if next_study_ids else None,
+            'next_study_ids': next_study_ids
+        })
             
     except Exception as e:
         print(f"Error getting next study: {str(e)}")
@@ -839,11 +995,37 @@ def get_next_study(project_id, current_study_id):
             'message': str(e)
         }), 500
     
+@app.route('/api/project/<project_id>/priority', methods=['POST'])
+def set_study_priority(project_id):
+    """Set the review queue priority of studies, e.g. {"study_ids": [...], "priority": 1} for studies with contours"""
+    try:
+        data = request.get_json() or {}
+        study_ids = data.get('study_ids') or []
+        if not study_ids or not isinstance(data.get('priority'), int):
+            return jsonify({
+                'status': 'error',
+                'message': 'study_ids and an integer priority are required'
+            }), 400
+        
+        updated = data_manager.set_study_priority(project_id, study_ids, data['priority'])
+        return jsonify({
+            'status': 'success',
+            'updated': updated
+        })
+        
+    except Exception as e:
+        print(f"Error setting study priority: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @app.route('/api/study/<study_id>/reset', methods=['POST'])
 def reset_study_status(study_id):
     """Reset a study's review status to unreviewed"""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             cursor = conn.cursor()
             
             # Update study status back to unreviewed
@@ -876,12 +1058,35 @@ def reset_study_status(study_id):
             'message': str(e)
         }), 500
 
+@app.route('/api/study/<study_id>/transfer-syntax', methods=['POST'])
+def set_study_transfer_syntax(study_id):
+    """Switch the transfer syntax used for a study's future CT downloads"""
+    try:
+        data = request.get_json() or {}
+        transfer_syntax = data_manager.set_study_transfer_syntax(
+            study_id, CACHE_DIR / study_id, data.get('transfer_syntax', ''))
+        if transfer_syntax is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Failed to update transfer syntax'
+            }), 500
+        return jsonify({
+            'status': 'success',
+            'transfer_syntax': transfer_syntax or 'as stored'
+        })
+    except Exception as e:
+        print(f"Error setting transfer syntax: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @app.route('/api/project/<project_id>/update-roi-labels', methods=['POST'])
 def update_project_roi_labels(project_id):
     """Update ROI labels for a project"""
     try:
         # First verify project exists
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             cursor = conn.cursor()
             project = cursor.execute("""
                 SELECT project_id FROM projects WHERE project_id = ?
@@ -931,7 +1136,7 @@ def update_project_roi_labels(project_id):
 def check_roi_labels():
     """Debug endpoint to check ROI labels in projects"""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             cursor = conn.cursor()
             projects = cursor.execute("""
                 SELECT project_id, roi_labels
@@ -970,59 +1175,15 @@ def get_project_summary(project_id):
                 'message': 'No user selected'
             }), 401
 
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        # Rating counts and issues come from the trigger-maintained summary tables
+        quality = data_manager.get_quality_summary(project_id, user_id)
+        common_issues = data_manager.get_common_issues(project_id, user_id, limit=5)
+        
+        with db.connection() as conn:
             conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Get quality distribution for current user
-            quality_dist = cursor.execute('''
-                SELECT quality_rating, COUNT(*) as count
-                FROM reviews
-                WHERE project_id = ? AND user_id = ?
-                GROUP BY quality_rating
-                ORDER BY quality_rating
-            ''', (project_id, user_id)).fetchall()
-            
-            # Format quality distribution
-            quality_distribution = {
-                str(i): 0 for i in range(1, 6)  # Initialize all ratings with 0
-            }
-            for row in quality_dist:
-                quality_distribution[str(row['quality_rating'])] = row['count']
-            
-            # Get common issues for current user
-            issues_data = cursor.execute('''
-                SELECT issues
-                FROM reviews
-                WHERE project_id = ? 
-                AND user_id = ?
-                AND issues IS NOT NULL 
-                AND issues != ''
-            ''', (project_id, user_id)).fetchall()
-            
-            # Process and count issues
-            issues_count = {}
-            for row in issues_data:
-                issue = row['issues'].strip().lower()
-                if issue:
-                    issues_count[issue] = issues_count.get(issue, 0) + 1
-            
-            # Sort issues by frequency
-            common_issues = dict(sorted(
-                issues_count.items(), 
-                key=lambda x: x[1], 
-                reverse=True
-            )[:5])  # Get top 5 most common issues
-            
-            # Get total reviews for percentages for current user
-            total_reviews = cursor.execute('''
-                SELECT COUNT(*) as count
-                FROM reviews
-                WHERE project_id = ? AND user_id = ?
-            ''', (project_id, user_id)).fetchone()['count']
             
             # Get user's name for the summary
-            username = cursor.execute('''
+            username = conn.execute('''
                 SELECT username 
                 FROM users 
                 WHERE user_id = ?
@@ -1031,9 +1192,9 @@ def get_project_summary(project_id):
             return jsonify({
                 'status': 'success',
                 'summary': {
-                    'quality_distribution': quality_distribution,
+                    'quality_distribution': quality['distribution'],
                     'common_issues': common_issues,
-                    'total_reviews': total_reviews,
+                    'total_reviews': quality['total_reviews'],
                     'username': username,
                     'quality_labels': {
                         '1': 'Unusable',
@@ -1056,7 +1217,7 @@ def get_project_summary(project_id):
 def check_stats():
     """Admin endpoint to check database stats"""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with db.connection() as conn:
             conn.row_factory = sqlite3.Row
             stats = {
                 'projects': {},
@@ -0,0 +1,162 @@
+# webapp/cache_manager.py
+import os
+import json
+import uuid
+import shutil
+import threading
+from pathlib import Path
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from study_manifest import MANIFEST_FILE
+
+# Evicted study folders are renamed to this prefix, then deleted outside the lock
+EVICTING_PREFIX = '.evicting-'
+
+
+class StudyCacheManager:
+    """
+    Keeps CACHE_DIR/<study_id> folders under a disk quota.
+
+    Studies are kept in least-recently-opened order and their sizes come from
+    the study manifests as they are synced, so the tree is only walked once at
+    startup (and only for folders without a manifest). When usage goes over the
+    quota the oldest studies are deleted, skipping any the is_pinned callback
+    reports as in use (e.g. studies with a live DicomHandler) and any under a
+    lease. Downloads and handler loads hold a lease on their study for as long
+    as they write or read its folder, so it is never removed mid-write.
+    """
+
+    def __init__(self, cache_dir, quota_bytes, is_pinned=None):
+        self.cache_dir = Path(cache_dir)
+        self.quota_bytes = quota_bytes
+        self.is_pinned = is_pinned or (lambda study_id: False)
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.used_bytes = 0
+        self._sizes = OrderedDict()
+        self._leases = Counter()
+        self._lock = threading.Lock()
+        self._scan()
+
+    def _scan(self):
+        """Load existing studies, oldest first by last-opened time"""
+        entries = []
+        if self.cache_dir.exists():
+            for study_dir in self.cache_dir.iterdir():
+                if study_dir.name.startswith(EVICTING_PREFIX):
+                    # Left by a restart during an eviction
+                    shutil.rmtree(study_dir, ignore_errors=True)
+                elif study_dir.is_dir():
+                    entries.append((study_dir.stat().st_mtime, study_dir.name, _study_size(study_dir)))
+        for _, study_id, size in sorted(entries):
+            self._sizes[study_id] = size
+            self.used_bytes += size
+        print(f"Study cache: {len(self._sizes)} studies, {self.used_bytes / 1024 ** 3:.2f} GB "
+              f"of {self.quota_bytes / 1024 ** 3:.2f} GB quota")
+
+    def touch(self, study_id):
+        """Mark a study as just opened"""
+        with self._lock:
+            if study_id in self._sizes:
+                self._sizes.move_to_end(study_id)
+        study_dir = self.cache_dir / study_id
+        if study_dir.exists():
+            # The folder mtime carries the LRU order across restarts
+            os.utime(study_dir)
+
+    def record(self, study_id, size):
+        """Record a study's size after a sync, mark it opened and enforce the quota"""
+        with self._lock:
+            self.used_bytes += size - self._sizes.get(study_id, 0)
+            self._sizes[study_id] = size
+            self._sizes.move_to_end(study_id)
+        self.touch(study_id)
+        return self.enforce_quota(keep=study_id)
+
+    def acquire(self, study_id):
+        """Protect a study from eviction until the matching release()"""
+        # Taken under the eviction lock, so a study being evicted right now is gone before this returns
+        with self._lock:
+            self._leases[study_id] += 1
+
+    def release(self, study_id):
+        with self._lock:
+            self._leases[study_id] -= 1
+            if self._leases[study_id] <= 0:
+                del self._leases[study_id]
+
+    @contextmanager
+    def lease(self, study_id):
+        """Hold a lease on a study for the duration of a with block"""
+        self.acquire(study_id)
+        try:
+            yield
+        finally:
+            self.release(study_id)
+
+    def _in_use(self, study_id):
+        return study_id in self._leases or self.is_pinned(study_id)
+
+    def forget(self, study_id):
+        """Drop a study removed by other means (e.g. project cleanup)"""
+        with self._lock:
+            self.used_bytes -= self._sizes.pop(study_id, 0)
+
+    def enforce_quota(self, keep=None):
+        """Evict least-recently-opened studies that are neither pinned nor leased until usage is within the quota"""
+        evicted, doomed = [], []
+        with self._lock:
+            if self.used_bytes <= self.quota_bytes:
+                return evicted
+            for study_id in list(self._sizes):
+                if self.used_bytes <= self.quota_bytes:
+                    break
+                if study_id == keep or self._in_use(study_id):
+                    continue
+                size = self._sizes.pop(study_id)
+                # Only a rename happens under the lock: a lease taken next finds no folder
+                # rather than a half-deleted one, and the slow delete runs after release
+                doomed_dir = self.cache_dir / f"{EVICTING_PREFIX}{study_id}-{uuid.uuid4().hex[:8]}"
+                try:
+                    os.rename(self.cache_dir / study_id, doomed_dir)
+                    doomed.append(doomed_dir)
+                except FileNotFoundError:
+                    pass
+                self.used_bytes -= size
+                self.evictions += 1
+                self.evicted_bytes += size
+                evicted.append(study_id)
+            used = self.used_bytes
+
+        for doomed_dir in doomed:
+            shutil.rmtree(doomed_dir, ignore_errors=True)
+        if evicted:
+            print(f"Evicted {len(evicted)} studies from cache, {used / 1024 ** 3:.2f} GB in use")
+        if used > self.quota_bytes:
+            print(f"Study cache over quota ({used / 1024 ** 3:.2f} GB): remaining studies are in use")
+        return evicted
+
+    def get_stats(self):
+        """Usage statistics for the health endpoint"""
+        with self._lock:
+            used = self.used_bytes
+            pinned = sum(1 for study_id in self._sizes if self._in_use(study_id))
+            return {
+                'studies': len(self._sizes),
+                'pinned': pinned,
+                'leased': len(self._leases),
+                'used_gb': round(used / 1024 ** 3, 3),
+                'quota_gb': round(self.quota_bytes / 1024 ** 3, 3),
+                'used_percent': round(100.0 * used / self.quota_bytes, 1) if self.quota_bytes else None,
+                'evictions': self.evictions,
+                'evicted_gb': round(self.evicted_bytes / 1024 ** 3, 3)
+            }
+
+
+def _study_size(study_dir):
+    """Size of a cached study, from its manifest when it has one"""
+    try:
+        return json.loads((study_dir / MANIFEST_FILE).read_text())['total_bytes']
+    except (OSError, ValueError, KeyError):
+        return sum(f.stat().st_size for f in study_dir.rglob('*') if f.is_file())
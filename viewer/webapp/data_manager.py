@@ -1,30 +1,92 @@
 import requests
 from datetime import datetime
 import json
-from config import ORTHANC_URL, ORTHANC_NAME, ORTHANC_USERNAME, ORTHANC_PASSWORD, DATABASE_NAME, PROJECTS
+from config import ORTHANC_URL, ORTHANC_NAME, ORTHANC_USERNAME, ORTHANC_PASSWORD, DATABASE_NAME, PROJECTS, DOWNLOAD_MODE, FOREGROUND_MODALITIES
+from config import DOWNLOAD_TIMEOUT, DOWNLOAD_RETRIES, DOWNLOAD_BACKOFF, ORTHANC_POOL_SIZE, ORTHANC_CACHE_SIZE, ORTHANC_CACHE_TTL
+from config import PROGRESS_COUNTERS, SYNC_BATCH_SIZE, SYNC_RECONCILE_INTERVAL, STARTUP_MODE
 import tempfile
 import traceback
+import hashlib
+import time
 from pathlib import Path
 import os
 import shutil
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from study_downloader import StudyDownloader, contour_z_range, contour_priority, resolve_transfer_syntax
+from study_manifest import StudyManifest
+from dicomweb_client import DicomWebClient
+from orthanc_sync import OrthancSync
+from medai_common.orthanc_client import OrthancClient
+from orthanc_writer import OrthancWriteQueue, QUALITY_LABELS
+from database import Database
+from migrations import migrate, fts_match_query, SCHEMA_VERSION
+import review_queue
+from medai_common.streaming import download_to_file
 
 # Define base directories
 BASE_DIR = Path(__file__).resolve().parent.parent
 PROJECTS_DIR = os.path.join(BASE_DIR, 'projects')
 TEMP_DIR = os.path.join(BASE_DIR, 'temp')
 # DATABASE_PATH = os.path.join(BASE_DIR, 'dbs', DATABASE_NAME)
-DATABASE_PATH = os.path.join(BASE_DIR, 'dbs', 'user-tests.db')
+DATABASE_PATH = os.getenv('DATABASE_PATH', os.path.join(BASE_DIR, 'dbs', 'user-tests.db'))
+
+# Seeded on a new database, and again whenever they or the config projects change
+DEFAULT_USERS = [
+    ('admin', 'admin123', 'admin'),
+    ('mcbethr', 'mcbethr', 'reviewer'),
+    ('ross', 'ross', 'reviewer'),
+    ('medai', 'medai', 'reviewer'),
+]
+DEFAULT_ASSIGNMENTS = {
+    1: ['Nov24test', 'Dec24study'],  # admin gets these projects
+    2: ['q2ln3', '2425Q2_HN_Nodes'],  # reviewer1 gets these
+    3: ['2425Q2_HN_Nodes'],  # reviewer2 gets this one
+    4: ['medai', 'planning', 'contouring']  # reviewer3 gets this one
+}
 class OrthancDataManager:
-    def __init__(self, orthanc_url, orthanc_username, orthanc_password):
-        """Initialize OrthancDataManager"""
+    def __init__(self, orthanc_url, orthanc_username, orthanc_password, study_leases=None):
+        """Initialize OrthancDataManager; study_leases (a StudyCacheManager) keeps studies being downloaded from eviction"""
         self.orthanc_url = orthanc_url
         self.orthanc_username = orthanc_username
         self.orthanc_password = orthanc_password
+        self.study_leases = study_leases
+        
+        # One pooled, retrying client for every Orthanc call made by the viewer
+        self.client = OrthancClient(
+            orthanc_url,
+            auth=(orthanc_username, orthanc_password) if orthanc_username else None,
+            timeout=DOWNLOAD_TIMEOUT,
+            retries=DOWNLOAD_RETRIES,
+            backoff=DOWNLOAD_BACKOFF,
+            pool_size=ORTHANC_POOL_SIZE,
+            cache_size=ORTHANC_CACHE_SIZE
+        )
+        self.session = self.client.session
+        
+        # Parallel downloader for study instances
+        self.downloader = StudyDownloader(orthanc_url, client=self.client)
+        
+        # WADO-RS access for reviewers who only look at a few slices
+        self.dicomweb = DicomWebClient(f"{orthanc_url}/dicom-web", session=self.session)
         
-        # Initialize session for requests
-        self.session = requests.Session()
-        self.session.auth = (orthanc_username, orthanc_password)
+        # Background downloads of the modalities the first image does not need
+        self.background_downloads = ThreadPoolExecutor(max_workers=2, thread_name_prefix='study-prefetch')
+        self._pending_downloads = {}
+        self._pending_lock = threading.Lock()
+        
+        # Incremental studies table sync from the Orthanc /changes log
+        self.sync = OrthancSync(self.client, PROJECTS[ORTHANC_NAME], name=ORTHANC_NAME, batch_size=SYNC_BATCH_SIZE,
+                                reconcile_interval=SYNC_RECONCILE_INTERVAL,
+                                on_study_changed=lambda study_id: StudyManifest.mark_stale(self.cache_dir / study_id))
+        
+        # Pooled WAL-mode connections to the review database
+        self.db = Database(DATABASE_PATH)
+        
+        # Label and attachment writes are applied to Orthanc in the background
+        self.write_queue = OrthancWriteQueue(self.client, self.db)
         
         # Define cache directories
         self.cache_dir = Path(BASE_DIR) / 'cache' / ORTHANC_NAME
@@ -33,26 +95,52 @@ class OrthancDataManager:
         # Initialize SQLite database
         self._init_db()
         
-        # Test connection
-        self._test_connection()
+        # Test connection; in fast startup mode the check runs in the background
+        # and its result is reported by orthanc_status()
+        self._orthanc_status = {'connected': None, 'error': None, 'checked': None}
+        if STARTUP_MODE == 'fast':
+            threading.Thread(target=self._test_connection, kwargs={'raise_errors': False},
+                             name='orthanc-check', daemon=True).start()
+        else:
+            self._test_connection()
 
     def _init_db(self):
-        """Initialize database if it doesn't exist"""
+        """Initialize database if it doesn't exist, or bring its schema and seed data up to date"""
         # db_file = Path(DATABASE_NAME)
         db_file = Path(DATABASE_PATH)
         
         # Only initialize if database doesn't exist
         if not db_file.exists():
             print("\nCreating new database...")
+            db_file.parent.mkdir(parents=True, exist_ok=True)
             self._create_schema()
+        elif STARTUP_MODE == 'fast' and self._schema_is_current():
+            print("\nUsing existing database (schema and seed data are current)")
         else:
             print("\nUsing existing database")
             self._create_schema()
 
+    def _seed_fingerprint(self):
+        """Hash of everything _create_schema writes: schema version, default users and assignments, config projects"""
+        seed = [SCHEMA_VERSION, DEFAULT_USERS, DEFAULT_ASSIGNMENTS, PROJECTS[ORTHANC_NAME]]
+        return hashlib.sha1(json.dumps(seed, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _schema_is_current(self):
+        """True when _create_schema last ran with the current migrations, defaults and projects"""
+        try:
+            with self.db.connection() as conn:
+                if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                    return False
+                row = conn.execute("SELECT value FROM sync_state WHERE name = 'seed'").fetchone()
+                return row is not None and row[0] == self._seed_fingerprint()
+        except sqlite3.OperationalError:
+            # No sync_state table yet
+            return False
+
     def _create_schema(self):
         """Create database schema"""
         print("\nInitializing database...")
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             # Create tables if they don't exist
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -123,6 +211,35 @@ class OrthancDataManager:
                 )
             ''')
 
+            # Orthanc /changes cursor and other sync bookkeeping
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    name TEXT PRIMARY KEY,
+                    value TEXT,
+                    updated TEXT
+                )
+            ''')
+
+            # Label and attachment updates waiting to be written to Orthanc
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS orthanc_writes (
+                    write_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    study_id TEXT NOT NULL,
+                    op TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    payload TEXT,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt REAL DEFAULT 0,
+                    last_error TEXT,
+                    created TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_orthanc_writes_pending
+                ON orthanc_writes (status, next_attempt)
+            ''')
+
              # Add user_projects table for project assignments
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS user_projects (
@@ -135,14 +252,10 @@ class OrthancDataManager:
             ''')
 
             # Insert some default users
-            conn.execute('''
+            conn.executemany('''
                 INSERT OR IGNORE INTO users (username, password, role)
-                VALUES 
-                    ('admin', 'admin123', 'admin'),
-                    ('mcbethr', 'mcbethr', 'reviewer'),
-                    ('ross', 'ross', 'reviewer'),
-                    ('medai', 'medai', 'reviewer')
-            ''')
+                VALUES (?, ?, ?)
+            ''', DEFAULT_USERS)
 
             
             # Initialize default projects if they don't exist
@@ -160,8 +273,18 @@ class OrthancDataManager:
                 ))
             
             conn.commit()
+            
+            # Indexes and later schema changes, tracked by PRAGMA user_version
+            migrate(conn)
         self.init_user_projects()
 
+        # Lets the next fast startup skip all of the above
+        with self.db.connection() as conn:
+            conn.execute('''
+                INSERT INTO sync_state (name, value, updated) VALUES ('seed', ?, datetime('now', 'localtime'))
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated = excluded.updated
+            ''', (self._seed_fingerprint(),))
+
     def _get_default_study_info(self):
         """Return default study information when actual data cannot be retrieved"""
         return {
@@ -174,18 +297,33 @@ class OrthancDataManager:
             'modality': 'Unknown'
         }
 
-    def _test_connection(self):
+    def _test_connection(self, raise_errors=True):
         """Test connection to Orthanc server"""
         try:
-            response = requests.get(
-                f"{self.orthanc_url}/system",
-                auth=(self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-            )
-            response.raise_for_status()
+            self.client.get_json('/system')
+            self._orthanc_status = {'connected': True, 'error': None, 'checked': time.time()}
             return True
         except Exception as e:
             print(f"Failed to connect to Orthanc: {str(e)}")
-            raise
+            self._orthanc_status = {'connected': False, 'error': str(e), 'checked': time.time()}
+            if raise_errors:
+                raise
+            return False
+
+    def orthanc_status(self):
+        """Result of the last Orthanc connection check ('connected' is None while it is still running)"""
+        return dict(self._orthanc_status)
+
+    def find_studies(self, labels, labels_constraint='All', expand=True, page_size=1000):
+        """
+        Bulk study lookup through Orthanc's /tools/find.
+
+        With expand=True each result carries its MainDicomTags, PatientMainDicomTags
+        and Labels, so callers need no per-study requests. Results are paged with
+        Since/Limit so a large project never produces one huge response.
+        """
+        return self.client.find(labels=labels, labels_constraint=labels_constraint,
+                                expand=expand, page_size=page_size)
 
     def get_projects(self):
         """Get list of all projects with their stats"""
@@ -194,35 +332,13 @@ class OrthancDataManager:
             projects_data = []
             
             for project_id, project_info in PROJECTS[ORTHANC_NAME].items():
-                print(f"Processing project: {project_id}")
-                
                 try:
-                    # Get studies with this project label from Orthanc
-                    url = f"{self.orthanc_url}/studies"
-                    params = {'labels': project_info['label']}
-                    auth = (self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
+                    # One bulk query per project; expanded results already carry each study's labels
+                    studies = self.find_studies([project_info['label']])
                     
-                    print(f"Requesting URL: {url} with params: {params}")
-                    response = requests.get(url, params=params, auth=auth)
-                    
-                    if response.status_code != 200:
-                        print(f"Error response from Orthanc: {response.status_code} - {response.text}")
-                        studies = []
-                    else:
-                        studies = response.json()
-                    
-                    print(f"Found {len(studies)} studies for project {project_id}")
-                    
-                    # Initialize counters
                     total = len(studies)
-                    reviewed = 0
-                    
-                    # Only try to get labels if we have studies
-                    if total > 0:
-                        for study_id in studies:
-                            labels = self.get_study_labels(study_id)
-                            if any(label.startswith('quality_') for label in labels):
-                                reviewed += 1
+                    reviewed = sum(1 for study in studies
+                                   if any(label.startswith('quality_') for label in study.get('Labels', [])))
                     
                     project_data = {
                         'id': project_id,
@@ -259,7 +375,7 @@ class OrthancDataManager:
     # old get_project_stats with no user_id
     def get_project_stats(self, project_id):
         """Get basic statistics for a project"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
             
             stats = {}
@@ -288,7 +404,7 @@ class OrthancDataManager:
     # new get_project_stats with user_id
     def get_project_stats(self, project_id, user_id):
         """Get project statistics for a specific user"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
             
             stats = conn.execute('''
@@ -318,52 +434,57 @@ class OrthancDataManager:
 
     def get_user_projects(self, user_id):
         """Get projects assigned to a specific user with their review progress"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
-            projects = []
-            
-            # Get assigned projects for user
-            rows = conn.execute('''
-                SELECT p.*, up.user_id
-                FROM projects p
-                JOIN user_projects up ON p.project_id = up.project_id
-                WHERE up.user_id = ?
-            ''', (user_id,)).fetchall()
-            
-            for row in rows:
-                # Get statistics for each project specific to this user
-                stats = conn.execute('''
+            if PROGRESS_COUNTERS:
+                # Trigger-maintained counters: cost does not grow with project size
+                rows = conn.execute('''
+                    SELECT p.*, COALESCE(c.total, 0) as total, COALESCE(pr.reviewed, 0) as reviewed
+                    FROM user_projects up
+                    JOIN projects p ON p.project_id = up.project_id
+                    LEFT JOIN project_study_counts c ON c.project_id = up.project_id
+                    LEFT JOIN project_user_progress pr ON
+                        pr.user_id = up.user_id
+                        AND pr.project_id = up.project_id
+                    WHERE up.user_id = ?
+                ''', (user_id,)).fetchall()
+            else:
+                # Statistics for every assigned project in one grouped query
+                rows = conn.execute('''
                     SELECT 
-                        COUNT(DISTINCT s.study_id) as total,
-                        COUNT(DISTINCT CASE WHEN uss.status = 'reviewed' THEN s.study_id END) as reviewed
-                    FROM studies s
+                        p.*,
+                        COUNT(s.study_id) as total,
+                        COUNT(CASE WHEN uss.status = 'reviewed' THEN 1 END) as reviewed
+                    FROM user_projects up
+                    JOIN projects p ON p.project_id = up.project_id
+                    LEFT JOIN studies s ON s.project_id = up.project_id
                     LEFT JOIN user_study_status uss ON 
-                        s.study_id = uss.study_id 
-                        AND s.project_id = uss.project_id
-                        AND uss.user_id = ?
-                    WHERE s.project_id = ?
-                ''', (user_id, row['project_id'])).fetchone()
-                
-                total = stats['total'] or 0
-                reviewed = stats['reviewed'] or 0
-                
-                project_data = {
-                    'project_id': row['project_id'],
-                    'name': row['name'],
-                    'description': row['description'],
-                    'type': row['type'],
-                    'total': total,
-                    'reviewed': reviewed,
-                    'progress': (reviewed / total * 100) if total > 0 else 0,
-                    'roi_labels': json.loads(row['roi_labels']) if row['roi_labels'] else []
-                }
-                projects.append(project_data)
-                
-            return projects
+                        uss.user_id = up.user_id
+                        AND uss.study_id = s.study_id 
+                        AND uss.project_id = s.project_id
+                    WHERE up.user_id = ?
+                    GROUP BY up.project_id
+                ''', (user_id,)).fetchall()
+            return [self._project_progress(row) for row in rows]
+
+    def _project_progress(self, row):
+        """Project card data from a projects row with total and reviewed counts"""
+        total = row['total'] or 0
+        reviewed = row['reviewed'] or 0
+        return {
+            'project_id': row['project_id'],
+            'name': row['name'],
+            'description': row['description'],
+            'type': row['type'],
+            'total': total,
+            'reviewed': reviewed,
+            'progress': (reviewed / total * 100) if total > 0 else 0,
+            'roi_labels': json.loads(row['roi_labels']) if row['roi_labels'] else []
+        }
 
     def assign_project_to_user(self, user_id, project_id):
         """Assign a project to a user"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.execute('''
                 INSERT OR IGNORE INTO user_projects (user_id, project_id)
                 VALUES (?, ?)
@@ -378,7 +499,7 @@ class OrthancDataManager:
             project_ids: List of project IDs to assign
         """
         try:
-            with sqlite3.connect(DATABASE_PATH) as conn:
+            with self.db.connection() as conn:
                 # First remove all existing assignments for this user
                 conn.execute('''
                     DELETE FROM user_projects
@@ -402,7 +523,7 @@ class OrthancDataManager:
 
     def get_study_counts_by_date(self, project_id, start_date=None, end_date=None):
         """Get study counts grouped by date"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             query = '''
                 SELECT 
                     DATE(study_date) as date,
@@ -425,107 +546,175 @@ class OrthancDataManager:
             return [dict(row) for row in conn.execute(query, params).fetchall()]
 
     def get_reviewer_performance(self, project_id, reviewer=None):
-        """Get reviewer performance metrics"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        """Get reviewer performance metrics from the review summary tables"""
+        with self.db.connection() as conn:
+            conn.row_factory = sqlite3.Row
             query = '''
                 SELECT 
-                    reviewer,
-                    COUNT(*) as total_reviews,
-                    AVG(quality_rating) as avg_rating,
-                    COUNT(DISTINCT DATE(review_date)) as active_days,
-                    MAX(review_date) as last_review,
-                    MIN(review_date) as first_review
-                FROM reviews
-                WHERE project_id = ?
+                    u.username as reviewer,
+                    q.user_id,
+                    q.total_reviews,
+                    q.avg_rating,
+                    COALESCE(a.active_days, 0) as active_days,
+                    a.last_review,
+                    a.first_review
+                FROM (
+                    SELECT user_id, SUM(reviews) as total_reviews,
+                           SUM(quality_rating * reviews) * 1.0 / SUM(reviews) as avg_rating
+                    FROM review_quality_counts
+                    WHERE project_id = ? AND reviews > 0
+                    GROUP BY user_id
+                ) q
+                JOIN users u ON u.user_id = q.user_id
+                LEFT JOIN (
+                    SELECT user_id, COUNT(*) as active_days, MAX(day) as last_review, MIN(day) as first_review
+                    FROM reviewer_activity
+                    WHERE project_id = ? AND reviews > 0
+                    GROUP BY user_id
+                ) a ON a.user_id = q.user_id
             '''
-            params = [project_id]
+            params = [project_id, project_id]
             
             if reviewer:
-                query += ' AND reviewer = ?'
+                query += ' WHERE u.username = ?'
                 params.append(reviewer)
-                
-            query += ' GROUP BY reviewer'
             
             return [dict(row) for row in conn.execute(query, params).fetchall()]
 
-    def search_studies(self, project_id, filters=None):
+    def get_quality_summary(self, project_id, user_id=None):
+        """Quality rating distribution, total and average for a project, optionally for one reviewer"""
+        with self.db.connection() as conn:
+            query = '''
+                SELECT quality_rating, SUM(reviews)
+                FROM review_quality_counts
+                WHERE project_id = ?
+            '''
+            params = [project_id]
+            if user_id is not None:
+                query += ' AND user_id = ?'
+                params.append(user_id)
+            query += ' GROUP BY quality_rating'
+            
+            distribution = {str(rating): 0 for rating in range(1, 6)}
+            for rating, count in conn.execute(query, params).fetchall():
+                distribution[str(rating)] = count
+        
+        total = sum(distribution.values())
+        return {
+            'distribution': distribution,
+            'total_reviews': total,
+            'average': sum(int(rating) * count for rating, count in distribution.items()) / total if total else 0
+        }
+
+    def get_common_issues(self, project_id, user_id=None, limit=5):
+        """Most frequently reported issues as {issue: count}, most common first"""
+        with self.db.connection() as conn:
+            query = '''
+                SELECT issue, COUNT(*) as count
+                FROM review_issues
+                WHERE project_id = ?
+            '''
+            params = [project_id]
+            if user_id is not None:
+                query += ' AND user_id = ?'
+                params.append(user_id)
+            query += ' GROUP BY issue ORDER BY count DESC, issue LIMIT ?'
+            params.append(limit)
+            return dict(conn.execute(query, params).fetchall())
+
+    def search_studies(self, project_id, filters=None, user_id=None, after=None, limit=50):
         """
-        Search studies with flexible filtering
+        Search studies with flexible filtering, newest first, one page at a time
         
         Args:
             project_id: Project identifier
             filters: Dict of filter conditions:
-                - status: List of statuses
+                - status: List of statuses of user_id ('unreviewed', 'in_progress', 'reviewed')
                 - date_range: (start_date, end_date)
                 - quality_rating: List of ratings
-                - reviewer: List of reviewers
-                - search_term: Search in patient name/ID
+                - reviewer: List of reviewer usernames
+                - search_term: Word prefixes in patient name/ID or study description
+            user_id: Reviewer whose status, rating and review date are returned
+            after: (study_date, study_id) of the last row of the previous page
+            limit: Page size
         """
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            query = '''
-                SELECT s.*, r.quality_rating, r.reviewer, r.review_date
-                FROM studies s
-                LEFT JOIN reviews r ON s.study_id = r.study_id
-                WHERE s.project_id = ?
+        filters = filters or {}
+        with self.db.connection() as conn:
+            conn.row_factory = sqlite3.Row
+            columns = 's.*'
+            joins = ''
+            conditions = ['s.project_id = ?']
+            params = []
+
+            if 'search_term' in filters:
+                match = fts_match_query(filters['search_term'])
+                if match is None:
+                    return []
+                joins += ' JOIN studies_fts ON studies_fts.rowid = s.unique_id'
+                conditions.append('studies_fts MATCH ?')
+            if user_id is not None:
+                columns += ", COALESCE(uss.status, 'unreviewed') as status, r.quality_rating, r.review_date"
+                joins += '''
+                    LEFT JOIN user_study_status uss ON
+                        s.study_id = uss.study_id AND s.project_id = uss.project_id AND uss.user_id = ?
+                    LEFT JOIN reviews r ON
+                        s.study_id = r.study_id AND s.project_id = r.project_id AND r.user_id = ?
+                '''
+                params.extend([user_id, user_id])
+            params.append(project_id)
+            if 'search_term' in filters:
+                params.append(match)
+
+            if 'status' in filters:
+                if user_id is None:
+                    raise ValueError("Filtering by status needs a user_id")
+                conditions.append("COALESCE(uss.status, 'unreviewed') IN ({})".format(
+                    ','.join('?' * len(filters['status']))))
+                params.extend(filters['status'])
+
+            if 'date_range' in filters:
+                start, end = filters['date_range']
+                conditions.append('s.study_date BETWEEN ? AND ?')
+                params.extend([start, end])
+
+            # Rating and reviewer filters apply to the same review of the study
+            review_conditions = []
+            if 'quality_rating' in filters:
+                review_conditions.append('rv.quality_rating IN ({})'.format(
+                    ','.join('?' * len(filters['quality_rating']))))
+                params.extend(filters['quality_rating'])
+            if 'reviewer' in filters:
+                review_conditions.append('rv.user_id IN (SELECT user_id FROM users WHERE username IN ({}))'.format(
+                    ','.join('?' * len(filters['reviewer']))))
+                params.extend(filters['reviewer'])
+            if review_conditions:
+                conditions.append('''EXISTS (
+                    SELECT 1 FROM reviews rv
+                    WHERE rv.study_id = s.study_id AND rv.project_id = s.project_id AND {})'''.format(
+                    ' AND '.join(review_conditions)))
+
+            # Keyset pagination: continue after the previous page's last row
+            if after:
+                conditions.append("(COALESCE(s.study_date, ''), s.study_id) < (?, ?)")
+                params.extend([after[0] or '', after[1]])
+
+            query = f'''
+                SELECT {columns}
+                FROM studies s {joins}
+                WHERE {' AND '.join(conditions)}
+                ORDER BY COALESCE(s.study_date, '') DESC, s.study_id DESC
+                LIMIT ?
             '''
-            params = [project_id]
-            
-            if filters:
-                if 'status' in filters:
-                    query += ' AND s.status IN ({})'.format(
-                        ','.join('?' * len(filters['status']))
-                    )
-                    params.extend(filters['status'])
-                    
-                if 'date_range' in filters:
-                    start, end = filters['date_range']
-                    query += ' AND s.study_date BETWEEN ? AND ?'
-                    params.extend([start, end])
-                    
-                if 'quality_rating' in filters:
-                    query += ' AND r.quality_rating IN ({})'.format(
-                        ','.join('?' * len(filters['quality_rating']))
-                    )
-                    params.extend(filters['quality_rating'])
-                    
-                if 'reviewer' in filters:
-                    query += ' AND r.reviewer IN ({})'.format(
-                        ','.join('?' * len(filters['reviewer']))
-                    )
-                    params.extend(filters['reviewer'])
-                    
-                if 'search_term' in filters:
-                    query += ''' AND (
-                        s.patient_name LIKE ? OR 
-                        s.patient_id LIKE ? OR 
-                        s.study_description LIKE ?
-                    )'''
-                    search_term = f'%{filters["search_term"]}%'
-                    params.extend([search_term] * 3)
-            
-            query += ' ORDER BY s.study_date DESC'
-            
+            params.append(limit)
             return [dict(row) for row in conn.execute(query, params).fetchall()]
 
-    def get_project_patients(self, project_label):
+    def get_project_patients(self, project_label, status=None):
         """Get all patients for a project with their status"""
         try:
-            # Get all studies with this project label
-            response = requests.get(
-                f"{self.orthanc_url}/studies",
-                params={'labels': project_label},
-                auth=(self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-            )
-            response.raise_for_status()
-            studies = response.json()
-            
-            patients = []
-            for study_id in studies:
-                study_details = self.get_study_details(study_id)
-                if study_details:
-                    # Add to patient list
-                    patients.append(study_details)
-            
+            # A single expanded find replaces a study request plus a labels request per study
+            patients = [self._study_details(study) for study in self.find_studies([project_label])]
+            if status and status != 'all':
+                patients = [patient for patient in patients if patient['status'] == status]
             return patients
             
         except Exception as e:
@@ -535,54 +724,49 @@ class OrthancDataManager:
     def get_study_details(self, study_id):
         """Get detailed study information"""
         try:
-            # Get study information from Orthanc
-            response = requests.get(
-                f"{self.orthanc_url}/studies/{study_id}",
-                auth=(self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-            )
-            response.raise_for_status()
-            study = response.json()
-            
-            # Get labels
-            labels = self.get_study_labels(study_id)
-            
-            # Determine status from labels
-            status = 'unreviewed'
-            if any(label.startswith('quality_') for label in labels):
-                status = 'completed'
-            elif 'in_progress' in labels:
-                status = 'in_progress'
-            
-            # Extract patient and study information
-            patient_tags = study.get('PatientMainDicomTags', {})
-            main_tags = study.get('MainDicomTags', {})
-            
-            return {
-                'id': study_id,
-                'patient_name': patient_tags.get('PatientName', 'Unknown'),
-                'patient_id': patient_tags.get('PatientID', 'Unknown'),
-                'study_date': main_tags.get('StudyDate', 'Unknown'),
-                'study_description': main_tags.get('StudyDescription', 'No description'),
-                'status': status,
-                'labels': labels,
-                'quality_rating': next((label.split('_')[1] for label in labels 
-                                     if label.startswith('quality_')), None)
-            }
+            study = self.client.get_json(f"/studies/{study_id}", ttl=ORTHANC_CACHE_TTL)
+            # Orthanc 1.12+ includes labels in the study resource; older servers need a second call
+            if 'Labels' not in study:
+                # Copy, so the cached response is left as Orthanc sent it
+                study = dict(study, Labels=self.get_study_labels(study_id))
+            return self._study_details(study)
             
         except Exception as e:
             print(f"Error getting study details: {str(e)}")
             return None
 
-    def get_study_labels(self, study_id):
-        """Get labels for a specific study"""
+    def _study_details(self, study):
+        """Build the dashboard view of an expanded Orthanc study resource"""
+        labels = study.get('Labels', [])
+        
+        # Determine status from labels
+        status = 'unreviewed'
+        if any(label.startswith('quality_') for label in labels):
+            status = 'completed'
+        elif 'in_progress' in labels:
+            status = 'in_progress'
+        
+        # Extract patient and study information
+        patient_tags = study.get('PatientMainDicomTags', {})
+        main_tags = study.get('MainDicomTags', {})
+        
+        return {
+            'id': study['ID'],
+            'patient_name': patient_tags.get('PatientName', 'Unknown'),
+            'patient_id': patient_tags.get('PatientID', 'Unknown'),
+            'study_date': main_tags.get('StudyDate', 'Unknown'),
+            'study_description': main_tags.get('StudyDescription', 'No description'),
+            'status': status,
+            'labels': labels,
+            'quality_rating': next((label.split('_')[1] for label in labels 
+                                 if label.startswith('quality_')), None)
+        }
+
+    def get_study_labels(self, study_id, cached=True):
+        """Get labels for a specific study (cached=False bypasses the short-lived cache)"""
         try:
-            url = f"{self.orthanc_url}/studies/{study_id}/labels"
-            auth = (self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-            
-            response = requests.get(url, auth=auth)
-            if response.status_code == 200:
-                return response.json()
-            return []
+            return self.client.get_json(f"/studies/{study_id}/labels",
+                                        ttl=ORTHANC_CACHE_TTL if cached else None, default=[])
         except Exception as e:
             print(f"Error getting study labels: {str(e)}")
             return []
@@ -602,8 +786,8 @@ class OrthancDataManager:
             }
 
             # Store as attachment
-            response = requests.put(
-                f"{self.orthanc_url}/studies/{study_id}/attachments/AI_Review",
+            response = self.client.put(
+                f"/studies/{study_id}/attachments/AI_Review",
                 data=json.dumps(metadata),
                 headers={'Content-Type': 'application/json'}
             )
@@ -611,10 +795,8 @@ class OrthancDataManager:
 
             # Add quality rating label
             quality_label = f"quality_{review_data['status']}"
-            requests.put(
-                f"{self.orthanc_url}/studies/{study_id}/labels/{quality_label}",
-                data=''
-            )
+            self.client.put(f"/studies/{study_id}/labels/{quality_label}", data='')
+            self.client.invalidate(f"/studies/{study_id}")
 
             print(f"Successfully updated study {study_id} with review data")
             return True
@@ -626,7 +808,7 @@ class OrthancDataManager:
     # new update_study_status with user_id
     def update_study_status(self, study_id, project_id, user_id, status):
         """Update study status for a specific user"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.execute('''
                 INSERT INTO user_study_status (user_id, study_id, project_id, status)
                 VALUES (?, ?, ?, ?)
@@ -679,51 +861,32 @@ class OrthancDataManager:
     def get_all_projects(self):
         """Get all active projects with their overall statistics"""
         print("\nFetching all projects...")
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
-            projects = []
-            
-            # Get all active projects
-            cursor = conn.execute('''
-                SELECT * FROM projects
-            ''')
-            all_projects = cursor.fetchall()
-            print(f"Found {len(all_projects)} projects in database")
-            
-            for project in all_projects:
-                # Get overall statistics using the user_study_status table
-                stats = conn.execute('''
-                    SELECT 
-                        COUNT(DISTINCT s.study_id) as total,
-                        COUNT(DISTINCT CASE WHEN uss.status = 'reviewed' THEN s.study_id END) as reviewed
-                    FROM studies s
-                    LEFT JOIN user_study_status uss ON 
-                        s.study_id = uss.study_id 
-                        AND s.project_id = uss.project_id
-                    WHERE s.project_id = ?
-                ''', (project['project_id'],)).fetchone()
-                
-                total = stats['total'] or 0
-                reviewed = stats['reviewed'] or 0
-                
-                project_data = {
-                    'project_id': project['project_id'],
-                    'name': project['name'],
-                    'description': project['description'],
-                    'type': project['type'],
-                    'total': total,
-                    'reviewed': reviewed,
-                    'progress': (reviewed / total * 100) if total > 0 else 0,
-                    'roi_labels': json.loads(project['roi_labels']) if project['roi_labels'] else []
-                }
-                projects.append(project_data)
-                
-            return projects
+            # Study totals and studies reviewed by anyone, grouped per project in one query
+            rows = conn.execute('''
+                SELECT p.*, COALESCE(t.total, 0) as total, COALESCE(r.reviewed, 0) as reviewed
+                FROM projects p
+                LEFT JOIN (
+                    SELECT project_id, COUNT(*) as total
+                    FROM studies
+                    GROUP BY project_id
+                ) t ON t.project_id = p.project_id
+                LEFT JOIN (
+                    SELECT uss.project_id, COUNT(DISTINCT uss.study_id) as reviewed
+                    FROM user_study_status uss
+                    JOIN studies s ON s.study_id = uss.study_id AND s.project_id = uss.project_id
+                    WHERE uss.status = 'reviewed'
+                    GROUP BY uss.project_id
+                ) r ON r.project_id = p.project_id
+            ''').fetchall()
+            print(f"Found {len(rows)} projects in database")
+            return [self._project_progress(row) for row in rows]
     
     # Add this helper method to data_manager.py
     def check_user_assignments(self):
         """Print current user-project assignments"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
             
             print("\nCurrent User-Project Assignments:")
@@ -743,41 +906,28 @@ class OrthancDataManager:
         """Test Orthanc connection and list all studies"""
         try:
             # Check if Orthanc is responding
-            system_response = requests.get(f"{self.orthanc_url}/system")
+            system_response = self.client.get('/system')
             if not system_response.ok:
                 print("Cannot connect to Orthanc")
                 return
                 
             print("Connected to Orthanc successfully")
             
-            # List all studies
-            studies_response = requests.get(f"{self.orthanc_url}/studies")
-            if not studies_response.ok:
+            # List all studies with their tags and labels in one expanded query
+            try:
+                studies = self.client.find(expand=True)
+            except Exception:
                 print("Cannot fetch studies")
                 return
                 
-            studies = studies_response.json()
             print(f"\nFound {len(studies)} total studies")
             
-            # Get details for each study
-            for study_id in studies:
-                study_response = requests.get(f"{self.orthanc_url}/studies/{study_id}")
-                if study_response.ok:
-                    study = study_response.json()
-                    print("\nStudy Details:")
-                    print(f"ID: {study_id}")
-                    print(f"Patient Name: {study.get('PatientMainDicomTags', {}).get('PatientName', 'Unknown')}")
-                    print(f"Patient ID: {study.get('PatientMainDicomTags', {}).get('PatientID', 'Unknown')}")
-                    
-                    # Get labels
-                    labels_response = requests.get(f"{self.orthanc_url}/studies/{study_id}/labels")
-                    if labels_response.ok:
-                        labels = labels_response.json()
-                        print(f"Labels: {labels}")
-                    else:
-                        print("No labels found")
-                else:
-                    print(f"Cannot fetch details for study {study_id}")
+            for study in studies:
+                print("\nStudy Details:")
+                print(f"ID: {study['ID']}")
+                print(f"Patient Name: {study.get('PatientMainDicomTags', {}).get('PatientName', 'Unknown')}")
+                print(f"Patient ID: {study.get('PatientMainDicomTags', {}).get('PatientID', 'Unknown')}")
+                print(f"Labels: {study.get('Labels') or 'No labels found'}")
                     
         except Exception as e:
             print(f"Error checking Orthanc: {str(e)}")
@@ -820,46 +970,36 @@ class OrthancDataManager:
                 return sorted([str(f) for f in existing_files])
                 
             # If no existing files, download them
-            response = requests.get(
-                f"{self.orthanc_url}/studies/{study_id}/series",
-                auth=self.auth
-            )
+            response = self.client.get(f"/studies/{study_id}/series")
             
             if not response.ok:
                 print(f"Error getting series list: {response.text}")
                 return []
                 
+            # The expanded series list already carries each series' modality and instances
             series_list = response.json()
             ct_files = []
             
-            for series in series_list:
-                series_id = series['ID']
-                series_response = requests.get(
-                    f"{self.orthanc_url}/series/{series_id}",
-                    auth=self.auth
-                )
-                
-                if not series_response.ok:
-                    continue
-                    
-                series_data = series_response.json()
-                
+            for series_data in series_list:
+                series_id = series_data['ID']
                 if series_data.get('MainDicomTags', {}).get('Modality') == 'CT':
                     print(f"Found CT series: {series_id}")
                     
                     for idx, instance_id in enumerate(series_data.get('Instances', [])):
-                        file_response = requests.get(
-                            f"{self.orthanc_url}/instances/{instance_id}/file",
-                            auth=self.auth
-                        )
-                        
-                        if file_response.ok:
-                            # Save with index for proper ordering
-                            file_path = study_temp_dir / f'slice_{idx:04d}.dcm'
-                            with open(file_path, 'wb') as f:
-                                f.write(file_response.content)
-                            ct_files.append(str(file_path))
-                            print(f"Saved slice {idx} to {file_path}")
+                        # Save with index for proper ordering, streamed straight to disk
+                        file_path = study_temp_dir / f'slice_{idx:04d}.dcm'
+                        try:
+                            download_to_file(
+                                self.session,
+                                self.client.url(f"/instances/{instance_id}/file"),
+                                file_path,
+                                timeout=self.client.timeout
+                            )
+                        except requests.RequestException as e:
+                            print(f"Error downloading slice {idx}: {str(e)}")
+                            continue
+                        ct_files.append(str(file_path))
+                        print(f"Saved slice {idx} to {file_path}")
             
             print(f"Retrieved {len(ct_files)} CT files")
             return sorted(ct_files)
@@ -906,7 +1046,7 @@ class OrthancDataManager:
     def update_study_review(self, study_id, review_data):
         """Update study review in database"""
         try:
-            with sqlite3.connect(DATABASE_PATH) as conn:
+            with self.db.connection() as conn:
                 cursor = conn.cursor()
                 
                 # First update the study status
@@ -952,15 +1092,9 @@ class OrthancDataManager:
             quality_rating = next((label.split('_')[1] for label in labels 
                                  if label.startswith('quality_')), None)
             
-            # Get review metadata from Orthanc attachment
-            response = requests.get(
-                f"{self.orthanc_url}/studies/{study_id}/attachments/review",
-                auth=(self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-            )
-            
-            metadata = {}
-            if response.status_code == 200:
-                metadata = response.json()
+            # Get review metadata from Orthanc attachment (studies without a review cache as empty)
+            metadata = self.client.get_json(f"/studies/{study_id}/attachments/review/data",
+                                            ttl=ORTHANC_CACHE_TTL, default={})
             
             return {
                 'quality_rating': quality_rating,
@@ -974,85 +1108,152 @@ class OrthancDataManager:
             return None
 
     def _update_study_labels(self, study_id, labels_to_add):
-        """Update study labels in Orthanc"""
+        """Queue study label updates for Orthanc: other quality labels are removed, labels_to_add are added"""
         try:
-            # Get existing labels
-            current_labels = self.get_study_labels(study_id)
-            
-            # Remove any existing quality labels
-            current_labels = [l for l in current_labels 
-                            if not l.startswith('quality_')]
-            
-            # Add new labels
-            new_labels = list(set(current_labels + labels_to_add))
-            
-            # Update in Orthanc
-            response = requests.put(
-                f"{self.orthanc_url}/studies/{study_id}/labels",
-                json=new_labels,
-                auth=(self.orthanc_username, self.orthanc_password) 
-                    if self.orthanc_username else None
-            )
-            response.raise_for_status()
+            with self.db.connection() as conn:
+                self.write_queue.enqueue(
+                    conn, study_id,
+                    put_labels=labels_to_add,
+                    delete_labels=[label for label in QUALITY_LABELS if label not in labels_to_add]
+                )
+                conn.commit()
+            self.write_queue.wake()
             return True
         except Exception as e:
             print(f"Error updating labels: {str(e)}")
             return False
 
-    def get_study_files(self, study_id, target_dir):
-        """Download study files from Orthanc"""
+    def get_study_files(self, study_id, target_dir, mode=DOWNLOAD_MODE, modalities=None, priority=None, on_instance=None,
+                        plan=None):
+        """Download or top up the cached copy of a study, fetching only what its manifest lacks"""
         try:
-            # Get all series for this study
-            response = requests.get(
-                f"{self.orthanc_url}/studies/{study_id}",
-                auth=(self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-            )
-            response.raise_for_status()
-            study_info = response.json()
-            
-            # Get series list from study info
-            series_list = study_info.get('Series', [])
-            if not series_list:
-                raise Exception("No series found in study")
-                
-            # Create target directory
-            target_dir = Path(target_dir)
-            target_dir.mkdir(parents=True, exist_ok=True)
-            
-            for series_id in series_list:
-                # Get series details using ID directly
-                series_response = requests.get(
-                    f"{self.orthanc_url}/series/{series_id}",
-                    auth=(self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-                )
-                series_response.raise_for_status()
-                series_info = series_response.json()
-                
-                # Create modality-specific directory
-                modality = series_info.get('MainDicomTags', {}).get('Modality', 'UNKNOWN')
-                modality_dir = target_dir / modality
-                modality_dir.mkdir(exist_ok=True)
-                
-                # Get instance IDs from series info
-                instance_ids = series_info.get('Instances', [])
-                
-                # Download each instance
-                for instance_id in instance_ids:
-                    instance_response = requests.get(
-                        f"{self.orthanc_url}/instances/{instance_id}/file",
-                        auth=(self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-                    )
-                    instance_response.raise_for_status()
-                    
-                    # Save to cache
-                    file_path = modality_dir / f"{instance_id}.dcm"
-                    file_path.write_bytes(instance_response.content)
-                    
-            return True
+            with self._lease(study_id):
+                stats = self.downloader.sync_study(study_id, target_dir, mode=mode, modalities=modalities,
+                                                   priority=priority, on_instance=on_instance, plan=plan)
+            if stats.files or stats.failed:
+                print(f"Synced study {study_id} ({mode}, {'/'.join(modalities) if modalities else 'all'}): {stats}")
+            return stats
             
         except Exception as e:
             print(f"Error getting study files: {str(e)}")
-            return False
+            return None
+
+    def get_study_files_staged(self, study_id, target_dir, on_complete=None, mode=DOWNLOAD_MODE, plan=None):
+        """
+        Fetch the series needed for the first image (FOREGROUND_MODALITIES) now and
+        the rest of the study (RTDOSE, RTPLAN, ...) in the background. on_complete
+        is called with the background DownloadStats once the study is complete.
+        """
+        stats = self.get_study_files(study_id, target_dir, mode=mode, modalities=FOREGROUND_MODALITIES, plan=plan)
+        self.prefetch_study_files(study_id, target_dir, on_complete=on_complete, mode=mode, plan=plan)
+        return stats
+
+    def set_study_transfer_syntax(self, study_id, target_dir, transfer_syntax):
+        """
+        Choose the transfer syntax future CT downloads of one study use
+        ('jpeg2000', 'jpegls', 'rle', a UID, or '' for as stored)
+        """
+        try:
+            manifest = StudyManifest.load(target_dir, study_id)
+            manifest.transfer_syntax = resolve_transfer_syntax(transfer_syntax)
+            manifest.save(complete=manifest.complete)
+            return manifest.transfer_syntax
+        except Exception as e:
+            print(f"Error setting transfer syntax: {str(e)}")
+            return None
+
+    def get_dicomweb_ct_series(self, study_id):
+        """Return (StudyInstanceUID, SeriesInstanceUID) of a study's CT series for DICOMweb requests"""
+        try:
+            study = self.client.get_json(f"/studies/{study_id}")
+            study_uid = study.get('MainDicomTags', {}).get('StudyInstanceUID')
+
+            for series in self.client.get_json(f"/studies/{study_id}/series"):
+                tags = series.get('MainDicomTags', {})
+                if tags.get('Modality') == 'CT':
+                    return study_uid, tags.get('SeriesInstanceUID')
+            return None
+
+        except Exception as e:
+            print(f"Error getting DICOMweb identifiers: {str(e)}")
+            return None
+
+    def plan_study(self, study_id):
+        """The study's series and instances (StudyDownloader.plan_study), or None if Orthanc cannot say"""
+        try:
+            return self.downloader.plan_study(study_id)
+        except Exception as e:
+            print(f"Error planning study {study_id}: {str(e)}")
+            return None
+
+    def plan_progressive_download(self, study_id, target_dir, roi_labels=None, plan=None):
+        """
+        Fetch the RTSTRUCT and rank CT slices nearest the project ROIs first.
+        Returns (ct_slices, priority), or None when every CT slice is already
+        cached or Orthanc has no positions to place slices before they arrive.
+        """
+        try:
+            self.get_study_files(study_id, target_dir, modalities=('RTSTRUCT',), plan=plan)
+            ct_slices = self.downloader.plan_ct_slices(study_id, plan)
+            if not ct_slices:
+                return None
+            manifest = StudyManifest.load(target_dir)
+            if all(manifest.verify(instance_id) for instance_id, _, _ in ct_slices):
+                return None
+
+            rt_files = list((Path(target_dir) / 'RTSTRUCT').glob('*.dcm'))
+            z_range = contour_z_range(rt_files, roi_labels) if rt_files else None
+            if z_range is None:
+                # No matching contours: review starts at the bottom of the scan
+                lowest = min(z for _, _, z in ct_slices)
+                z_range = (lowest, lowest)
+            return ct_slices, contour_priority(ct_slices, z_range)
+
+        except Exception as e:
+            print(f"Error planning progressive download: {str(e)}")
+            return None
+
+    def prefetch_study_files(self, study_id, target_dir, on_complete=None, mode=DOWNLOAD_MODE,
+                             ct_priority=None, on_instance=None, plan=None):
+        """
+        Queue a full sync of a study in the background, once per study at a time.
+        With ct_priority the CT slices are fetched first, in that order, and each
+        is passed to on_instance as it lands. plan, when given, is reused rather
+        than asking Orthanc for the study's series again.
+        """
+        with self._pending_lock:
+            pending = self._pending_downloads.get(study_id)
+            if pending is not None and not pending.done():
+                return pending
+
+            def run():
+                try:
+                    if ct_priority:
+                        self.get_study_files(study_id, target_dir, mode=mode, modalities=('CT',),
+                                             priority=ct_priority, on_instance=on_instance, plan=plan)
+                    stats = self.get_study_files(study_id, target_dir, mode=mode, on_instance=on_instance,
+                                                 plan=plan)
+                    if stats is not None and on_complete:
+                        try:
+                            on_complete(stats)
+                        except Exception as e:
+                            print(f"Error finishing background download for study {study_id}: {str(e)}")
+                            traceback.print_exc()
+                    return stats
+                finally:
+                    if self.study_leases:
+                        self.study_leases.release(study_id)
+
+            # The lease covers the time the download waits in the queue as well
+            if self.study_leases:
+                self.study_leases.acquire(study_id)
+            future = self.background_downloads.submit(run)
+            self._pending_downloads[study_id] = future
+            return future
+
+    def _lease(self, study_id):
+        """Keep a study's cache folder from being evicted while it is written"""
+        return self.study_leases.lease(study_id) if self.study_leases else nullcontext()
 
     def _get_series_info(self, series_id):
         """Get series information directly using series ID"""
@@ -1070,12 +1271,7 @@ class OrthancDataManager:
                     except:
                         pass
             
-            response = requests.get(
-                f"{self.orthanc_url}/series/{series_id}",
-                auth=(self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-            )
-            response.raise_for_status()
-            return response.json()
+            return self.client.get_series(series_id)
         except Exception as e:
             print(f"Error getting series info: {str(e)}")
             return None
@@ -1083,31 +1279,21 @@ class OrthancDataManager:
     def get_study_info(self, study_id):
         """Get study information in a safe format"""
         try:
-            url = f"{self.orthanc_url}/studies/{study_id}"
-            auth = (self.orthanc_username, self.orthanc_password) if self.orthanc_username else None
-            
             print(f"Fetching study info for {study_id}")
             
-            response = requests.get(url, auth=auth)
-            if response.status_code != 200:
-                print(f"Error response from Orthanc: {response.status_code}")
+            study_data = self.client.get_json(f"/studies/{study_id}", ttl=ORTHANC_CACHE_TTL, default=None)
+            if study_data is None:
+                print(f"Study {study_id} not found in Orthanc")
                 return self._get_default_study_info()
-                
-            study_data = response.json()
-            print(f"Received study data: {study_data.keys()}")
             
             # Get the CT series specifically
             series_list = study_data.get('Series', [])
             ct_series = []
             
-            # Get detailed series info to find CT series
-            for series_id in series_list:
-                series_url = f"{self.orthanc_url}/series/{series_id}"
-                series_response = requests.get(series_url, auth=auth)
-                if series_response.status_code == 200:
-                    series_info = series_response.json()
-                    if series_info.get('MainDicomTags', {}).get('Modality') == 'CT':
-                        ct_series.append(series_info)
+            # Get detailed series info to find CT series, fetched concurrently
+            for series_info in self.client.map(self._get_series_info, series_list):
+                if series_info and series_info.get('MainDicomTags', {}).get('Modality') == 'CT':
+                    ct_series.append(series_info)
             
             if not ct_series:
                 print("No CT series found")
@@ -1173,9 +1359,23 @@ class OrthancDataManager:
     #         return result
         
     # new project study function with user
+    def get_next_studies(self, user_id, project_id, after='', count=1):
+        """The reviewer's next unreviewed studies after study `after`, from their review queue"""
+        with self.db.connection() as conn:
+            return review_queue.next_studies(conn, user_id, project_id, after, count)
+
+    def set_study_priority(self, project_id, study_ids, priority):
+        """Set the queue priority of studies, used by projects with queue_order 'priority'"""
+        with self.db.connection() as conn:
+            updated = conn.executemany('''
+                UPDATE studies SET priority = ? WHERE project_id = ? AND study_id = ?
+            ''', [(priority, project_id, study_id) for study_id in study_ids]).rowcount
+            conn.commit()
+            return updated
+
     def get_project_studies(self, project_id, status=None, user_id=None):
         """Get studies for a project with user-specific status"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
             if status == 'reviewed':
                 completed = conn.execute('''
@@ -1223,7 +1423,7 @@ class OrthancDataManager:
 
     def add_project(self, project_id, name, description, created_date, status='active', project_type='quality_assessment', roi_labels=None):
         """Add a new project to the database"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             try:
                 conn.execute('''
                     INSERT INTO projects (project_id, name, description, created_date, status, type, roi_labels)
@@ -1237,7 +1437,7 @@ class OrthancDataManager:
 
     def get_project(self, project_id):
         """Get project details"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
             project = conn.execute('''
                 SELECT * FROM projects WHERE project_id = ?
@@ -1249,7 +1449,7 @@ class OrthancDataManager:
 
     def add_study(self, study_id, project_id, patient_info, orthanc_id, cache_path=None):
         """Add a new study to the database"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             try:
                 conn.execute('''
                     INSERT INTO studies (
@@ -1271,7 +1471,7 @@ class OrthancDataManager:
 
     def get_project_studies_by_status(self, project_id):
         """Get studies grouped by status for project dashboard"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
             return {
                 'unreviewed': [dict(row) for row in conn.execute('''
@@ -1295,25 +1495,37 @@ class OrthancDataManager:
             }
 
     def init_projects(self):
-        """Initialize projects from config in the database"""
+        """Initialize projects from config in the database, writing only projects that changed"""
         print("\nInitializing projects from config...")
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             for project_id, info in PROJECTS[ORTHANC_NAME].items():
                 try:
-                    print(f"Adding project: {project_id}")
-                    conn.execute('''
-                        INSERT OR REPLACE INTO projects 
-                        (project_id, name, description, created_date, status, type, roi_labels)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (
+                    queue_order = info.get('queue_order', 'study_id')
+                    row = (
                         project_id,
                         info['name'],
                         info.get('description', ''),
                         info.get('created_date', ''),
                         info.get('status', 'active'),
                         info.get('type', 'quality_assessment'),
-                        json.dumps(info.get('roi_labels', []))
-                    ))
+                        json.dumps(info.get('roi_labels', [])),
+                        queue_order
+                    )
+                    previous = conn.execute('''
+                        SELECT project_id, name, description, created_date, status, type, roi_labels, queue_order
+                        FROM projects WHERE project_id = ?
+                    ''', (project_id,)).fetchone()
+                    if previous == row:
+                        continue
+                    print(f"Adding project: {project_id}")
+                    conn.execute('''
+                        INSERT OR REPLACE INTO projects 
+                        (project_id, name, description, created_date, status, type, roi_labels, queue_order)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', row)
+                    if previous and previous[-1] != queue_order:
+                        print(f"Reordering review queues of {project_id} by {queue_order}")
+                        review_queue.rebuild(conn, project_id)
                     conn.commit()
                     print(f"Successfully added project: {project_id}")
                 except Exception as e:
@@ -1324,15 +1536,7 @@ class OrthancDataManager:
         try:
             print("\nInitializing user project assignments...")
             
-            # Define default assignments
-            assignments = {
-                1: ['Nov24test', 'Dec24study'],  # admin gets these projects
-                2: ['q2ln3', '2425Q2_HN_Nodes'],  # reviewer1 gets these
-                3: ['2425Q2_HN_Nodes'],  # reviewer2 gets this one
-                4: ['medai', 'planning', 'contouring']  # reviewer3 gets this one
-            }
-            
-            for user_id, project_ids in assignments.items():
+            for user_id, project_ids in DEFAULT_ASSIGNMENTS.items():
                 self.assign_projects_to_user(user_id, project_ids)
                 print(f"Assigned projects {project_ids} to user {user_id}")
                 
@@ -1343,7 +1547,7 @@ class OrthancDataManager:
     def _verify_db(self):
         """Verify database tables and schema"""
         print("\nVerifying database schema...")
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             # Check projects table
             projects = conn.execute("SELECT * FROM sqlite_master WHERE type='table' AND name='projects'").fetchone()
             if projects:
@@ -1362,13 +1566,13 @@ class OrthancDataManager:
             else:
                 print("Studies table missing!")
 
-    def sync_project_studies(self, project_id, batch_size=100, start_date=None, end_date=None):
+    def sync_project_studies(self, project_id, batch_size=None, start_date=None, end_date=None):
         """
-        Sync studies for a specific project with batching and filtering
+        Rescan the studies of one project from Orthanc
         
         Args:
             project_id: The project identifier to sync
-            batch_size: Number of studies to process in each batch
+            batch_size: Rows written per transaction (default SYNC_BATCH_SIZE)
             start_date: Optional start date filter (YYYYMMDD format)
             end_date: Optional end date filter (YYYYMMDD format)
         """
@@ -1379,54 +1583,14 @@ class OrthancDataManager:
             if project_id not in PROJECTS[ORTHANC_NAME]:
                 raise ValueError(f"Project {project_id} not found in configuration")
             
-            # Get studies with project label
-            studies = self.orthanc.studies.find_by_label(project_id)
-            total_studies = len(studies)
-            print(f"Found {total_studies} studies with label {project_id}")
-            
-            # Process in batches
-            with sqlite3.connect(DATABASE_PATH) as conn:
-                for i in range(0, total_studies, batch_size):
-                    batch = studies[i:i + batch_size]
-                    print(f"Processing batch {i//batch_size + 1} ({len(batch)} studies)")
-                    
-                    for study_id in batch:
-                        try:
-                            study = self.orthanc.studies.get(study_id)
-                            main_dicom = study.get('MainDicomTags', {})
-                            
-                            # Apply date filter if specified
-                            study_date = main_dicom.get('StudyDate', '')
-                            if start_date and study_date < start_date:
-                                continue
-                            if end_date and study_date > end_date:
-                                continue
-                            
-                            # Insert or update study
-                            conn.execute('''
-                                INSERT OR REPLACE INTO studies (
-                                    study_id, project_id, patient_id, patient_name,
-                                    study_date, study_description, orthanc_id, status
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                            ''', (
-                                study_id,
-                                project_id,
-                                main_dicom.get('PatientID', 'Unknown'),
-                                main_dicom.get('PatientName', 'Unknown'),
-                                study_date,
-                                main_dicom.get('StudyDescription', ''),
-                                study_id,
-                                'unreviewed'
-                            ))
-                            
-                        except Exception as e:
-                            print(f"Error processing study {study_id}: {str(e)}")
-                    
-                    # Commit each batch
-                    conn.commit()
-                    print(f"Completed batch {i//batch_size + 1}")
-                    
-            print(f"Sync completed for project {project_id}")
+            self.sync.batch_size = batch_size or SYNC_BATCH_SIZE
+            with self.db.connection() as conn:
+                stats = self.sync.full_scan(conn, project_ids=[project_id],
+                                            start_date=start_date, end_date=end_date)
+            print(f"Sync completed for project {project_id}: {stats['upserted']} studies added or changed, "
+                  f"{stats['removed']} removed in {stats['seconds']:.2f}s ({stats['rows_per_second']:.0f} rows/s"
+                  f"{', bulk load' if stats['bulk'] else ''})")
+            return stats
             
         except Exception as e:
             print(f"Error syncing project {project_id}: {str(e)}")
@@ -1449,139 +1613,69 @@ class OrthancDataManager:
 
     def generate_project_report(self, project_id):
         """Generate a comprehensive project report"""
-        stats = self.get_project_stats(project_id)
+        with self.db.connection() as conn:
+            total_studies, reviewed = conn.execute('''
+                SELECT
+                    (SELECT COUNT(*) FROM studies WHERE project_id = ?),
+                    (SELECT COUNT(DISTINCT uss.study_id)
+                     FROM user_study_status uss
+                     JOIN studies s ON s.study_id = uss.study_id AND s.project_id = uss.project_id
+                     WHERE uss.project_id = ? AND uss.status = 'reviewed')
+            ''', (project_id, project_id)).fetchone()
+            recent_activity = [
+                {'date': day, 'reviews': count}
+                for day, count in conn.execute('''
+                    SELECT day, SUM(reviews) FROM reviewer_activity
+                    WHERE project_id = ? AND day >= DATE('now', '-30 days')
+                    GROUP BY day HAVING SUM(reviews) > 0 ORDER BY day DESC
+                ''', (project_id,)).fetchall()
+            ]
+        
         reviewer_perf = self.get_reviewer_performance(project_id)
+        quality = self.get_quality_summary(project_id)
         
         report = {
             'project': self.get_project(project_id),
             'summary': {
-                'total_studies': stats['total_studies'],
-                'completion_rate': (
-                    stats['status_counts'].get('reviewed', 0) / 
-                    stats['total_studies'] * 100 if stats['total_studies'] > 0 else 0
-                ),
+                'total_studies': total_studies,
+                'completion_rate': reviewed / total_studies * 100 if total_studies > 0 else 0,
                 'active_reviewers': len(reviewer_perf),
                 'quality_stats': {
-                    'average': sum(
-                        rating * count 
-                        for rating, count in stats['quality_distribution'].items()
-                    ) / sum(stats['quality_distribution'].values()) 
-                    if stats['quality_distribution'] else 0,
-                    'distribution': stats['quality_distribution']
-                }
+                    'average': quality['average'],
+                    'distribution': quality['distribution']
+                },
+                'common_issues': self.get_common_issues(project_id, limit=10)
             },
             'reviewer_performance': reviewer_perf,
-            'recent_activity': stats['recent_activity']
+            'recent_activity': recent_activity
         }
         
         return report
 
-    def sync_development_data(self):
-        """Sync data from development Orthanc instance"""
+    def sync_development_data(self, full=False, labels=None):
+        """
+        Sync the studies table with Orthanc.
+
+        Only changes since the last run are applied (see OrthancSync); full=True
+        drops the stored cursor and rescans every project. labels=True also
+        reconciles project labels now instead of waiting for
+        SYNC_RECONCILE_INTERVAL.
+        """
         try:
-            print("\nSyncing development data from Orthanc...")
-            
-            # Get studies from Orthanc
-            response = self.session.get(f"{self.orthanc_url}/studies")
-            response.raise_for_status()
-            studies = response.json()
-            
-            print(f"Found {len(studies)} studies in development Orthanc")
-            
-            with sqlite3.connect(DATABASE_PATH) as conn:
-                for study_id in studies:
-                    try:
-                        # Get study details
-                        response = self.session.get(f"{self.orthanc_url}/studies/{study_id}")
-                        response.raise_for_status()
-                        study = response.json()
-                        
-                        # Get labels
-                        response = self.session.get(f"{self.orthanc_url}/studies/{study_id}/labels")
-                        response.raise_for_status()
-                        labels = response.json()
-                        
-                        print(f"\nProcessing study {study_id}")
-                        print(f"Labels: {labels}")
-                        print(f"Study data: {json.dumps(study, indent=2)}")
-                        print(f"Available Projects: {PROJECTS[ORTHANC_NAME].keys()}")
-                        
-                        # Find matching project from labels
-                        project_ids = []
-                        for label in labels:
-                            if label in PROJECTS[ORTHANC_NAME]:
-                                project_ids.append(label)
-                        print(f"Matching projects: {project_ids}")
-
-                        for project_id in project_ids:
-                            # Get patient info from MainDicomTags
-                            main_dicom = study.get('MainDicomTags', {})
-                            series = study.get('Series', [])
-                            patient_dicom = study.get('PatientMainDicomTags', {})
-
-                            # Try to get patient ID from first series if not in study tags
-                            if not main_dicom.get('PatientID'):
-                                for series_id in series:
-                                    try:
-                                        series_response = self.session.get(f"{self.orthanc_url}/series/{series_id}")
-                                        series_response.raise_for_status()
-                                        series_data = series_response.json()
-                                        series_tags = series_data.get('MainDicomTags', {})
-                                        if series_tags.get('PatientID'):
-                                            main_dicom['PatientID'] = series_tags['PatientID']
-                                            break
-                                    except Exception as e:
-                                        print(f"Error getting series data: {str(e)}")
-                            
-                            patient_id = main_dicom.get('PatientID', patient_dicom.get('PatientID', 'Unknown'))
-                            patient_name = main_dicom.get('PatientName', patient_dicom.get('PatientName', 'Unknown'))
-
-                            print(f"Adding study {study_id} to project: {project_id}")
-                            print(f"DICOM tags: {json.dumps(main_dicom, indent=2)}")
-                            
-                            # Before the insert, check if the combination exists
-                            existing = conn.execute('''
-                                SELECT 1 FROM studies WHERE study_id = ? AND project_id = ?
-                            ''', (study_id, project_id)).fetchone()
-
-                            if not existing:
-                                # removed status from the insert for new schema
-                                conn.execute('''
-                                    INSERT OR IGNORE INTO studies (
-                                        study_id, project_id, patient_id, patient_name,
-                                        study_date, study_description, orthanc_id
-                                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                                ''', (
-                                    study_id,
-                                    project_id,
-                                    patient_id,
-                                    patient_name,
-                                    main_dicom.get('StudyDate', ''),
-                                    main_dicom.get('StudyDescription', ''),
-                                    study_id,
-                                ))
-                                print(f"Successfully added study {study_id} with status 'unreviewed'")
-
-                            else:
-                                print(f"Study {study_id} with project {project_id} already exists.")
-
-                        # else:
-                        #     print(f"No matching project found for study {study_id}")
-                            
-                    except Exception as e:
-                        print(f"Error processing study {study_id}: {str(e)}")
-                        traceback.print_exc()
-                
-                conn.commit()
-                print("\nDevelopment data sync completed")
+            print("\nSyncing study data from Orthanc...")
+            with self.db.connection() as conn:
+                if full:
+                    self.sync.reset(conn)
+                return self.sync.run(conn, reconcile_labels=labels)
                 
         except Exception as e:
             print(f"Error syncing development data: {str(e)}")
+            traceback.print_exc()
             raise
 
     def get_study(self, study_id):
         """Get study details"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
             study = conn.execute('''
                 SELECT * FROM studies WHERE study_id = ?
@@ -1593,7 +1687,7 @@ class OrthancDataManager:
 
     def get_review(self, study_id):
         """Get review data for a study"""
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with self.db.connection() as conn:
             conn.row_factory = sqlite3.Row
             review = conn.execute('''
                 SELECT * FROM reviews 
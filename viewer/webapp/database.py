@@ -0,0 +1,101 @@
+# webapp/database.py
+"""
+Shared access to the review database.
+
+The process keeps one pool of long-lived connections instead of opening a
+new one per call. Werkzeug's threaded server runs every request on a new
+thread, so connections are shared between threads (check_same_thread=False)
+and only ever used by one of them at a time: the pragmas below are applied
+once per connection, and each connection's prepared statement cache is reused
+across requests. The database runs in WAL mode: reviewers reading the dashboard never
+block a review being submitted, and writers wait up to busy_timeout for each
+other instead of failing with "database is locked".
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import DB_BUSY_TIMEOUT_MS, DB_CACHE_MB, DB_MMAP_MB, DB_STATEMENT_CACHE, DB_POOL_SIZE
+
+
+class Database:
+    """Process-wide pool of SQLite connections to one database file"""
+
+    def __init__(self, path, busy_timeout_ms=DB_BUSY_TIMEOUT_MS, cache_mb=DB_CACHE_MB,
+                 mmap_mb=DB_MMAP_MB, statement_cache=DB_STATEMENT_CACHE, pool_size=DB_POOL_SIZE):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_mb = cache_mb
+        self.mmap_mb = mmap_mb
+        self.statement_cache = statement_cache
+
+        self._idle = queue.LifoQueue(maxsize=pool_size)  # Most recently returned first: warmest cache
+        self._lock = threading.Lock()
+        self.stats = {'opened': 0, 'closed': 0, 'checkouts': 0}
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            cached_statements=self.statement_cache,
+            check_same_thread=False  # Checked out by one request thread at a time
+        )
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')  # Durable at WAL checkpoints, no fsync per commit
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_mb * 1024)}')  # Negative means KiB
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_mb * 1024 * 1024)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        with self._lock:
+            self.stats['opened'] += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection. Like `with sqlite3.connect(...)`, the
+        transaction is committed on exit or rolled back on error; the connection
+        then goes back to the pool instead of being closed. Checkout never
+        waits: with every pooled connection in use a new one is opened, and on
+        return it is closed if DB_POOL_SIZE connections are already idle. Nested
+        checkouts get a separate connection, so an inner block never commits
+        the outer one's transaction.
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.row_factory = None  # Callers opt into sqlite3.Row per checkout
+            if conn.in_transaction:
+                conn.rollback()  # e.g. an explicit BEGIN left open by an error in commit()
+            with self._lock:
+                self.stats['checkouts'] += 1
+            self._return(conn)
+
+    def _return(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+            with self._lock:
+                self.stats['closed'] += 1
+
+    def close(self):
+        """Close every idle connection; checked-out ones go back to the pool when returned"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+            with self._lock:
+                self.stats['closed'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, idle=self._idle.qsize())
@@ -6,11 +6,59 @@ from typing import List, Dict, Optional
 import base64
 import io
 # from shapely.geometry import Polygon
-from PIL import Image, ImageDraw
-import cv2
+import os
+import importlib
 import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import jsonify
-from scipy.interpolate import RegularGridInterpolator  # ensure this is imported at the top
+from dicomweb_client import LazySlice
+
+
+class LazyModule:
+    """Module imported on first attribute access, for dependencies that are slow to import"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# cv2 and scipy add about half a second to viewer startup and are only needed
+# once a study is rendered, so they are imported on first use
+cv2 = LazyModule('cv2')
+scipy_interpolate = LazyModule('scipy.interpolate')
+
+# Threads used to decode compressed CT slices while a study loads
+DECODE_WORKERS = os.cpu_count() or 4
+
+
+def slice_z(ds):
+    """Patient z of a CT slice, the coordinate RTSTRUCT contours and Orthanc's instance tags use"""
+    return float(ds.ImagePositionPatient[2])
+
+
+def sort_ct_slices(slices, z=slice_z):
+    """
+    Order CT slices from inferior to superior and return (slices, positions).
+    Every loader orders slices here, so a slice index means the same image
+    whichever loader served the study.
+    """
+    ordered = sorted(slices, key=z)
+    return ordered, [z(ct_slice) for ct_slice in ordered]
+
+
+def read_ct_slice(dcm_file):
+    """Read a CT slice, decoding compressed pixel data now so rendering never waits on a codec"""
+    ds = pydicom.dcmread(str(dcm_file))
+    if ds.file_meta.TransferSyntaxUID.is_compressed:
+        ds.pixel_array  # pydicom keeps the decoded array on the dataset
+    return ds
+
 
 class DicomHandler:
     def __init__(self, study_id, cache_dir, roi_labels=None, debug=False):
@@ -25,6 +73,12 @@ class DicomHandler:
         self.series_data = None
         self.structures = None
         self.slice_positions = None
+        self.reference_slice = None        # Any loaded CT slice, used for in-plane geometry
+        
+        # Progressive loading: CT instance ID -> slice index, signalled as slices arrive
+        self._slice_index = {}
+        self._slice_ids = []
+        self._slice_ready = threading.Condition()
         
         # Add caches for performance
         self.processed_contours_cache = {}  # Cache for processed contours by slice
@@ -91,37 +145,8 @@ class DicomHandler:
                 raise FileNotFoundError(f"No CT directory found at {ct_dir}")
 
             # Load structures 
-            rt_dir = self.cache_dir / 'RTSTRUCT'
-            if rt_dir.exists():
-                rt_files = list(rt_dir.glob('*.dcm'))
-                if rt_files:
-                    rt_file_to_load = None
-                    if len(rt_files) == 1:
-                        rt_file_to_load = rt_files[0]
-                    elif len(rt_files) > 1:
-                        for rt_file in rt_files:
-                            rt_struct = pydicom.dcmread(str(rt_file))
-                            roi_names = {str(struct.ROIName).lower() for struct in rt_struct.StructureSetROISequence}
-                            if 'all' in self.roi_labels and len(roi_names) > 0:
-                                rt_file_to_load = rt_file
-                                self.found_roi_labels = roi_names
-                                print(f"RTSTRUCT file found with all ROIs: {rt_file_to_load}")
-                                break
-                            intersection = self.roi_labels.intersection(roi_names)
-                            if intersection:
-                                print(f"Found matching ROI in {rt_file}: {intersection}")
-                                rt_file_to_load = rt_file
-                                break
-                    if rt_file_to_load:
-                        self._load_rt_structures(rt_file_to_load)
-                        self._debug(f"Loaded RTSTRUCT file: {rt_file_to_load}")
-                    else:
-                        self._debug("No matching ROIs found in RTSTRUCT files")
-                        raise ValueError("No matching ROIs found in RTSTRUCT files")
-                else:
-                    self._debug("No RTSTRUCT files found")
-            else:
-                self._debug(f"No RTSTRUCT directory found at {rt_dir}")
+            self._load_structures()
+
             # Pre-process and cache contours for all slices
             if self.series_data and self.structure_sets:
                 self._cache_processed_contours()
@@ -137,31 +162,154 @@ class DicomHandler:
             self._debug(f"Error loading study data: {str(e)}")
             raise
 
+    def load_progressive(self, ct_slices):
+        """
+        Make the study renderable before every CT slice has downloaded.
+
+        ct_slices is [(instance_id, z)] for the whole CT series, taken from
+        Orthanc's instance metadata. Slices already in the cache are loaded now;
+        the rest are placeholders filled in by add_ct_slice as they arrive.
+        """
+        try:
+            ordered, self.slice_positions = sort_ct_slices(ct_slices, z=lambda item: item[1])
+            self._slice_index = {instance_id: idx for idx, (instance_id, _) in enumerate(ordered)}
+            self._slice_ids = [instance_id for instance_id, _ in ordered]
+            self.series_data = [None] * len(ordered)
+
+            self._load_structures()
+
+            ct_dir = self.cache_dir / 'CT'
+            cached = [(instance_id, ct_dir / f"{instance_id}.dcm") for instance_id in self._slice_index
+                      if (ct_dir / f"{instance_id}.dcm").exists()]
+            with ThreadPoolExecutor(max_workers=DECODE_WORKERS) as executor:
+                list(executor.map(lambda item: self.add_ct_slice(*item), cached))
+            print(f"Progressive load: {self.loaded_slice_count()} of {len(ordered)} CT slices cached")
+
+        except Exception as e:
+            self._debug(f"Error preparing progressive load: {str(e)}")
+            raise
+
+    def load_dicomweb(self, client, study_uid, series_uid):
+        """
+        Network-backed lazy mode: CT headers come from one DICOMweb metadata call
+        and each slice's pixels are fetched only when it is first displayed.
+        Structures are read from the local cache as usual.
+        """
+        try:
+            slices, positions = sort_ct_slices([LazySlice(client, study_uid, series_uid, ds)
+                                                for ds in client.series_metadata(study_uid, series_uid)])
+            if not slices:
+                raise ValueError(f"No CT instances found in series {series_uid}")
+
+            self.series_data = slices
+            self.slice_positions = positions
+            self.reference_slice = slices[0]
+            print(f"Lazy load: {len(slices)} CT slice headers from DICOMweb")
+
+            self._load_structures()
+            if self.structure_sets:
+                self._cache_processed_contours()
+
+        except Exception as e:
+            self._debug(f"Error loading study over DICOMweb: {str(e)}")
+            raise
+
+    def add_ct_slice(self, instance_id, dcm_file):
+        """Insert a CT slice that has just arrived; contours are processed once geometry is known"""
+        idx = self._slice_index.get(instance_id)
+        if idx is None:
+            return False
+        ds = read_ct_slice(dcm_file)
+        with self._slice_ready:
+            self.series_data[idx] = ds
+            if self.reference_slice is None:
+                self.reference_slice = ds
+                if self.structure_sets:
+                    self._cache_processed_contours()
+            self._slice_ready.notify_all()
+        return True
+
+    def wait_for_slice(self, slice_index, timeout=None):
+        """Block until a slice has arrived (True) or the timeout expires (False)"""
+        if self.series_data is None or not 0 <= slice_index < len(self.series_data):
+            return False
+        if self.series_data[slice_index] is None:
+            # A slice that landed before this handler was listening is picked up from disk
+            self._add_cached_slice(slice_index)
+        if self.series_data[slice_index] is None:
+            with self._slice_ready:
+                self._slice_ready.wait_for(lambda: self.series_data[slice_index] is not None, timeout)
+        return self.series_data[slice_index] is not None
+
+    def _add_cached_slice(self, slice_index):
+        if not self._slice_ids:
+            return
+        instance_id = self._slice_ids[slice_index]
+        dcm_file = self.cache_dir / 'CT' / f"{instance_id}.dcm"
+        if dcm_file.exists():
+            self.add_ct_slice(instance_id, dcm_file)
+
+    def loaded_slice_count(self):
+        """Number of CT slices available for rendering"""
+        return sum(1 for ds in self.series_data or [] if ds is not None)
+
+    def _load_structures(self):
+        """Load the RTSTRUCT that matches the project's ROI labels"""
+        rt_dir = self.cache_dir / 'RTSTRUCT'
+        if rt_dir.exists():
+            rt_files = list(rt_dir.glob('*.dcm'))
+            if rt_files:
+                rt_file_to_load = None
+                if len(rt_files) == 1:
+                    rt_file_to_load = rt_files[0]
+                elif len(rt_files) > 1:
+                    for rt_file in rt_files:
+                        rt_struct = pydicom.dcmread(str(rt_file))
+                        roi_names = {str(struct.ROIName).lower() for struct in rt_struct.StructureSetROISequence}
+                        if 'all' in self.roi_labels and len(roi_names) > 0:
+                            rt_file_to_load = rt_file
+                            self.found_roi_labels = roi_names
+                            print(f"RTSTRUCT file found with all ROIs: {rt_file_to_load}")
+                            break
+                        intersection = self.roi_labels.intersection(roi_names)
+                        if intersection:
+                            print(f"Found matching ROI in {rt_file}: {intersection}")
+                            rt_file_to_load = rt_file
+                            break
+                if rt_file_to_load:
+                    self._load_rt_structures(rt_file_to_load)
+                    self._debug(f"Loaded RTSTRUCT file: {rt_file_to_load}")
+                else:
+                    self._debug("No matching ROIs found in RTSTRUCT files")
+                    raise ValueError("No matching ROIs found in RTSTRUCT files")
+            else:
+                self._debug("No RTSTRUCT files found")
+        else:
+            self._debug(f"No RTSTRUCT directory found at {rt_dir}")
+
     def _load_ct_series(self, ct_dir):
         """Load CT series from cache directory"""
         try:
             self._debug(f"\nLoading CT series from {ct_dir}")
             series_files = list(ct_dir.glob('*.dcm'))
-            series_data = []
             
-            # First pass: collect all slices and positions
-            for dcm_file in series_files:
-                ds = pydicom.dcmread(str(dcm_file))
-                pos = float(ds.SliceLocation)
-                series_data.append((pos, ds, dcm_file))
-                
+            # First pass: collect all slices, decoding in parallel
+            with ThreadPoolExecutor(max_workers=DECODE_WORKERS) as executor:
+                series_data = list(zip(executor.map(read_ct_slice, series_files), series_files))
+
             # Sort by position from inferior to superior
-            series_data.sort(key=lambda x: x[0])
+            series_data, positions = sort_ct_slices(series_data, z=lambda item: slice_z(item[0]))
             
             self._debug("\nDEBUG: Sorted slice order")
             self._debug("=" * 50)
-            for pos, _, f in series_data:
+            for pos, (_, f) in zip(positions, series_data):
                 self._debug(f"File: {f.name:30} | Position: {pos:8.2f}")
 
                 
             # Store sorted data
-            self.series_data = [ds for _, ds, _ in series_data]
-            self.slice_positions = [pos for pos, _, _ in series_data]
+            self.series_data = [ds for ds, _ in series_data]
+            self.slice_positions = positions
+            self.reference_slice = self.series_data[0] if self.series_data else None
             
             self._debug(f"\nLoaded {len(self.series_data)} slices")
             self._debug(f"Position range: {self.slice_positions[0]:.2f} to {self.slice_positions[-1]:.2f}")
@@ -201,8 +349,8 @@ class DicomHandler:
     def _convert_to_pixel_coords(self, points):
         """Convert DICOM coordinates to pixel coordinates"""
         # Get image position and spacing from series data
-        image_position = self.series_data[0].ImagePositionPatient
-        pixel_spacing = self.series_data[0].PixelSpacing
+        image_position = self.reference_slice.ImagePositionPatient
+        pixel_spacing = self.reference_slice.PixelSpacing
         
         # Convert points to pixel coordinates
         x_points = (points[:, 0] - image_position[0]) / pixel_spacing[0]
@@ -292,7 +440,7 @@ class DicomHandler:
 
     def _get_windowed_image(self, slice_index, window=None, level=None):
         """Get windowed CT image"""
-        if 0 <= slice_index < len(self.series_data):
+        if 0 <= slice_index < len(self.series_data) and self.series_data[slice_index] is not None:
             # Use provided window/level or defaults
             window = window if window is not None else self.window
             level = level if level is not None else self.level
@@ -477,6 +625,11 @@ class DicomHandler:
             closest_slice_idx = min(range(len(self.slice_positions)), 
                                   key=lambda i: abs(self.slice_positions[i] - slice_position))
             slice_data = self.series_data[closest_slice_idx]
+            if slice_data is None:
+                # Still downloading (progressive load): any slice has the same in-plane geometry
+                slice_data = self.reference_slice
+            if slice_data is None:
+                return
             
             # Get color for this structure
             color = self._get_color_for_structure(structure_name)
@@ -583,16 +736,33 @@ class DicomHandler:
     def find_first_contour_slice(self):
         """Find the slice index where contours first appear"""
         try:
-            if not self.processed_contours_cache:
+            if self.processed_contours_cache:
+                contour_slices = (idx for idx, contours in self.processed_contours_cache.items() if contours)
+            elif self.structure_sets and self.slice_positions:
+                # Progressive load before the first CT slice: match contour z to slice positions
+                contour_slices = self._contour_slice_indices()
+            else:
                 return 0
-            first_contour_slice = min((idx for idx, contours in self.processed_contours_cache.items() 
-                          if contours), default=0)
+            first_contour_slice = min(contour_slices, default=0)
             return max(0, first_contour_slice - 3)
         except Exception as e:
             print(f"Error finding first contour slice: {str(e)}")
             traceback.print_exc()
             return 0
 
+    def _contour_slice_indices(self, tolerance=0.5):
+        """Slice indices with a contour of an allowed ROI, from positions alone"""
+        indices = set()
+        for struct_set in self.structure_sets.values():
+            for name, data in struct_set.items():
+                if (self.roi_labels and name.lower() not in self.roi_labels) and 'all' not in self.roi_labels:
+                    continue
+                for z_pos in data['contours']:
+                    for idx, slice_pos in enumerate(self.slice_positions):
+                        if abs(float(z_pos) - slice_pos) <= tolerance:
+                            indices.add(idx)
+        return indices
+
     def get_contour_slice_ranges(self):
         """Get the range of slices containing contours for each structure"""
         try:
@@ -628,6 +798,13 @@ class DicomHandler:
 
 ############ DOSE HANDLING ############
 
+    def refresh_dose(self):
+        """Load an RTDOSE that finished downloading after the study was opened"""
+        if self.series_data is None:
+            return False
+        self._load_rt_dose()
+        return self.dose is not None
+
     def _load_rt_dose(self):
         """
         Load and process the RTDOSE file.
@@ -674,8 +851,8 @@ class DicomHandler:
             y_dose = np.arange(dose_metadata['Rows']) * dose_metadata['PixelSpacing'][0] + dose_metadata['ImagePositionPatient'][1]
             z_dose = np.array(dose_metadata['GridFrameOffsetVector']) + dose_metadata['ImagePositionPatient'][2]
 
-            # Get CT metadata from the first CT slice
-            ct_ds = self.series_data[0]
+            # Get CT metadata from a loaded CT slice (all share the in-plane grid)
+            ct_ds = self.reference_slice
             ct_pixel_spacing = [float(x) for x in ct_ds.PixelSpacing]
             ct_rows = int(ct_ds.Rows)
             ct_cols = int(ct_ds.Columns)
@@ -685,7 +862,7 @@ class DicomHandler:
             z_ct = np.array(self.slice_positions)
 
             # Interpolate dose data onto the CT grid
-            interpolator = RegularGridInterpolator(
+            interpolator = scipy_interpolate.RegularGridInterpolator(
                 (z_dose, y_dose, x_dose),
                 dose_data,
                 method='linear',
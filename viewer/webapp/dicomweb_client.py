@@ -0,0 +1,100 @@
+# webapp/dicomweb_client.py
+import re
+import threading
+
+import numpy as np
+import pydicom
+
+from config import DOWNLOAD_WORKERS, DOWNLOAD_TIMEOUT
+from medai_common.orthanc_client import OrthancClient
+
+DICOM_JSON = 'application/dicom+json'
+# Uncompressed little-endian frames, which need no decoder on our side
+FRAME_ACCEPT = 'multipart/related; type="application/octet-stream"; transfer-syntax=1.2.840.10008.1.2.1'
+
+
+class DicomWebClient:
+    """Minimal WADO-RS client for the Orthanc DICOMweb plugin"""
+
+    def __init__(self, base_url, auth=None, timeout=DOWNLOAD_TIMEOUT, pool_size=DOWNLOAD_WORKERS, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        if session is None:
+            # Standalone use; the viewer passes the pooled session of its OrthancClient
+            session = OrthancClient(base_url, auth=auth, timeout=timeout, pool_size=pool_size).session
+        self.session = session
+
+    def series_metadata(self, study_uid, series_uid):
+        """Metadata of every instance in a series in one bulk call, as pixel-less pydicom datasets"""
+        response = self.session.get(
+            f"{self.base_url}/studies/{study_uid}/series/{series_uid}/metadata",
+            headers={'Accept': DICOM_JSON},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        # Bulk data (PixelData) is only referenced by URI in the metadata; frames are fetched on demand
+        return [pydicom.Dataset.from_json(item, bulk_data_uri_handler=lambda *args: None)
+                for item in response.json()]
+
+    def retrieve_frames(self, study_uid, series_uid, sop_uid, frames=(1,)):
+        """Fetch raw pixel frames of one instance, returned as a list of bytes in request order"""
+        frame_list = ','.join(str(frame) for frame in frames)
+        response = self.session.get(
+            f"{self.base_url}/studies/{study_uid}/series/{series_uid}/instances/{sop_uid}/frames/{frame_list}",
+            headers={'Accept': FRAME_ACCEPT},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return parse_multipart_related(response.content, response.headers.get('Content-Type', ''))
+
+
+def parse_multipart_related(body, content_type):
+    """Split a multipart/related body into the payloads of its parts"""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        raise ValueError(f"No boundary in Content-Type: {content_type}")
+    delimiter = b'--' + match.group(1).encode('ascii')
+
+    parts = []
+    for chunk in body.split(delimiter)[1:]:
+        if chunk.startswith(b'--'):
+            break  # Closing delimiter
+        header_end = chunk.find(b'\r\n\r\n')
+        if header_end < 0:
+            continue
+        payload = chunk[header_end + 4:]
+        # The CRLF before the next delimiter belongs to the delimiter, not the payload
+        if payload.endswith(b'\r\n'):
+            payload = payload[:-2]
+        parts.append(payload)
+    return parts
+
+
+class LazySlice:
+    """
+    A CT slice whose header came from DICOMweb metadata and whose pixels are
+    fetched as a single frame the first time pixel_array is read. Attribute
+    access is delegated to the header, so DicomHandler treats it like a dataset.
+    """
+
+    def __init__(self, client, study_uid, series_uid, ds):
+        self._client = client
+        self._study_uid = study_uid
+        self._series_uid = series_uid
+        self._ds = ds
+        self._pixels = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._ds, name)
+
+    @property
+    def pixel_array(self):
+        with self._lock:
+            if self._pixels is None:
+                frame = self._client.retrieve_frames(self._study_uid, self._series_uid,
+                                                     self._ds.SOPInstanceUID)[0]
+                dtype = np.dtype(f"{'i' if self._ds.PixelRepresentation else 'u'}{self._ds.BitsAllocated // 8}")
+                self._pixels = np.frombuffer(frame, dtype=dtype.newbyteorder('<')).reshape(
+                    int(self._ds.Rows), int(self._ds.Columns))
+            return self._pixels
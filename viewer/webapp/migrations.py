@@ -0,0 +1,439 @@
+# webapp/migrations.py
+"""
+Versioned schema changes for the review database.
+
+_create_schema creates the base tables; each migration below is applied once,
+in order, and the database's PRAGMA user_version records the last one applied.
+Add new changes as a new version at the end, never by editing an applied one.
+"""
+import re
+
+from review_queue import NEXT_UNREVIEWED, NEXT_QUEUED, sort_key_sql
+
+
+def issues_json_sql(review):
+    """
+    The review's comma-separated issues as a JSON array string (lower-cased,
+    control characters blanked), or '[]' if it cannot be made valid JSON
+    """
+    text = (f"replace(replace(replace(replace(replace(lower(COALESCE({review}.issues, '')), "
+            f"'\\', '\\\\'), '\"', '\\\"'), char(10), ' '), char(13), ' '), char(9), ' ')")
+    array = f"""('["' || replace({text}, ',', '","') || '"]')"""
+    return f"(CASE WHEN json_valid({array}) THEN {array} ELSE '[]' END)"
+
+
+def add_review_sql(review, sign):
+    """Trigger statements adding (sign 1) or removing (sign -1) a review in the summary tables"""
+    if sign > 0:
+        issues = f"""
+            INSERT OR IGNORE INTO review_issues (review_id, project_id, user_id, issue)
+            SELECT {review}.review_id, {review}.project_id, {review}.user_id, trim(value)
+            FROM json_each({issues_json_sql(review)})
+            WHERE trim(value) != '';"""
+    else:
+        issues = f"""
+            DELETE FROM review_issues WHERE review_id = {review}.review_id;"""
+    return issues + f"""
+            INSERT INTO review_quality_counts (project_id, user_id, quality_rating, reviews)
+            SELECT {review}.project_id, {review}.user_id, {review}.quality_rating, {sign}
+            WHERE {review}.quality_rating IS NOT NULL
+            ON CONFLICT (project_id, user_id, quality_rating) DO UPDATE SET reviews = reviews + excluded.reviews;
+            INSERT INTO reviewer_activity (project_id, user_id, day, reviews)
+            SELECT {review}.project_id, {review}.user_id, DATE({review}.review_date), {sign}
+            WHERE DATE({review}.review_date) IS NOT NULL
+            ON CONFLICT (project_id, user_id, day) DO UPDATE SET reviews = reviews + excluded.reviews;"""
+
+
+def fts_row_sql(study, action):
+    """Trigger statement adding (INSERT) or removing (DELETE) a studies row in studies_fts"""
+    command = "studies_fts, " if action == 'DELETE' else ''
+    value = "'delete', " if action == 'DELETE' else ''
+    return f"""
+            INSERT INTO studies_fts ({command}rowid, patient_name, patient_id, study_description)
+            VALUES ({value}{study}.unique_id, {study}.patient_name, {study}.patient_id, {study}.study_description);"""
+
+
+def fts_match_query(term):
+    """
+    FTS5 MATCH expression for a search box entry: every word must match the
+    start of a word in the indexed fields ("smi jo" -> "smi"* AND "jo"*), or
+    None if the entry has no words
+    """
+    words = re.findall(r'\w+', term or '')
+    return ' AND '.join(f'"{word}"*' for word in words) or None
+
+
+MIGRATIONS = [
+    (1, 'indexes for the review queue, dashboard, summary and search queries', [
+        # Project study lists, ordered by study_id for the next-study queue
+        'CREATE INDEX IF NOT EXISTS idx_studies_project ON studies (project_id, study_id)',
+        'CREATE INDEX IF NOT EXISTS idx_studies_project_date ON studies (project_id, study_date)',
+        # A reviewer's statuses in one project, most recent first (prefetcher position)
+        '''CREATE INDEX IF NOT EXISTS idx_user_study_status_project
+           ON user_study_status (user_id, project_id, last_modified, status)''',
+        # Review lookup from a study row, and per-reviewer summaries by rating
+        'CREATE INDEX IF NOT EXISTS idx_reviews_study ON reviews (study_id, project_id, user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_project_user ON reviews (project_id, user_id, quality_rating)',
+        'CREATE INDEX IF NOT EXISTS idx_user_projects_project ON user_projects (project_id, user_id)',
+    ]),
+    (2, 'per-project study counts and per-reviewer progress counters kept by triggers', [
+        'CREATE INDEX IF NOT EXISTS idx_user_study_status_study ON user_study_status (study_id, project_id)',
+        '''CREATE TABLE IF NOT EXISTS project_study_counts (
+               project_id TEXT PRIMARY KEY,
+               total INTEGER NOT NULL DEFAULT 0
+           )''',
+        # Statuses of a reviewer's studies that are currently in the project
+        '''CREATE TABLE IF NOT EXISTS project_user_progress (
+               user_id INTEGER,
+               project_id TEXT,
+               reviewed INTEGER NOT NULL DEFAULT 0,
+               in_progress INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (user_id, project_id)
+           )''',
+        '''INSERT OR REPLACE INTO project_study_counts (project_id, total)
+           SELECT project_id, COUNT(*) FROM studies GROUP BY project_id''',
+        '''INSERT OR REPLACE INTO project_user_progress (user_id, project_id, reviewed, in_progress)
+           SELECT uss.user_id, uss.project_id, SUM(uss.status IS 'reviewed'), SUM(uss.status IS 'in_progress')
+           FROM user_study_status uss
+           JOIN studies s ON s.study_id = uss.study_id AND s.project_id = uss.project_id
+           GROUP BY uss.user_id, uss.project_id''',
+        '''CREATE TRIGGER IF NOT EXISTS studies_progress_insert AFTER INSERT ON studies
+           BEGIN
+               INSERT INTO project_study_counts (project_id, total) VALUES (NEW.project_id, 1)
+               ON CONFLICT (project_id) DO UPDATE SET total = total + 1;
+               INSERT INTO project_user_progress (user_id, project_id, reviewed, in_progress)
+               SELECT user_id, project_id, status IS 'reviewed', status IS 'in_progress'
+               FROM user_study_status
+               WHERE study_id = NEW.study_id AND project_id = NEW.project_id
+               ON CONFLICT (user_id, project_id) DO UPDATE SET
+                   reviewed = reviewed + excluded.reviewed,
+                   in_progress = in_progress + excluded.in_progress;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS studies_progress_delete AFTER DELETE ON studies
+           BEGIN
+               UPDATE project_study_counts SET total = total - 1 WHERE project_id = OLD.project_id;
+               UPDATE project_user_progress SET
+                   reviewed = reviewed - (
+                       SELECT COUNT(*) FROM user_study_status u
+                       WHERE u.user_id = project_user_progress.user_id AND u.study_id = OLD.study_id
+                       AND u.project_id = OLD.project_id AND u.status = 'reviewed'),
+                   in_progress = in_progress - (
+                       SELECT COUNT(*) FROM user_study_status u
+                       WHERE u.user_id = project_user_progress.user_id AND u.study_id = OLD.study_id
+                       AND u.project_id = OLD.project_id AND u.status = 'in_progress')
+               WHERE project_id = OLD.project_id AND user_id IN (
+                   SELECT user_id FROM user_study_status WHERE study_id = OLD.study_id AND project_id = OLD.project_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS user_study_status_progress_insert AFTER INSERT ON user_study_status
+           WHEN EXISTS (SELECT 1 FROM studies WHERE study_id = NEW.study_id AND project_id = NEW.project_id)
+           BEGIN
+               INSERT INTO project_user_progress (user_id, project_id, reviewed, in_progress)
+               VALUES (NEW.user_id, NEW.project_id, NEW.status IS 'reviewed', NEW.status IS 'in_progress')
+               ON CONFLICT (user_id, project_id) DO UPDATE SET
+                   reviewed = reviewed + excluded.reviewed,
+                   in_progress = in_progress + excluded.in_progress;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS user_study_status_progress_update AFTER UPDATE OF status ON user_study_status
+           WHEN EXISTS (SELECT 1 FROM studies WHERE study_id = NEW.study_id AND project_id = NEW.project_id)
+           BEGIN
+               UPDATE project_user_progress SET
+                   reviewed = reviewed - (OLD.status IS 'reviewed') + (NEW.status IS 'reviewed'),
+                   in_progress = in_progress - (OLD.status IS 'in_progress') + (NEW.status IS 'in_progress')
+               WHERE user_id = NEW.user_id AND project_id = NEW.project_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS user_study_status_progress_delete AFTER DELETE ON user_study_status
+           WHEN EXISTS (SELECT 1 FROM studies WHERE study_id = OLD.study_id AND project_id = OLD.project_id)
+           BEGIN
+               UPDATE project_user_progress SET
+                   reviewed = reviewed - (OLD.status IS 'reviewed'),
+                   in_progress = in_progress - (OLD.status IS 'in_progress')
+               WHERE user_id = OLD.user_id AND project_id = OLD.project_id;
+           END''',
+    ]),
+    (3, 'per-reviewer queues of unreviewed studies kept by triggers', [
+        "ALTER TABLE projects ADD COLUMN queue_order TEXT DEFAULT 'study_id'",
+        'ALTER TABLE studies ADD COLUMN priority INTEGER DEFAULT 0',
+        '''CREATE TABLE IF NOT EXISTS review_queue (
+               user_id INTEGER,
+               project_id TEXT,
+               sort_key TEXT,
+               study_id TEXT,
+               PRIMARY KEY (user_id, project_id, sort_key)
+           ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_review_queue_study ON review_queue (project_id, study_id)',
+        f'''INSERT OR IGNORE INTO review_queue (user_id, project_id, sort_key, study_id)
+            SELECT up.user_id, s.project_id, {sort_key_sql('s')}, s.study_id
+            FROM user_projects up
+            JOIN studies s ON s.project_id = up.project_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM user_study_status uss
+                WHERE uss.user_id = up.user_id AND uss.study_id = s.study_id
+                AND uss.project_id = s.project_id AND uss.status = 'reviewed')''',
+        f'''CREATE TRIGGER IF NOT EXISTS studies_queue_insert AFTER INSERT ON studies
+            BEGIN
+                INSERT OR IGNORE INTO review_queue (user_id, project_id, sort_key, study_id)
+                SELECT up.user_id, NEW.project_id, {sort_key_sql('NEW')}, NEW.study_id
+                FROM user_projects up
+                WHERE up.project_id = NEW.project_id
+                AND NOT EXISTS (
+                    SELECT 1 FROM user_study_status uss
+                    WHERE uss.user_id = up.user_id AND uss.study_id = NEW.study_id
+                    AND uss.project_id = NEW.project_id AND uss.status = 'reviewed');
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS studies_queue_update AFTER UPDATE OF study_date, priority ON studies
+            BEGIN
+                UPDATE review_queue SET sort_key = {sort_key_sql('NEW')}
+                WHERE project_id = NEW.project_id AND study_id = NEW.study_id;
+            END''',
+        '''CREATE TRIGGER IF NOT EXISTS studies_queue_delete AFTER DELETE ON studies
+           BEGIN
+               DELETE FROM review_queue WHERE project_id = OLD.project_id AND study_id = OLD.study_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS user_study_status_queue_reviewed
+           AFTER INSERT ON user_study_status WHEN NEW.status = 'reviewed'
+           BEGIN
+               DELETE FROM review_queue
+               WHERE project_id = NEW.project_id AND study_id = NEW.study_id AND user_id = NEW.user_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS user_study_status_queue_update_reviewed
+           AFTER UPDATE OF status ON user_study_status WHEN NEW.status = 'reviewed'
+           BEGIN
+               DELETE FROM review_queue
+               WHERE project_id = NEW.project_id AND study_id = NEW.study_id AND user_id = NEW.user_id;
+           END''',
+        f'''CREATE TRIGGER IF NOT EXISTS user_study_status_queue_update_reopened
+            AFTER UPDATE OF status ON user_study_status
+            WHEN OLD.status = 'reviewed' AND NEW.status IS NOT 'reviewed'
+            BEGIN
+                INSERT OR IGNORE INTO review_queue (user_id, project_id, sort_key, study_id)
+                SELECT up.user_id, s.project_id, {sort_key_sql('s')}, s.study_id
+                FROM user_projects up
+                JOIN studies s ON s.project_id = up.project_id AND s.study_id = NEW.study_id
+                WHERE up.user_id = NEW.user_id AND up.project_id = NEW.project_id;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS user_study_status_queue_delete
+            AFTER DELETE ON user_study_status WHEN OLD.status = 'reviewed'
+            BEGIN
+                INSERT OR IGNORE INTO review_queue (user_id, project_id, sort_key, study_id)
+                SELECT up.user_id, s.project_id, {sort_key_sql('s')}, s.study_id
+                FROM user_projects up
+                JOIN studies s ON s.project_id = up.project_id AND s.study_id = OLD.study_id
+                WHERE up.user_id = OLD.user_id AND up.project_id = OLD.project_id;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS user_projects_queue_insert AFTER INSERT ON user_projects
+            BEGIN
+                INSERT OR IGNORE INTO review_queue (user_id, project_id, sort_key, study_id)
+                SELECT NEW.user_id, s.project_id, {sort_key_sql('s')}, s.study_id
+                FROM studies s
+                WHERE s.project_id = NEW.project_id
+                AND NOT EXISTS (
+                    SELECT 1 FROM user_study_status uss
+                    WHERE uss.user_id = NEW.user_id AND uss.study_id = s.study_id
+                    AND uss.project_id = s.project_id AND uss.status = 'reviewed');
+            END''',
+        '''CREATE TRIGGER IF NOT EXISTS user_projects_queue_delete AFTER DELETE ON user_projects
+           BEGIN
+               DELETE FROM review_queue WHERE user_id = OLD.user_id AND project_id = OLD.project_id;
+           END''',
+    ]),
+    (4, 'normalized review issues and per-reviewer rating and activity summaries kept by triggers', [
+        # One row per comma-separated issue of a review, lower-cased and trimmed
+        """CREATE TABLE IF NOT EXISTS review_issues (
+               review_id INTEGER,
+               project_id TEXT,
+               user_id INTEGER,
+               issue TEXT,
+               PRIMARY KEY (review_id, issue)
+           )""",
+        'CREATE INDEX IF NOT EXISTS idx_review_issues_project ON review_issues (project_id, user_id, issue)',
+        """CREATE TABLE IF NOT EXISTS review_quality_counts (
+               project_id TEXT,
+               user_id INTEGER,
+               quality_rating INTEGER,
+               reviews INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (project_id, user_id, quality_rating)
+           )""",
+        """CREATE TABLE IF NOT EXISTS reviewer_activity (
+               project_id TEXT,
+               user_id INTEGER,
+               day TEXT,
+               reviews INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (project_id, user_id, day)
+           )""",
+        f"""INSERT OR IGNORE INTO review_issues (review_id, project_id, user_id, issue)
+            SELECT r.review_id, r.project_id, r.user_id, trim(i.value)
+            FROM reviews r, json_each({issues_json_sql('r')}) i
+            WHERE trim(i.value) != ''""",
+        """INSERT OR REPLACE INTO review_quality_counts (project_id, user_id, quality_rating, reviews)
+           SELECT project_id, user_id, quality_rating, COUNT(*) FROM reviews
+           WHERE quality_rating IS NOT NULL
+           GROUP BY project_id, user_id, quality_rating""",
+        """INSERT OR REPLACE INTO reviewer_activity (project_id, user_id, day, reviews)
+           SELECT project_id, user_id, DATE(review_date), COUNT(*) FROM reviews
+           WHERE DATE(review_date) IS NOT NULL
+           GROUP BY project_id, user_id, DATE(review_date)""",
+        f"""CREATE TRIGGER IF NOT EXISTS reviews_summary_insert AFTER INSERT ON reviews
+            BEGIN
+                {add_review_sql('NEW', 1)}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS reviews_summary_update
+            AFTER UPDATE OF project_id, user_id, review_date, quality_rating, issues ON reviews
+            BEGIN
+                {add_review_sql('OLD', -1)}
+                {add_review_sql('NEW', 1)}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS reviews_summary_delete AFTER DELETE ON reviews
+            BEGIN
+                {add_review_sql('OLD', -1)}
+            END""",
+    ]),
+    (5, 'full-text index over patient names, patient IDs and study descriptions kept by triggers', [
+        # External-content FTS5 table over studies (rowid = studies.unique_id), with
+        # prefix indexes so a partially typed name is an index lookup
+        """CREATE VIRTUAL TABLE IF NOT EXISTS studies_fts USING fts5(
+               patient_name, patient_id, study_description,
+               content = 'studies', content_rowid = 'unique_id',
+               tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+           )""",
+        "INSERT INTO studies_fts (studies_fts) VALUES ('rebuild')",
+        f"""CREATE TRIGGER IF NOT EXISTS studies_fts_insert AFTER INSERT ON studies
+            BEGIN
+                {fts_row_sql('NEW', 'INSERT')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS studies_fts_update
+            AFTER UPDATE OF patient_name, patient_id, study_description ON studies
+            BEGIN
+                {fts_row_sql('OLD', 'DELETE')}
+                {fts_row_sql('NEW', 'INSERT')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS studies_fts_delete AFTER DELETE ON studies
+            BEGIN
+                {fts_row_sql('OLD', 'DELETE')}
+            END""",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# The per-request queries the indexes are meant for, with sample parameters
+HOT_QUERIES = {
+    'get_next_study': (NEXT_QUEUED.format(op='>'), (1, 'p', 'study-id', 10)),
+    'get_next_study_unassigned': (NEXT_UNREVIEWED.format(op='>'), (1, 'p', '', 10)),
+    'get_project_stats': ('''
+        SELECT
+            COUNT(DISTINCT s.study_id) as total_studies,
+            COUNT(DISTINCT CASE WHEN uss.status = 'reviewed' THEN s.study_id END) as reviewed
+        FROM studies s
+        LEFT JOIN user_study_status uss ON
+            s.study_id = uss.study_id
+            AND s.project_id = uss.project_id
+            AND uss.user_id = ?
+        WHERE s.project_id = ?
+    ''', (1, 'p')),
+    'get_project_studies': ('''
+        SELECT s.*, COALESCE(uss.status, 'unreviewed') as status, r.quality_rating
+        FROM studies s
+        LEFT JOIN user_study_status uss ON
+            s.study_id = uss.study_id
+            AND s.project_id = uss.project_id
+            AND uss.user_id = ?
+        LEFT JOIN reviews r ON
+            s.study_id = r.study_id
+            AND s.project_id = r.project_id
+            AND r.user_id = ?
+        WHERE s.project_id = ?
+    ''', (1, 1, 'p')),
+    'get_project_studies_reviewed': ('''
+        SELECT s.*, r.quality_rating, u.username as reviewer
+        FROM studies s
+        JOIN reviews r ON s.study_id = r.study_id AND s.project_id = r.project_id
+        JOIN users u ON r.user_id = u.user_id
+        WHERE s.project_id = ? AND r.user_id = ?
+    ''', ('p', 1)),
+    'get_project_summary': ('''
+        SELECT quality_rating, SUM(reviews)
+        FROM review_quality_counts
+        WHERE project_id = ? AND user_id = ?
+        GROUP BY quality_rating
+    ''', ('p', 1)),
+    'get_common_issues': ('''
+        SELECT issue, COUNT(*) as count
+        FROM review_issues
+        WHERE project_id = ? AND user_id = ?
+        GROUP BY issue ORDER BY count DESC, issue LIMIT ?
+    ''', ('p', 1, 5)),
+    'search_studies': ('''
+        SELECT s.* FROM studies s
+        WHERE s.project_id = ? AND s.study_date BETWEEN ? AND ?
+        ORDER BY s.study_date
+    ''', ('p', '20240101', '20241231')),
+    'search_studies_text': ('''
+        SELECT s.* FROM studies_fts f
+        JOIN studies s ON s.unique_id = f.rowid
+        WHERE studies_fts MATCH ? AND s.project_id = ?
+        AND (COALESCE(s.study_date, ''), s.study_id) < (?, ?)
+        ORDER BY COALESCE(s.study_date, '') DESC, s.study_id DESC
+        LIMIT ?
+    ''', ('"smi"*', 'p', '99999999', '', 50)),
+    'prefetch_position': ('''
+        SELECT study_id FROM user_study_status
+        WHERE user_id = ? AND project_id = ?
+        ORDER BY last_modified DESC
+        LIMIT 1
+    ''', (1, 'p')),
+    'get_user_projects': ('''
+        SELECT p.*, COUNT(s.study_id) as total, COUNT(CASE WHEN uss.status = 'reviewed' THEN 1 END) as reviewed
+        FROM user_projects up
+        JOIN projects p ON p.project_id = up.project_id
+        LEFT JOIN studies s ON s.project_id = up.project_id
+        LEFT JOIN user_study_status uss ON
+            uss.user_id = up.user_id
+            AND uss.study_id = s.study_id
+            AND uss.project_id = s.project_id
+        WHERE up.user_id = ?
+        GROUP BY up.project_id
+    ''', (1,)),
+    'get_user_projects_counters': ('''
+        SELECT p.*, COALESCE(c.total, 0) as total, COALESCE(pr.reviewed, 0) as reviewed
+        FROM user_projects up
+        JOIN projects p ON p.project_id = up.project_id
+        LEFT JOIN project_study_counts c ON c.project_id = up.project_id
+        LEFT JOIN project_user_progress pr ON pr.user_id = up.user_id AND pr.project_id = up.project_id
+        WHERE up.user_id = ?
+    ''', (1,)),
+}
+
+
+def migrate(conn):
+    """Apply migrations newer than the database's user_version; returns the versions applied"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    applied = []
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        print(f"Applying schema migration {migration_version}: {description}")
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(f'PRAGMA user_version = {migration_version}')
+        conn.commit()
+        applied.append(migration_version)
+    return applied
+
+
+def query_plan(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN detail lines for a query"""
+    return [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def full_scans(conn, queries=None):
+    """
+    {query name: plan lines that read a whole table or index} for the hot queries.
+    A virtual table SCAN with a non-empty index string (e.g. an FTS5 MATCH) is a lookup.
+    """
+    scans = {}
+    for name, (sql, params) in (queries or HOT_QUERIES).items():
+        lines = [line for line in query_plan(conn, sql, params)
+                 if line.startswith('SCAN ') and not re.search(r'VIRTUAL TABLE INDEX \d+:\S', line)]
+        if lines:
+            scans[name] = lines
+    return scans
@@ -0,0 +1,335 @@
+# webapp/orthanc_sync.py
+import time
+
+# Study-level changes after which the study's tags or labels are re-read
+STUDY_CHANGES = {'NewStudy', 'StableStudy', 'UpdatedMetadata'}
+
+UPSERT_STUDY = '''
+    INSERT INTO studies (
+        study_id, project_id, patient_id, patient_name,
+        study_date, study_description, orthanc_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (study_id, project_id) DO UPDATE SET
+        patient_id = excluded.patient_id,
+        patient_name = excluded.patient_name,
+        study_date = excluded.study_date,
+        study_description = excluded.study_description,
+        orthanc_id = excluded.orthanc_id
+    WHERE patient_id IS NOT excluded.patient_id
+        OR patient_name IS NOT excluded.patient_name
+        OR study_date IS NOT excluded.study_date
+        OR study_description IS NOT excluded.study_description
+        OR orthanc_id IS NOT excluded.orthanc_id
+'''
+
+# Bulk load into an empty studies table: nothing to update, so no conflict handling
+INSERT_STUDY = '''
+    INSERT OR IGNORE INTO studies (
+        study_id, project_id, patient_id, patient_name,
+        study_date, study_description, orthanc_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+DELETE_STUDY = 'DELETE FROM studies WHERE study_id = ? AND project_id = ?'
+
+
+class StudyUpsertBuffer:
+    """
+    Collects studies rows and removals and writes them with executemany, one
+    transaction per batch_size rows.
+
+    With bulk=True (the studies table was empty when the sync started) rows are
+    sorted by key and written with plain INSERTs in a single transaction at
+    flush(), since there is nothing to update or remove.
+    """
+
+    def __init__(self, conn, batch_size=500, stats=None, bulk=False):
+        self.conn = conn
+        self.batch_size = max(1, batch_size)
+        self.bulk = bulk
+        self.stats = stats if stats is not None else {}
+        for key in ('rows', 'upserted', 'removed', 'write_seconds'):
+            self.stats.setdefault(key, 0)
+        self.rows = []
+        self.removals = []
+
+    def add(self, rows):
+        self.rows.extend(rows)
+        if not self.bulk and len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def remove(self, keys):
+        self.removals.extend(keys)
+        if len(self.removals) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered and commit, together with anything else done on conn since the last commit"""
+        start = time.perf_counter()
+        rows, self.rows = self.rows, []
+        removals, self.removals = self.removals, []
+        self.stats['rows'] += len(rows) + len(removals)
+        if self.bulk:
+            rows.sort(key=lambda row: (row[0], row[1]))
+            # rowcount leaves out rows written by triggers (counters, queues, search index)
+            self.stats['upserted'] += self.conn.executemany(INSERT_STUDY, rows).rowcount
+            rows = []
+        batches = [(UPSERT_STUDY, rows[i:i + self.batch_size]) for i in range(0, len(rows), self.batch_size)]
+        batches += [(DELETE_STUDY, removals[i:i + self.batch_size]) for i in range(0, len(removals), self.batch_size)]
+        for n, (statement, batch) in enumerate(batches):
+            if n:
+                self.conn.commit()
+            key = 'upserted' if statement is UPSERT_STUDY else 'removed'
+            self.stats[key] += self.conn.executemany(statement, batch).rowcount
+        self.conn.commit()
+        self.stats['write_seconds'] += time.perf_counter() - start
+
+
+class OrthancSync:
+    """
+    Keeps the studies table in step with Orthanc by reading its /changes log.
+
+    The sequence number of the last applied change is stored in sync_state, so
+    each run only fetches the studies that were created, became stable, changed
+    or were deleted since the previous run, and writes them through a
+    StudyUpsertBuffer; the cursor is advanced in the transaction of a page's
+    last batch, so an interrupted page is replayed. Orthanc does not
+    log label edits, so project membership is reconciled with one ID-only
+    /tools/find per project label; that costs a pass over the archive, so it
+    runs at most every reconcile_interval seconds rather than on every sync.
+    A full scan happens only when there is no cursor or it no longer fits the
+    change log (Orthanc database reset or changes cleared).
+    """
+
+    def __init__(self, client, projects, name='orthanc', page_size=1000, batch_size=500,
+                 reconcile_interval=3600, on_study_changed=None):
+        self.client = client
+        # Called with the ID of every study the change log reports as changed or deleted
+        self.on_study_changed = on_study_changed
+        self.cursor_key = f"changes_seq:{name}"
+        self.reconciled_key = f"labels_reconciled:{name}"
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.reconcile_interval = reconcile_interval
+
+        # Orthanc label -> project IDs tagged by it
+        self.label_projects = {}
+        for project_id, info in projects.items():
+            self.label_projects.setdefault(info.get('label', project_id), []).append(project_id)
+        self.project_ids = [pid for pids in self.label_projects.values() for pid in pids]
+
+    def run(self, conn, reconcile_labels=None):
+        """
+        Apply everything that changed since the stored cursor; returns sync
+        statistics. reconcile_labels forces (True) or skips (False) the label
+        reconcile; by default it runs once reconcile_interval has passed.
+        """
+        start = time.perf_counter()
+        stats = {'mode': 'incremental', 'changes': 0, 'fetched': 0, 'rows': 0, 'upserted': 0, 'removed': 0}
+
+        cursor = self._load_cursor(conn)
+        last = self._last_seq()
+        if cursor is None or cursor > last or not self._consume_changes(conn, cursor, last, stats):
+            if cursor is not None:
+                print(f"Sync cursor {cursor} no longer matches the Orthanc change log (last {last}), rescanning")
+            stats['mode'] = 'full'
+            self.full_scan(conn, stats=stats, cursor=last)
+            self._mark_reconciled(conn)
+        elif reconcile_labels or (reconcile_labels is None and self._reconcile_due(conn)):
+            stats['mode'] = 'incremental+labels'
+            self._reconcile_labels(conn, stats)
+            self._mark_reconciled(conn)
+
+        finish_stats(stats, start)
+        print(f"Orthanc sync ({stats['mode']}): {stats['changes']} changes, {stats['fetched']} studies fetched, "
+              f"{stats['upserted']} rows added or changed, {stats['removed']} removed in {stats['seconds']:.2f}s "
+              f"({stats['rows_per_second']:.0f} rows/s, {stats['write_seconds']:.2f}s writing)")
+        return stats
+
+    def full_scan(self, conn, project_ids=None, start_date=None, end_date=None, stats=None, cursor=None):
+        """
+        Rebuild project membership from bulk /tools/find queries.
+
+        Rows of scanned projects that Orthanc no longer labels are removed, unless
+        a date filter limits the scan. When cursor is given it is stored with the
+        result, so the next run continues incrementally from there. An empty
+        studies table is bulk loaded.
+        """
+        start = time.perf_counter()
+        own_stats = stats is None
+        stats = {'fetched': 0} if own_stats else stats
+        wanted = set(project_ids or self.project_ids)
+        bulk = conn.execute('SELECT 1 FROM studies LIMIT 1').fetchone() is None
+        stats['bulk'] = bulk
+        buffer = StudyUpsertBuffer(conn, self.batch_size, stats, bulk=bulk)
+
+        for label, label_project_ids in self.label_projects.items():
+            label_project_ids = [pid for pid in label_project_ids if pid in wanted]
+            if not label_project_ids:
+                continue
+            studies = self.client.find(labels=[label])
+            stats['fetched'] += len(studies)
+            scanned = set()
+            for study in studies:
+                study_date = study.get('MainDicomTags', {}).get('StudyDate', '')
+                if (start_date and study_date < start_date) or (end_date and study_date > end_date):
+                    continue
+                scanned.add(study['ID'])
+                buffer.add(study_row(study, project_id) for project_id in label_project_ids)
+
+            if not (bulk or start_date or end_date):
+                for project_id in label_project_ids:
+                    known = {row[0] for row in conn.execute(
+                        'SELECT study_id FROM studies WHERE project_id = ?', (project_id,))}
+                    buffer.remove((study_id, project_id) for study_id in known - scanned)
+
+        if cursor is not None:
+            self._save_cursor(conn, cursor)
+        buffer.flush()
+        if own_stats:
+            finish_stats(stats, start)
+        return stats
+
+    def _consume_changes(self, conn, cursor, last, stats):
+        """
+        Page through /changes from the cursor; False when the log has been
+        truncated past it. Sequence numbers may have gaps, so truncation is
+        judged by where the log ends: once Orthanc reports Done, the pages read
+        must have reached `last`, the newest sequence number before reading.
+        """
+        buffer = StudyUpsertBuffer(conn, self.batch_size, stats)
+        while True:
+            page = self.client.get_json('/changes', params={'since': cursor, 'limit': self.page_size})
+            changes = page.get('Changes', [])
+
+            # Collapse the page to the final state of each study
+            changed, deleted = {}, set()
+            for change in changes:
+                if change.get('ResourceType') != 'Study':
+                    continue
+                study_id = change['ID']
+                if change['ChangeType'] == 'Deleted':
+                    changed.pop(study_id, None)
+                    deleted.add(study_id)
+                elif change['ChangeType'] in STUDY_CHANGES:
+                    deleted.discard(study_id)
+                    changed[study_id] = True
+            stats['changes'] += len(changes)
+            # Cached study JSON in this process may predate these changes
+            for study_id in list(changed) + list(deleted):
+                self.client.invalidate(f"/studies/{study_id}")
+                if self.on_study_changed:
+                    self.on_study_changed(study_id)
+
+            rows, removals = self._refresh_studies(changed, stats)
+            buffer.add(rows)
+            buffer.remove(removals)
+            buffer.remove((study_id, project_id) for study_id in deleted for project_id in self.project_ids)
+
+            cursor = max([cursor, page.get('Last', cursor)] + [change['Seq'] for change in changes])
+            done = page.get('Done', True)
+            if done and cursor < last:
+                # Changes up to `last` existed but were not returned: the log was cleared past the cursor
+                return False
+            self._save_cursor(conn, cursor)
+            buffer.flush()
+            if done:
+                return True
+
+    def _reconcile_labels(self, conn, stats):
+        """Pick up project labels added or removed since the last run"""
+        added, removals = {}, []
+        for label, label_project_ids in self.label_projects.items():
+            labelled = set(self.client.find(labels=[label], expand=False))
+            for project_id in label_project_ids:
+                known = {row[0] for row in conn.execute(
+                    'SELECT study_id FROM studies WHERE project_id = ?', (project_id,))}
+                for study_id in labelled - known:
+                    added[study_id] = True
+                removals.extend((study_id, project_id) for study_id in known - labelled)
+
+        rows, stale = self._refresh_studies(added, stats)
+        buffer = StudyUpsertBuffer(conn, self.batch_size, stats)
+        buffer.add(rows)
+        buffer.remove(removals + stale)
+        buffer.flush()
+
+    def _refresh_studies(self, study_ids, stats):
+        """Read changed studies and turn them into upserts plus removals of projects they left"""
+        rows, removals = [], []
+        study_ids = list(study_ids)
+        stats['fetched'] += len(study_ids)
+        # Changed studies are independent, so they are read concurrently
+        for study_id, study in zip(study_ids, self.client.map(self._get_study, study_ids)):
+            project_ids = set()
+            if study is not None:
+                for label in study.get('Labels', []):
+                    project_ids.update(self.label_projects.get(label, []))
+                rows.extend(study_row(study, project_id) for project_id in project_ids)
+            removals.extend((study_id, project_id) for project_id in self.project_ids
+                            if project_id not in project_ids)
+        return rows, removals
+
+    def _get_study(self, study_id):
+        """Expanded study resource with its labels, or None if it is gone"""
+        response = self.client.get(f"/studies/{study_id}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        study = response.json()
+        if 'Labels' not in study:
+            # Orthanc before 1.12 does not include labels in the study resource
+            labels = self.client.get(f"/studies/{study_id}/labels")
+            study['Labels'] = labels.json() if labels.ok else []
+        return study
+
+    def _reconcile_due(self, conn):
+        row = conn.execute('SELECT value FROM sync_state WHERE name = ?', (self.reconciled_key,)).fetchone()
+        return row is None or time.time() - float(row[0]) >= self.reconcile_interval
+
+    def _mark_reconciled(self, conn):
+        conn.execute('''
+            INSERT INTO sync_state (name, value, updated) VALUES (?, ?, datetime('now', 'localtime'))
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated = excluded.updated
+        ''', (self.reconciled_key, str(time.time())))
+        conn.commit()
+
+    def _last_seq(self):
+        return self.client.get_json('/changes', params={'last': ''}).get('Last', 0)
+
+    def _load_cursor(self, conn):
+        row = conn.execute('SELECT value FROM sync_state WHERE name = ?', (self.cursor_key,)).fetchone()
+        return int(row[0]) if row else None
+
+    def _save_cursor(self, conn, cursor):
+        conn.execute('''
+            INSERT INTO sync_state (name, value, updated) VALUES (?, ?, datetime('now', 'localtime'))
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated = excluded.updated
+        ''', (self.cursor_key, str(cursor)))
+
+    def reset(self, conn):
+        """Forget the cursor so the next run does a full scan"""
+        conn.execute('DELETE FROM sync_state WHERE name IN (?, ?)', (self.cursor_key, self.reconciled_key))
+        conn.commit()
+
+
+def finish_stats(stats, start):
+    """Add elapsed seconds and rows synced per second to sync statistics"""
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    stats['write_seconds'] = round(stats.get('write_seconds', 0), 3)
+    stats['rows_per_second'] = round(stats.get('rows', 0) / stats['seconds'], 1) if stats['seconds'] > 0 else 0.0
+
+
+def study_row(study, project_id):
+    """studies table row for an expanded Orthanc study resource"""
+    main_tags = study.get('MainDicomTags', {})
+    patient_tags = study.get('PatientMainDicomTags', {})
+    return (
+        study['ID'],
+        project_id,
+        main_tags.get('PatientID') or patient_tags.get('PatientID', 'Unknown'),
+        main_tags.get('PatientName') or patient_tags.get('PatientName', 'Unknown'),
+        main_tags.get('StudyDate', ''),
+        main_tags.get('StudyDescription', ''),
+        study['ID']
+    )
@@ -0,0 +1,212 @@
+# webapp/orthanc_writer.py
+import json
+import time
+import threading
+import traceback
+
+import requests
+
+# Pending writes picked up per pass; studies in a batch are written concurrently
+BATCH_SIZE = 50
+# Seconds between passes when nothing wakes the worker
+POLL_INTERVAL = 5
+# Retry backoff doubles per attempt up to this many seconds
+MAX_BACKOFF = 300
+
+LABEL_OPS = ('put_label', 'delete_label')
+
+# Quality labels a review replaces; only the submitted one is kept
+QUALITY_LABELS = [f"quality_{rating}" for rating in range(1, 6)]
+
+
+class OrthancWriteQueue:
+    """
+    Durable write-behind queue for Orthanc label and attachment updates.
+
+    Writes are rows in the orthanc_writes table, inserted in the caller's own
+    transaction, so a review and the Orthanc updates it implies are committed
+    together and nothing is lost if the process stops. A worker thread applies
+    them in the background as idempotent requests: one PUT or DELETE per
+    label, and a PUT per attachment. A newer write to the same label or
+    attachment replaces a pending older one. Transient failures are retried
+    with capped exponential backoff. Rejected writes (4xx) are marked failed
+    and kept for inspection.
+    """
+
+    def __init__(self, client, db, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL):
+        self.client = client
+        self.db = db
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+        self.applied = 0
+        self.retries = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, conn, study_id, put_labels=(), delete_labels=(), attachments=None):
+        """
+        Queue writes for one study on conn; they become visible to the worker
+        when the caller commits. attachments maps attachment name -> JSON-able content.
+        """
+        rows = [(study_id, 'delete_label', label, None) for label in delete_labels]
+        rows += [(study_id, 'put_label', label, None) for label in put_labels]
+        rows += [(study_id, 'put_attachment', name, json.dumps(content))
+                 for name, content in (attachments or {}).items()]
+
+        for _, op, name, _ in rows:
+            # Only the newest write to a label or attachment matters
+            conn.execute(f'''
+                DELETE FROM orthanc_writes
+                WHERE study_id = ? AND name = ? AND status = 'pending' AND op IN ({
+                    "'put_label', 'delete_label'" if op in LABEL_OPS else "'put_attachment'"})
+            ''', (study_id, name))
+        conn.executemany('''
+            INSERT INTO orthanc_writes (study_id, op, name, payload, created, next_attempt)
+            VALUES (?, ?, ?, ?, datetime('now', 'localtime'), 0)
+        ''', rows)
+
+    def set_quality_label(self, conn, study_id, rating, review=None):
+        """Queue the label changes (and review attachment) a submitted review implies"""
+        label = f"quality_{rating}"
+        self.enqueue(conn, study_id,
+                     put_labels=[label],
+                     delete_labels=[other for other in QUALITY_LABELS if other != label],
+                     attachments={'review': review} if review is not None else None)
+
+    def start(self):
+        """Start the worker thread once; safe to call on every request"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='orthanc-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                while self.flush() and not self._stop.is_set():
+                    pass
+            except Exception as e:
+                print(f"Orthanc write queue pass failed: {str(e)}")
+                traceback.print_exc()
+            self._wake.wait(self.poll_interval)
+
+    def flush(self):
+        """Apply one batch of due writes; returns how many were attempted"""
+        with self.db.connection() as conn:
+            batch = conn.execute('''
+                SELECT write_id, study_id, op, name, payload, attempts
+                FROM orthanc_writes w
+                WHERE status = 'pending' AND next_attempt <= :now
+                -- Never overtake an earlier write to the same study that is waiting to retry
+                AND NOT EXISTS (
+                    SELECT 1 FROM orthanc_writes e
+                    WHERE e.study_id = w.study_id AND e.status = 'pending'
+                    AND e.write_id < w.write_id AND e.next_attempt > :now
+                )
+                ORDER BY write_id
+                LIMIT :limit
+            ''', {'now': time.time(), 'limit': self.batch_size}).fetchall()
+        if not batch:
+            return 0
+
+        # Writes to one study stay in order; different studies go out concurrently
+        by_study = {}
+        for row in batch:
+            by_study.setdefault(row[1], []).append(row)
+        results = [result for study_results in self.client.map(self._apply_study, list(by_study.values()))
+                   for result in study_results]
+
+        done, retry, failed = [], [], []
+        for write_id, outcome, error, next_attempt in results:
+            if outcome == 'done':
+                done.append((write_id,))
+            elif outcome == 'failed':
+                failed.append((error, write_id))
+            else:
+                retry.append((next_attempt, 1 if outcome == 'retry' else 0, error, write_id))
+
+        with self.db.connection() as conn:
+            conn.executemany('DELETE FROM orthanc_writes WHERE write_id = ?', done)
+            conn.executemany('''
+                UPDATE orthanc_writes
+                SET next_attempt = ?, attempts = attempts + ?, last_error = ?
+                WHERE write_id = ?
+            ''', retry)
+            conn.executemany('''
+                UPDATE orthanc_writes
+                SET status = 'failed', attempts = attempts + 1, last_error = ?
+                WHERE write_id = ?
+            ''', failed)
+            conn.commit()
+
+        self.applied += len(done)
+        self.retries += sum(attempt for _, attempt, _, _ in retry)
+        if retry or failed:
+            print(f"Orthanc writes: {len(done)} applied, {len(retry)} to retry, {len(failed)} failed")
+        return len(batch)
+
+    def _apply_study(self, rows):
+        """
+        Apply one study's writes in order as (write_id, outcome, error, next_attempt).
+        After a transient failure the study's later writes wait for the same retry,
+        so they are never applied ahead of it.
+        """
+        results = []
+        for i, row in enumerate(rows):
+            write_id, study_id, op, name, payload, attempts = row
+            try:
+                if op == 'put_label':
+                    response = self.client.put(f"/studies/{study_id}/labels/{name}", data='')
+                elif op == 'delete_label':
+                    response = self.client.delete(f"/studies/{study_id}/labels/{name}")
+                    if response.status_code == 404:
+                        response = None  # Already absent
+                else:
+                    response = self.client.put(f"/studies/{study_id}/attachments/{name}", data=payload,
+                                               headers={'Content-Type': 'application/json'})
+                if response is not None:
+                    response.raise_for_status()
+                results.append((write_id, 'done', None, None))
+            except requests.RequestException as e:
+                status = e.response.status_code if getattr(e, 'response', None) is not None else None
+                if status is not None and 400 <= status < 500 and status != 429:
+                    results.append((write_id, 'failed', str(e), None))
+                    continue
+                next_attempt = time.time() + min(MAX_BACKOFF, 2 ** attempts)
+                results.append((write_id, 'retry', str(e), next_attempt))
+                results.extend((later[0], 'waiting', 'waiting on an earlier write', next_attempt)
+                               for later in rows[i + 1:])
+                break
+        self.client.invalidate(f"/studies/{rows[0][1]}")
+        return results
+
+    def get_stats(self):
+        with self.db.connection() as conn:
+            pending, failed, oldest = conn.execute('''
+                SELECT
+                    SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END),
+                    SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END),
+                    MIN(CASE WHEN status = 'pending' THEN created END)
+                FROM orthanc_writes
+            ''').fetchone()
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'pending': pending or 0,
+            'failed': failed or 0,
+            'oldest_pending': oldest,
+            'applied': self.applied,
+            'retries': self.retries
+        }
@@ -0,0 +1,155 @@
+# webapp/review_prefetcher.py
+import time
+import threading
+import traceback
+
+import review_queue
+
+
+class ReviewPrefetcher:
+    """
+    Background worker that keeps reviewers from opening cold studies.
+
+    Every interval (or sooner when woken, e.g. after a review is submitted) it
+    runs the incremental Orthanc sync, then walks each reviewer's active
+    projects in get_next_study order, starting after the study they touched
+    last. Their next `depth` unreviewed studies are downloaded in full, and the
+    first `build` of those also get a loaded handler. Studies are warmed one at
+    a time, round-robin across reviewers, so everyone's next study is ready
+    before anyone's second.
+
+    The app supplies warm_study(study_id, project_id, build), which returns
+    False on failure, and release_study(study_id), which drops a prebuilt
+    handler that is no longer anyone's next study.
+    """
+
+    def __init__(self, data_manager, db, warm_study, release_study,
+                 interval=300, depth=3, build=1):
+        self.data_manager = data_manager
+        self.db = db
+        self.warm_study = warm_study
+        self.release_study = release_study
+        self.interval = interval
+        self.depth = depth
+        self.build = build
+
+        self.built = set()
+        self.stats = {'cycles': 0, 'warmed': 0, 'failed': 0, 'last_sync': None, 'last_cycle_seconds': None}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker thread once; safe to call on every request"""
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='review-prefetch', daemon=True)
+                self._thread.start()
+                print(f"Review prefetcher started: sync every {self.interval:.0f}s, "
+                      f"{self.depth} studies ahead per reviewer")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        """Run the next cycle now instead of waiting for the interval"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Review prefetch cycle failed: {str(e)}")
+                traceback.print_exc()
+            self._wake.wait(self.interval)
+
+    def run_once(self):
+        """One sync-and-prefetch cycle"""
+        start = time.perf_counter()
+        try:
+            self.stats['last_sync'] = self.data_manager.sync_development_data()
+        except Exception as e:
+            # A failed sync still leaves the existing queue worth warming
+            print(f"Background Orthanc sync failed: {str(e)}")
+
+        queue = self.review_queue()
+        wanted_builds = {study_id for study_id, _, build in queue if build}
+        warmed = 0
+        for study_id, project_id, build in queue:
+            if self._stop.is_set():
+                return
+            try:
+                if self.warm_study(study_id, project_id, build):
+                    warmed += 1
+                    if build:
+                        self.built.add(study_id)
+                else:
+                    self.stats['failed'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"Error prefetching study {study_id}: {str(e)}")
+
+        # Reviewers have moved past these, so their handlers need not stay in memory
+        for study_id in self.built - wanted_builds:
+            self.release_study(study_id)
+        self.built &= wanted_builds
+
+        self.stats['cycles'] += 1
+        self.stats['warmed'] += warmed
+        self.stats['last_cycle_seconds'] = round(time.perf_counter() - start, 3)
+        print(f"Review prefetch: {len(queue)} queued studies ready in {self.stats['last_cycle_seconds']:.2f}s")
+
+    def review_queue(self):
+        """(study_id, project_id, build) for every reviewer's next studies, interleaved by rank"""
+        with self.db.connection() as conn:
+            assignments = conn.execute('''
+                SELECT up.user_id, up.project_id
+                FROM user_projects up
+                JOIN projects p ON p.project_id = up.project_id
+                WHERE p.status = 'active'
+                ORDER BY up.user_id, up.project_id
+            ''').fetchall()
+            queues = [(project_id, self.next_studies(conn, user_id, project_id))
+                      for user_id, project_id in assignments]
+
+        queue, seen = [], {}
+        for rank in range(self.depth):
+            for project_id, study_ids in queues:
+                if rank >= len(study_ids):
+                    continue
+                study_id = study_ids[rank]
+                build = rank < self.build
+                if study_id in seen:
+                    # Shared by several reviewers: warm once, building if any of them needs it
+                    if build and not queue[seen[study_id]][2]:
+                        queue[seen[study_id]] = (study_id, project_id, True)
+                    continue
+                seen[study_id] = len(queue)
+                queue.append((study_id, project_id, build))
+        return queue
+
+    def next_studies(self, conn, user_id, project_id):
+        """The reviewer's next unreviewed studies, in the order get_next_study hands them out"""
+        current = conn.execute('''
+            SELECT study_id FROM user_study_status
+            WHERE user_id = ? AND project_id = ?
+            ORDER BY last_modified DESC
+            LIMIT 1
+        ''', (user_id, project_id)).fetchone()
+        current = current[0] if current else ''
+        return review_queue.next_studies(conn, user_id, project_id, current, self.depth)
+
+    def get_stats(self):
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval': self.interval,
+            'depth': self.depth,
+            'built': len(self.built),
+            **self.stats
+        }
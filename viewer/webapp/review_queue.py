@@ -0,0 +1,90 @@
+# webapp/review_queue.py
+"""
+Per-reviewer queues of unreviewed studies.
+
+The review_queue table (migration 3) holds one row per assigned reviewer and
+unreviewed study, keyed by (user_id, project_id, sort_key). Triggers on
+studies, user_study_status and user_projects keep it current, so "the next K
+studies after X" is a single index seek instead of a join over the whole
+project. sort_key follows the project's queue_order:
+
+    study_id    Orthanc study ID (the original order)
+    study_date  oldest study first
+    priority    highest studies.priority first (e.g. 1 for studies with contours)
+
+Every key ends with the study ID, so keys are unique within a project.
+"""
+
+QUEUE_ORDERS = ('study_id', 'study_date', 'priority')
+
+# Next unreviewed studies by study_id for reviewers without a queue (not assigned to the project)
+NEXT_UNREVIEWED = '''
+    SELECT s.study_id
+    FROM studies s
+    LEFT JOIN user_study_status uss ON
+        s.study_id = uss.study_id
+        AND s.project_id = uss.project_id
+        AND uss.user_id = ?
+    WHERE s.project_id = ?
+    AND (uss.status IS NULL OR uss.status != 'reviewed')
+    AND s.study_id {op} ?
+    ORDER BY s.study_id
+    LIMIT ?
+'''
+
+NEXT_QUEUED = '''
+    SELECT study_id FROM review_queue
+    WHERE user_id = ? AND project_id = ? AND sort_key {op} ?
+    ORDER BY sort_key
+    LIMIT ?
+'''
+
+
+def sort_key_sql(study):
+    """SQL expression for the queue sort key of a studies row referred to as `study` (an alias, NEW or OLD)"""
+    return f'''(CASE (SELECT queue_order FROM projects WHERE project_id = {study}.project_id)
+        WHEN 'study_date' THEN COALESCE({study}.study_date, '') || '|' || {study}.study_id
+        WHEN 'priority' THEN printf('%09d', 999999999 - COALESCE({study}.priority, 0)) || '|' || {study}.study_id
+        ELSE {study}.study_id
+    END)'''
+
+
+def sort_key(conn, project_id, study_id):
+    """
+    Queue position of a study, reviewed or not. A study that has left the
+    project is placed by its ID, which is exact for study_id order.
+    """
+    row = conn.execute(f'''
+        SELECT {sort_key_sql('s')} FROM studies s WHERE s.study_id = ? AND s.project_id = ?
+    ''', (study_id, project_id)).fetchone()
+    return row[0] if row else study_id
+
+
+def next_studies(conn, user_id, project_id, after='', count=1):
+    """
+    The reviewer's next `count` unreviewed studies after study `after`,
+    wrapping around to the start of the queue
+    """
+    assigned = conn.execute('SELECT 1 FROM user_projects WHERE user_id = ? AND project_id = ?',
+                            (user_id, project_id)).fetchone()
+    if assigned:
+        query, key = NEXT_QUEUED, sort_key(conn, project_id, after) if after else ''
+    else:
+        query, key = NEXT_UNREVIEWED, after or ''
+
+    study_ids = [row[0] for row in conn.execute(query.format(op='>'), (user_id, project_id, key, count))]
+    if len(study_ids) < count and key:
+        study_ids += [row[0] for row in conn.execute(
+            query.format(op='<'), (user_id, project_id, key, count - len(study_ids)))]
+    return study_ids
+
+
+def rebuild(conn, project_id):
+    """Recompute a project's sort keys, e.g. after its queue_order changed"""
+    conn.execute(f'''
+        UPDATE review_queue SET sort_key = (
+            SELECT {sort_key_sql('s')} FROM studies s
+            WHERE s.study_id = review_queue.study_id AND s.project_id = review_queue.project_id
+        )
+        WHERE project_id = ?
+    ''', (project_id,))
@@ -0,0 +1,489 @@
+# webapp/study_downloader.py
+import os
+import time
+import uuid
+import hashlib
+import zipfile
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pydicom
+import requests
+
+from pydicom.pixels.decoders.base import get_decoder
+
+from config import (DOWNLOAD_WORKERS, DOWNLOAD_RETRIES, DOWNLOAD_BACKOFF, DOWNLOAD_TIMEOUT, CACHE_VERIFY,
+                    DOWNLOAD_TRANSFER_SYNTAX)
+from medai_common.streaming import download_to_file, stream_to_file, IncompleteDownloadError
+from study_manifest import StudyManifest
+from medai_common.orthanc_client import OrthancClient
+
+# Chunk size for streaming archives to and from disk
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# Lossless syntaxes Orthanc can transcode CT to, by the names DOWNLOAD_TRANSFER_SYNTAX accepts
+LOSSLESS_TRANSFER_SYNTAXES = {
+    'jpeg2000': '1.2.840.10008.1.2.4.90',
+    'jpegls': '1.2.840.10008.1.2.4.80',
+    'rle': '1.2.840.10008.1.2.5',
+}
+
+# Only pixel data compresses; other modalities are always fetched as stored
+TRANSCODED_MODALITIES = {'CT'}
+
+# Tags Orthanc hashes into its public instance ID
+INSTANCE_ID_TAGS = ['PatientID', 'StudyInstanceUID', 'SeriesInstanceUID', 'SOPInstanceUID']
+
+
+class DownloadStats:
+    """Thread-safe counters for one download run"""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.failed = 0
+        self.retries = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add_file(self, size=0):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+
+    def add_bytes(self, size):
+        with self._lock:
+            self.bytes += size
+
+    def add_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
+    def add_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return max(end - self.started, 1e-9)
+
+    @property
+    def mb_per_second(self):
+        return self.bytes / (1024 * 1024) / self.elapsed
+
+    @property
+    def files_per_second(self):
+        return self.files / self.elapsed
+
+    def as_dict(self):
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'retries': self.retries,
+            'elapsed': round(self.elapsed, 3),
+            'mb_per_second': round(self.mb_per_second, 2),
+            'files_per_second': round(self.files_per_second, 1)
+        }
+
+    def __str__(self):
+        return (f"{self.files} files, {self.bytes / (1024 * 1024):.1f} MB in {self.elapsed:.2f}s "
+                f"({self.mb_per_second:.2f} MB/s, {self.files_per_second:.1f} files/s, "
+                f"{self.skipped} skipped, {self.retries} retries, {self.failed} failed)")
+
+
+class StudyDownloader:
+    """Parallel, retrying downloader for Orthanc study instances"""
+
+    def __init__(self, orthanc_url, auth=None, max_workers=DOWNLOAD_WORKERS,
+                 max_retries=DOWNLOAD_RETRIES, backoff=DOWNLOAD_BACKOFF, timeout=DOWNLOAD_TIMEOUT, client=None):
+        self.orthanc_url = orthanc_url
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # Keep-alive connections are reused across instances and studies; the
+        # client's adapter retries refused connections and busy answers
+        self.client = client or OrthancClient(orthanc_url, auth=auth, timeout=timeout, retries=max_retries,
+                                              backoff=backoff, pool_size=max_workers)
+        self.session = self.client.session
+
+        # Per-study locks so two requests for the same study share one download
+        self._study_locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _get_study_lock(self, study_id):
+        with self._locks_lock:
+            return self._study_locks.setdefault(study_id, threading.Lock())
+
+    def _get_json(self, path):
+        return self.client.get_json(path)
+
+    def plan_study(self, study_id):
+        """Return (modality, series_id, instance_ids) for every series in a study"""
+        study_info = self._get_json(f"/studies/{study_id}")
+        series_list = study_info.get('Series', [])
+        if not series_list:
+            raise Exception("No series found in study")
+
+        plan = []
+        for series_id in series_list:
+            # Stable series come from the client's cache, so re-planning a study costs one request
+            series_info = self.client.get_series(series_id)
+            modality = series_info.get('MainDicomTags', {}).get('Modality', 'UNKNOWN')
+            plan.append((modality, series_id, series_info.get('Instances', [])))
+        return plan
+
+    def plan_ct_slices(self, study_id, plan=None):
+        """
+        Return (instance_id, series_id, z) for every CT instance, using the
+        ImagePositionPatient Orthanc keeps in each instance's main tags.
+        Returns None if any slice has no position, as slices cannot then be placed before download.
+        """
+        plan = plan or self.plan_study(study_id)
+        slices = []
+        for modality, series_id, _ in plan:
+            if modality != 'CT':
+                continue
+            for instance in self._get_json(f"/series/{series_id}/instances"):
+                position = instance.get('MainDicomTags', {}).get('ImagePositionPatient')
+                if not position:
+                    return None
+                slices.append((instance['ID'], series_id, float(position.split('\\')[2])))
+        return slices
+
+    def sync_study(self, study_id, target_dir, mode='instances', verify=CACHE_VERIFY, modalities=None,
+                   priority=None, on_instance=None, transfer_syntax=None, plan=None):
+        """
+        Bring the cached copy of a study in line with Orthanc.
+
+        The study's manifest is compared with the current instance list: instances
+        already on disk and verified are skipped, instances Orthanc no longer has
+        are removed, and only the rest are fetched, so an interrupted run resumes
+        and a new series (e.g. a fresh RTDOSE) costs one series download. In
+        'archive'/'media' mode missing whole series come as one ZIP; scattered
+        instances, or a failed archive, go through per-instance downloads.
+        verify is 'size' (default) or 'checksum' to re-hash cached files.
+
+        With modalities (e.g. ('CT', 'RTSTRUCT')) only those series are synced
+        and the manifest is left incomplete until a full sync runs. priority maps
+        instance IDs to a rank: ranked instances are fetched one by one, lowest
+        rank first, instead of as an archive. on_instance(instance_id, modality,
+        path) is called as each instance lands.
+
+        CT is requested in the study's transfer syntax: the one stored in its
+        manifest, or transfer_syntax / DOWNLOAD_TRANSFER_SYNTAX on first sync.
+        plan is a plan_study() result the caller already has.
+        """
+        target_dir = Path(target_dir)
+        with self._get_study_lock(study_id):
+            target_dir.mkdir(parents=True, exist_ok=True)
+            _remove_temp_files(target_dir)
+
+            plan = plan or self.plan_study(study_id)
+            if modalities:
+                plan = [entry for entry in plan if entry[0] in modalities]
+            series_of = {instance_id: (series_id, modality)
+                         for modality, series_id, instance_ids in plan for instance_id in instance_ids}
+            manifest = StudyManifest.load(target_dir, study_id)
+            if manifest.transfer_syntax is None:
+                manifest.transfer_syntax = resolve_transfer_syntax(
+                    transfer_syntax if transfer_syntax is not None else DOWNLOAD_TRANSFER_SYNTAX)
+            syntax = manifest.transfer_syntax or None
+            stats = DownloadStats()
+
+            stale = [instance_id for instance_id, record in manifest.instances.items()
+                     if instance_id not in series_of and (not modalities or record['modality'] in modalities)]
+            for instance_id in stale:
+                manifest.discard(instance_id)
+
+            deep = verify == 'checksum'
+            missing = [instance_id for instance_id in series_of if not manifest.verify(instance_id, deep=deep)]
+            if not missing and not stale and (manifest.complete or modalities):
+                stats.stop()
+                return stats
+
+            if priority:
+                missing.sort(key=lambda instance_id: priority.get(instance_id, len(priority)))
+            elif missing and mode in ('archive', 'media'):
+                series_ids = _whole_missing_series(plan, missing)
+                if series_ids is not None:
+                    try:
+                        # All series missing (a fresh study) is one whole-study archive
+                        whole_study = not modalities and len(series_ids) == len([p for p in plan if p[2]])
+                        has_images = any(modality in TRANSCODED_MODALITIES
+                                         for modality, series_id, _ in plan if series_id in series_ids)
+                        self.download_archive(study_id, target_dir, manifest, series_of, stats,
+                                              series_ids=None if whole_study else series_ids,
+                                              media=mode == 'media', on_instance=on_instance,
+                                              transfer_syntax=syntax if has_images else None)
+                    except Exception as e:
+                        print(f"Archive download failed for study {study_id}, "
+                              f"falling back to per-instance: {str(e)}")
+                    missing = [instance_id for instance_id in missing if not manifest.verify(instance_id)]
+
+            if missing:
+                jobs = [(instance_id, *series_of[instance_id]) for instance_id in missing]
+                self.download_instances(target_dir, jobs, manifest, stats, on_instance=on_instance,
+                                        transfer_syntax=syntax)
+
+            stats.stop()
+            manifest.save(complete=not stats.failed and not modalities)
+            if stats.failed:
+                raise Exception(f"{stats.failed} of {len(missing)} instances failed to download")
+            return stats
+
+    def download_study(self, study_id, target_dir):
+        """Download or top up a study one instance at a time"""
+        return self.sync_study(study_id, target_dir, mode='instances')
+
+    def download_study_archive(self, study_id, target_dir, media=False):
+        """Download or top up a study using Orthanc ZIP archives where possible"""
+        return self.sync_study(study_id, target_dir, mode='media' if media else 'archive')
+
+    def download_archive(self, study_id, target_dir, manifest, series_of, stats, series_ids=None, media=False,
+                         on_instance=None, transfer_syntax=None):
+        """
+        Download the study, or only the given series, as a single ZIP and unpack
+        it into the <modality>/<instance_id>.dcm layout, recording each entry.
+
+        With media=True the DICOMDIR flavour (/media, /tools/create-media) is
+        requested instead of the hierarchical /archive one; both are unpacked by
+        reading each entry's header, so the ZIP layout does not matter. With
+        transfer_syntax Orthanc transcodes the archive, keeping instances it
+        cannot transcode (e.g. RTSTRUCT) as stored.
+        """
+        archive_path = Path(target_dir) / f".{uuid.uuid4().hex}.zip.tmp"
+        try:
+            self._fetch_archive(study_id, series_ids, media, archive_path, stats, transfer_syntax)
+            self._unpack_archive(archive_path, target_dir, manifest, series_of, stats, on_instance)
+        finally:
+            if archive_path.exists():
+                archive_path.unlink()
+
+    def _fetch_archive(self, study_id, series_ids, media, archive_path, stats, transfer_syntax=None):
+        """Stream an Orthanc ZIP archive to disk in fixed-size chunks"""
+        if series_ids:
+            endpoint = 'create-media' if media else 'create-archive'
+            body = {'Resources': list(series_ids), 'Synchronous': True}
+            if transfer_syntax:
+                body['Transcode'] = transfer_syntax
+            size, _ = download_to_file(
+                self.session,
+                self.client.url(f"/tools/{endpoint}"),
+                archive_path,
+                chunk_size=ARCHIVE_CHUNK_SIZE,
+                method='POST',
+                json=body,
+                timeout=self.timeout
+            )
+        else:
+            endpoint = 'media' if media else 'archive'
+            size, _ = download_to_file(
+                self.session,
+                self.client.url(f"/studies/{study_id}/{endpoint}"),
+                archive_path,
+                chunk_size=ARCHIVE_CHUNK_SIZE,
+                params={'transcode': transfer_syntax} if transfer_syntax else None,
+                timeout=self.timeout
+            )
+        stats.add_bytes(size)
+
+    def _unpack_archive(self, archive_path, target_dir, manifest, series_of, stats, on_instance=None):
+        """Extract archive entries in parallel, routing each by its DICOM header"""
+        with zipfile.ZipFile(archive_path) as zf:
+            members = [m for m in zf.infolist() if not m.is_dir() and Path(m.filename).name != 'DICOMDIR']
+
+        # ZipFile handles are not safe to share between threads, so each worker opens its own
+        local = threading.local()
+        handles = []
+        handles_lock = threading.Lock()
+
+        def unpack(member):
+            if not hasattr(local, 'zf'):
+                local.zf = zipfile.ZipFile(archive_path)
+                with handles_lock:
+                    handles.append(local.zf)
+            result = _unpack_member(local.zf, member, target_dir)
+            if result is None:
+                stats.add_skipped()
+                return
+            instance_id, modality, size, md5 = result
+            series_id = series_of.get(instance_id, (None, None))[0]
+            manifest.record(instance_id, series_id, modality, size, md5)
+            stats.add_file()
+            if on_instance:
+                on_instance(instance_id, modality, Path(target_dir) / modality / f"{instance_id}.dcm")
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(executor.map(unpack, members))
+        finally:
+            for handle in handles:
+                handle.close()
+
+    def download_instances(self, target_dir, jobs, manifest, stats=None, on_instance=None, transfer_syntax=None):
+        """Download (instance_id, series_id, modality) jobs concurrently, recording each in the manifest"""
+        stats = stats or DownloadStats()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for instance_id, series_id, modality in jobs:
+                modality_dir = Path(target_dir) / modality
+                modality_dir.mkdir(parents=True, exist_ok=True)
+                # Jobs start in submission order, so callers control priority through the job order
+                file_path = modality_dir / f"{instance_id}.dcm"
+                syntax = transfer_syntax if modality in TRANSCODED_MODALITIES else None
+                future = executor.submit(self._download_instance, instance_id, file_path, stats, syntax)
+                futures[future] = (instance_id, series_id, modality, file_path)
+
+            for future in as_completed(futures):
+                instance_id, series_id, modality, file_path = futures[future]
+                try:
+                    size, md5 = future.result()
+                    manifest.record(instance_id, series_id, modality, size, md5)
+                    stats.add_file(size)
+                    if on_instance:
+                        on_instance(instance_id, modality, file_path)
+                except Exception as e:
+                    stats.add_failure()
+                    print(f"Error downloading instance {instance_id}: {str(e)}")
+        stats.stop()
+        return stats
+
+    def _download_instance(self, instance_id, file_path, stats, transfer_syntax=None):
+        """Fetch one instance with retry and backoff, returning (size, md5)"""
+        url = self.client.url(f"/instances/{instance_id}/file")
+        # Orthanc transcodes on the fly when the Accept header names a transfer syntax
+        headers = {'Accept': f"application/dicom; transfer-syntax={transfer_syntax}"} if transfer_syntax else None
+        for attempt in range(self.max_retries + 1):
+            try:
+                return download_to_file(self.session, url, file_path, checksum='md5',
+                                        headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout, IncompleteDownloadError):
+                # Error statuses were already retried by the client; this covers transfers cut off mid-body
+                if attempt == self.max_retries:
+                    raise
+                stats.add_retry()
+                time.sleep(self.backoff * (2 ** attempt))
+
+
+def orthanc_instance_id(ds):
+    """Compute Orthanc's public ID for an instance from its DICOM identifiers"""
+    key = '|'.join(str(ds.get(tag, '')).strip() for tag in INSTANCE_ID_TAGS)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return '-'.join(digest[i:i + 8] for i in range(0, 40, 8))
+
+
+def resolve_transfer_syntax(name):
+    """
+    Map a DOWNLOAD_TRANSFER_SYNTAX value to a UID, or '' to keep Orthanc's stored syntax.
+    Falls back to '' when pydicom has no decoder installed for the syntax.
+    """
+    if not name or name.lower() in ('none', 'native'):
+        return ''
+    uid = LOSSLESS_TRANSFER_SYNTAXES.get(name.lower(), name)
+    try:
+        decoder = get_decoder(uid)
+    except Exception:
+        print(f"Unsupported transfer syntax {name}, downloading as stored")
+        return ''
+    if not decoder.is_available:
+        print(f"No decoder for transfer syntax {name} ({', '.join(decoder.missing_dependencies)}), "
+              f"downloading as stored")
+        return ''
+    return uid
+
+
+def contour_z_range(rt_files, roi_labels):
+    """(min z, max z) of the contours of the given ROIs across RTSTRUCT files, or None"""
+    roi_labels = {label.lower() for label in roi_labels or []}
+    z_values = []
+    for rt_file in rt_files:
+        rt_struct = pydicom.dcmread(str(rt_file))
+        numbers = {roi.ROINumber for roi in getattr(rt_struct, 'StructureSetROISequence', [])
+                   if not roi_labels or 'all' in roi_labels or str(roi.ROIName).lower() in roi_labels}
+        for roi_contour in getattr(rt_struct, 'ROIContourSequence', []):
+            if roi_contour.ReferencedROINumber not in numbers:
+                continue
+            for contour in getattr(roi_contour, 'ContourSequence', []):
+                if hasattr(contour, 'ContourData'):
+                    z_values.append(float(contour.ContourData[2]))
+    return (min(z_values), max(z_values)) if z_values else None
+
+
+def contour_priority(ct_slices, z_range, lead_slices=3):
+    """
+    Rank CT instances for download: the contoured z-range first, starting a few
+    slices below it where review opens, then outwards by distance from the range
+    """
+    positions = sorted(z for _, _, z in ct_slices)
+    spacing = min((b - a for a, b in zip(positions, positions[1:]) if b > a), default=0)
+    z_min, z_max = z_range[0] - lead_slices * spacing, z_range[1]
+
+    def key(item):
+        z = item[2]
+        return (max(z_min - z, z - z_max, 0), abs(z - z_min))
+
+    return {instance_id: rank for rank, (instance_id, _, _) in enumerate(sorted(ct_slices, key=key))}
+
+
+def _whole_missing_series(plan, missing):
+    """Series IDs covering exactly the missing instances, or None if any series is only partly missing"""
+    missing = set(missing)
+    series_ids = []
+    covered = 0
+    for _, series_id, instance_ids in plan:
+        if instance_ids and missing.issuperset(instance_ids):
+            series_ids.append(series_id)
+            covered += len(instance_ids)
+    return series_ids if covered == len(missing) else None
+
+
+def _remove_temp_files(target_dir):
+    """Delete temporary files left behind by a run that was killed mid-write"""
+    for temp_path in Path(target_dir).rglob('.*.tmp'):
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
+
+
+def _unpack_member(zf, member, target_dir):
+    """
+    Extract one ZIP entry to <target_dir>/<modality>/<instance_id>.dcm,
+    returning (instance_id, modality, size, md5) or None for non-DICOM entries
+    """
+    temp_path = Path(target_dir) / f".{uuid.uuid4().hex}.tmp"
+    try:
+        with zf.open(member) as src:
+            size, md5 = stream_to_file(iter(lambda: src.read(ARCHIVE_CHUNK_SIZE), b''), temp_path, checksum='md5')
+
+        try:
+            ds = pydicom.dcmread(str(temp_path), stop_before_pixels=True,
+                                 specific_tags=['Modality'] + INSTANCE_ID_TAGS)
+        except Exception:
+            print(f"Skipping non-DICOM archive entry: {member.filename}")
+            return None
+
+        modality = str(ds.get('Modality', 'UNKNOWN') or 'UNKNOWN')
+        instance_id = orthanc_instance_id(ds)
+        modality_dir = Path(target_dir) / modality
+        modality_dir.mkdir(exist_ok=True)
+        os.replace(temp_path, modality_dir / f"{instance_id}.dcm")
+        return instance_id, modality, size, md5
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
@@ -0,0 +1,175 @@
+# webapp/study_manifest.py
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+from medai_common.streaming import stream_to_file, CHUNK_SIZE
+
+MANIFEST_FILE = 'manifest.json'
+JOURNAL_FILE = 'manifest.journal'
+
+
+class StudyManifest:
+    """
+    Record of the Orthanc instances cached for one study.
+
+    manifest.json holds a snapshot (instance ID -> series, modality, path, size,
+    md5) and is only ever replaced atomically. Instances that arrive between
+    snapshots are appended to manifest.journal one JSON line at a time, so a
+    crash mid-download loses at most the line being written and the next sync
+    resumes from everything that was recorded.
+    """
+
+    def __init__(self, study_dir, study_id=None):
+        self.study_dir = Path(study_dir)
+        self.study_id = study_id
+        self.complete = False
+        self.revision = 0
+        self.transfer_syntax = None  # Per-study CT transfer syntax ('' = as stored); None until first sync
+        self.instances = {}
+        self._journal = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, study_dir, study_id=None):
+        """Load the snapshot and replay any journal left by an unfinished sync"""
+        manifest = cls(study_dir, study_id)
+
+        snapshot_path = manifest.study_dir / MANIFEST_FILE
+        if snapshot_path.exists():
+            try:
+                data = json.loads(snapshot_path.read_text())
+            except ValueError:
+                print(f"Ignoring corrupt manifest in {manifest.study_dir}")
+                data = {}
+            manifest.study_id = data.get('study_id', study_id)
+            manifest.complete = data.get('complete', False)
+            manifest.revision = data.get('revision', 0)
+            manifest.transfer_syntax = data.get('transfer_syntax')
+            manifest.instances = data.get('instances', {})
+
+        journal_path = manifest.study_dir / JOURNAL_FILE
+        if journal_path.exists():
+            # A journal only survives when a sync did not finish
+            manifest.complete = False
+            manifest._dirty = True
+            with open(journal_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Torn last line from a crash
+                    if entry.get('removed'):
+                        manifest.instances.pop(entry['id'], None)
+                    else:
+                        manifest.instances[entry['id']] = entry['record']
+
+        return manifest
+
+    @staticmethod
+    def is_complete(study_dir):
+        """Cheap check used on hot paths: a finished snapshot and no pending journal"""
+        study_dir = Path(study_dir)
+        if (study_dir / JOURNAL_FILE).exists():
+            return False
+        try:
+            return json.loads((study_dir / MANIFEST_FILE).read_text()).get('complete', False)
+        except (OSError, ValueError):
+            return False
+
+    @staticmethod
+    def mark_stale(study_dir):
+        """Make a complete study compare itself with Orthanc again on its next open"""
+        if StudyManifest.is_complete(study_dir):
+            manifest = StudyManifest.load(study_dir)
+            manifest.save(complete=False)
+
+    @property
+    def total_bytes(self):
+        return sum(record['size'] for record in self.instances.values())
+
+    def path_for(self, instance_id):
+        return self.study_dir / self.instances[instance_id]['path']
+
+    def record(self, instance_id, series_id, modality, size, md5):
+        """Record a downloaded instance and journal it immediately"""
+        record = {
+            'series_id': series_id,
+            'modality': modality,
+            'path': f"{modality}/{instance_id}.dcm",
+            'size': size,
+            'md5': md5
+        }
+        with self._lock:
+            self.instances[instance_id] = record
+            self._append({'id': instance_id, 'record': record})
+
+    def discard(self, instance_id):
+        """Forget an instance that no longer exists in Orthanc and delete its file"""
+        with self._lock:
+            record = self.instances.pop(instance_id, None)
+            if record is None:
+                return
+            file_path = self.study_dir / record['path']
+            if file_path.exists():
+                file_path.unlink()
+            self._append({'id': instance_id, 'removed': True})
+
+    def verify(self, instance_id, deep=False):
+        """Check a recorded instance is on disk with the right size (and md5 when deep)"""
+        record = self.instances.get(instance_id)
+        if record is None:
+            return False
+        file_path = self.study_dir / record['path']
+        try:
+            if file_path.stat().st_size != record['size']:
+                return False
+        except OSError:
+            return False
+        if deep and record.get('md5'):
+            return file_md5(file_path) == record['md5']
+        return True
+
+    def save(self, complete):
+        """Write a new snapshot atomically and drop the journal it supersedes"""
+        with self._lock:
+            if self._dirty:
+                self.revision += 1
+            self.complete = complete
+            data = {
+                'study_id': self.study_id,
+                'complete': complete,
+                'revision': self.revision,
+                'transfer_syntax': self.transfer_syntax,
+                'total_bytes': self.total_bytes,
+                'instances': self.instances
+            }
+            self.study_dir.mkdir(parents=True, exist_ok=True)
+            stream_to_file([json.dumps(data).encode('utf-8')], self.study_dir / MANIFEST_FILE)
+
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            journal_path = self.study_dir / JOURNAL_FILE
+            if journal_path.exists():
+                journal_path.unlink()
+            self._dirty = False
+
+    def _append(self, entry):
+        if self._journal is None:
+            self.study_dir.mkdir(parents=True, exist_ok=True)
+            self._journal = open(self.study_dir / JOURNAL_FILE, 'a')
+        self._journal.write(json.dumps(entry) + '\n')
+        self._journal.flush()
+        self._dirty = True
+
+
+def file_md5(file_path):
+    """MD5 of a file, read in bounded chunks"""
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,107 @@
+# webapp/test_database.py
+"""
+Checks that database.Database reuses connections across request threads.
+
+Werkzeug's threaded server runs every request on a new thread, so each check
+runs one short-lived thread per simulated request and expects the pool to
+hand the same connections out again.
+
+Usage (from viewer/webapp or viewer):
+    python -m pytest test_database.py
+    python test_database.py
+"""
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent))
+os.environ.setdefault('ENVIRONMENT', 'local')
+
+from database import Database
+
+
+def request_thread(db, work):
+    """Run `work(conn)` on a checkout from a new thread, like one Werkzeug request"""
+    errors = []
+
+    def handle():
+        try:
+            with db.connection() as conn:
+                work(conn)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=handle)
+    thread.start()
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def test_sequential_request_threads_reuse_one_connection(tmp_path):
+    db = Database(str(tmp_path / 'reviews.db'))
+    request_thread(db, lambda conn: conn.execute('CREATE TABLE reviews (id INTEGER PRIMARY KEY, rating INTEGER)'))
+    for i in range(20):
+        request_thread(db, lambda conn: conn.execute('INSERT INTO reviews (rating) VALUES (?)', (i % 5,)))
+    stats = db.get_stats()
+    assert stats['checkouts'] == 21
+    assert stats['opened'] == 1
+    counts = []
+    request_thread(db, lambda conn: counts.append(conn.execute('SELECT COUNT(*) FROM reviews').fetchone()[0]))
+    assert counts == [20]
+    db.close()
+
+
+def test_concurrent_request_threads_are_bounded(tmp_path):
+    db = Database(str(tmp_path / 'reviews.db'), pool_size=2)
+    request_thread(db, lambda conn: conn.execute('CREATE TABLE reviews (id INTEGER PRIMARY KEY)'))
+    barrier = threading.Barrier(4)
+
+    def hold(conn):
+        conn.execute('SELECT 1')
+        barrier.wait(timeout=5)
+
+    threads = [threading.Thread(target=request_thread, args=(db, hold)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = db.get_stats()
+    # Four at once needs four connections; only pool_size of them are kept afterwards
+    assert stats['opened'] == 4
+    assert stats['idle'] == 2 and stats['closed'] == 2
+
+    for _ in range(10):
+        request_thread(db, lambda conn: conn.execute('SELECT COUNT(*) FROM reviews'))
+    assert db.get_stats()['opened'] == 4
+    db.close()
+
+
+def test_failed_request_rolls_back(tmp_path):
+    db = Database(str(tmp_path / 'reviews.db'))
+    request_thread(db, lambda conn: conn.execute('CREATE TABLE reviews (id INTEGER PRIMARY KEY)'))
+
+    def fail(conn):
+        conn.execute('INSERT INTO reviews DEFAULT VALUES')
+        raise RuntimeError('request failed')
+
+    try:
+        request_thread(db, fail)
+    except RuntimeError:
+        pass
+    counts = []
+    request_thread(db, lambda conn: counts.append(conn.execute('SELECT COUNT(*) FROM reviews').fetchone()[0]))
+    assert counts == [0]
+    assert db.get_stats()['opened'] == 1
+    db.close()
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            with tempfile.TemporaryDirectory() as work_dir:
+                test(Path(work_dir))
+            print(f"{name} ok")
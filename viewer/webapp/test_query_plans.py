@@ -0,0 +1,100 @@
+# webapp/test_query_plans.py
+"""
+Checks that the review database's hot queries are served by indexes.
+
+Runs EXPLAIN QUERY PLAN on every query in migrations.HOT_QUERIES against a
+freshly migrated database, and again after filling it and running ANALYZE, and
+fails on any plan line that scans a whole table.
+
+Usage (from viewer/webapp):
+    python -m pytest test_query_plans.py
+    python test_query_plans.py
+or from viewer:
+    python -m pytest webapp
+"""
+import os
+import sys
+import shutil
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent))
+os.environ.setdefault('ENVIRONMENT', 'local')
+
+from database import Database
+from data_manager import OrthancDataManager
+from migrations import migrate, full_scans, query_plan, HOT_QUERIES, SCHEMA_VERSION
+
+
+def create_database(work_dir):
+    manager = OrthancDataManager.__new__(OrthancDataManager)
+    manager.db = Database(os.path.join(work_dir, 'reviews.db'))
+    manager._create_schema()
+    return manager.db
+
+
+def fill(conn, projects=5, studies=2000, users=4):
+    conn.executemany("INSERT OR IGNORE INTO projects (project_id, name) VALUES (?, ?)",
+                     [(f"p{p}", f"Project {p}") for p in range(projects)])
+    conn.executemany('INSERT INTO studies (study_id, project_id, study_date) VALUES (?, ?, ?)',
+                     [(f"s{i:06d}", f"p{i % projects}", f"2024{i % 12 + 1:02d}01") for i in range(studies)])
+    conn.executemany("INSERT INTO user_study_status (user_id, study_id, project_id, status) VALUES (?, ?, ?, 'reviewed')",
+                     [(i % users + 1, f"s{i:06d}", f"p{i % projects}") for i in range(0, studies, 3)])
+    conn.executemany('INSERT INTO reviews (study_id, project_id, user_id, quality_rating) VALUES (?, ?, ?, ?)',
+                     [(f"s{i:06d}", f"p{i % projects}", i % users + 1, i % 5 + 1) for i in range(0, studies, 3)])
+    conn.executemany('INSERT OR IGNORE INTO user_projects (user_id, project_id) VALUES (?, ?)',
+                     [(u + 1, f"p{p}") for u in range(users) for p in range(projects)])
+    conn.execute('ANALYZE')
+
+
+def test_migrations_are_recorded():
+    work_dir = tempfile.mkdtemp(prefix='test_query_plans_')
+    try:
+        db = create_database(work_dir)
+        with db.connection() as conn:
+            assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+            assert migrate(conn) == []
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def test_hot_queries_use_indexes():
+    work_dir = tempfile.mkdtemp(prefix='test_query_plans_')
+    try:
+        db = create_database(work_dir)
+        with db.connection() as conn:
+            assert full_scans(conn) == {}
+            fill(conn)
+            scans = full_scans(conn)
+            assert scans == {}, '\n'.join(f"{name}: {lines}" for name, lines in scans.items())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def test_scans_are_detected():
+    work_dir = tempfile.mkdtemp(prefix='test_query_plans_')
+    try:
+        db = create_database(work_dir)
+        with db.connection() as conn:
+            conn.execute('DROP INDEX idx_studies_project')
+            conn.execute('DROP INDEX idx_studies_project_date')
+            scans = full_scans(conn)
+            assert 'get_project_stats' in scans and 'search_studies' in scans
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    work_dir = tempfile.mkdtemp(prefix='test_query_plans_')
+    try:
+        with create_database(work_dir).connection() as conn:
+            fill(conn)
+            for name, (sql, params) in HOT_QUERIES.items():
+                print(f"{name}:")
+                for line in query_plan(conn, sql, params):
+                    print(f"    {line}")
+            scans = full_scans(conn)
+            print(f"\n{len(scans)} of {len(HOT_QUERIES)} hot queries scan a table")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)